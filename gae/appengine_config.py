@@ -28,3 +28,8 @@ root_path = os.path.dirname(os.path.abspath(__file__))
 lib_path = os.path.join(root_path, 'lib')
 if os.path.isdir(lib_path):
     vendor.add(lib_path)
+
+if os.environ.get('PHOENIX_PROFILE_IMPORTS'):
+    # records imports of the app, see `startup.profiler`
+    import startup
+    startup.profiler.install()
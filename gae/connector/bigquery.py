@@ -25,47 +25,240 @@
 system"""
 
 
+import os
+import json
 import time
+import random
 
-import googleapiclient.discovery as disco
 from googleapiclient.errors import HttpError
+from startup import LazyModule
+
+
+# loaded when the first client is built
+disco = LazyModule('googleapiclient.discovery')
+
+
+# copy of discovery document of BigQuery v2 so that building a client
+# doesn't fetch it on each cold start
+DISCOVERY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'discovery', 'bigquery.v2.json')
+_discovery_document = None
+
+
+def discovery_document():
+    """Reads the bundled discovery document of BigQuery, once per process.
+
+    :rtype: dict
+    :returns: discovery document.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        with open(DISCOVERY_PATH) as f:
+            _discovery_document = json.load(f)
+    return _discovery_document
+
+
+def _get_job_request(con, reference):
+    """Builds request to retrieve job resource.
+
+    :type con: `googleapiclient.discovery.Resource`
+    :param con: BigQuery resource.
+
+    :type reference: dict
+    :param reference: job reference with `projectId`, `jobId` and optionally
+                      `location`.
+
+    :rtype: `googleapiclient.http.HttpRequest`
+    :returns: request for `jobs().get`.
+    """
+    kwargs = {'projectId': reference['projectId'],
+              'jobId': reference['jobId']}
+    if reference.get('location'):
+        kwargs['location'] = reference['location']
+    return con.jobs().get(**kwargs)
+
+
+def job_statistics(job):
+    """Summarizes the statistics of a finished query job.
+
+    :type job: dict
+    :param job: job resource.
+
+    :rtype: dict
+    :returns: `elapsed_ms` between start and end of job, `queued_ms` between
+              its creation and start, `slot_ms` consumed, `shuffle_bytes`
+              written by all stages of query plan, bytes processed and
+              billed, whether results came from cache and `creation_time`,
+              `start_time` and `end_time` in milliseconds since epoch.
+    """
+    statistics = job.get('statistics', {})
+    query = statistics.get('query', {})
+    created, start, end = [int(statistics[key]) if statistics.get(key) else
+        None for key in ('creationTime', 'startTime', 'endTime')]
+    return {'elapsed_ms': end - start if start and end else None,
+            'queued_ms': start - created if created and start else None,
+            'slot_ms': int(query.get('totalSlotMs', 0)),
+            'shuffle_bytes': sum(int(stage.get('shuffleOutputBytes', 0)) for
+                stage in query.get('queryPlan', [])),
+            'bytes_processed': int(query.get('totalBytesProcessed',
+                statistics.get('totalBytesProcessed', 0))),
+            'bytes_billed': int(query.get('totalBytesBilled', 0)),
+            'cache_hit': query.get('cacheHit', False),
+            'creation_time': created,
+            'start_time': start,
+            'end_time': end}
 
 
 class BigQueryService(object):
     """Class to interact with BigQuery's backend using googleapiclient api.
     :type credentials: `google.auth.credentials.Credentials`
     :param credentials: certificates to connect to GCP.
+
+    :type con: `googleapiclient.discovery.Resource`
+    :param con: resource to use instead of building one, such as a
+                `connector.local.LocalBigQuery`.
     """
-    def __init__(self, credentials):
-        self.con = disco.build('bigquery', 'v2', credentials=credentials)
+    def __init__(self, credentials, con=None):
+        self.con = (con if con is not None else
+            disco.build_from_document(discovery_document(),
+                credentials=credentials))
 
-    def execute_job(self, project_id, body):
-        """Executes a job to run in GCP.
+    def execute_job(self, project_id, body, max_attempts=10):
+        """Executes a job to run in GCP. If a job with the same id already
+        exists and is running or succeeded, it's returned instead of
+        submitting a new one. Failed jobs are submitted again under the same
+        id with an attempt suffix, so retries of a task don't keep reading
+        the same failed job.
     
         :type project_id: str
         :param projectId: name of project Id to run the job.
     
         :type body: dict
         :param body: dict that specifies the job configuration
+
+        :type max_attempts: int
+        :param max_attempts: how many ids are tried before giving up.
+
+        :raises ValueError: if ``max_attempts`` is smaller than 1.
+        :raises RuntimeError: if jobs of every attempt already failed.
+
+        :rtype: dict
+        :returns: job resource.
         """
-        return self.con.jobs().insert(projectId=project_id,
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1, got {}".format(
+                max_attempts))
+        job_id = body.get('jobReference', {}).get('jobId')
+        for attempt in range(max_attempts):
+            if attempt:
+                body = dict(body.items() + [('jobReference', dict(
+                    body['jobReference'].items() + [('jobId',
+                    '{}_a{}'.format(job_id, attempt))]))])
+            try:
+                return self.con.jobs().insert(projectId=project_id,
+                    body=body).execute(num_retries=3)
+            except HttpError as err:
+                if err.resp.status != 409 or job_id is None:
+                    raise
+            job = _get_job_request(self.con, dict([('projectId',
+                project_id)] + body['jobReference'].items())).execute(
+                num_retries=3)
+            if 'errorResult' not in job.get('status', {}):
+                return job
+        raise RuntimeError(job['status']['errorResult'])
+
+    def get_job(self, reference):
+        """Retrieves the current state of a job.
+
+        :type reference: dict
+        :param reference: job reference with `projectId`, `jobId` and
+                          optionally `location`.
+
+        :rtype: dict
+        :returns: job resource.
+        """
+        return _get_job_request(self.con, reference).execute(num_retries=3)
+
+    def dry_run(self, project_id, body):
+        """Validates a job without running it, so no bytes are billed.
+
+        :type project_id: str
+        :param project_id: name of project Id to run the job.
+
+        :type body: dict
+        :param body: dict that specifies the job configuration.
+
+        :rtype: int
+        :returns: how many bytes the job would process.
+        """
+        body = dict(body.items() + [('configuration', dict(
+            body['configuration'].items() + [('dryRun', True)]))])
+        body.pop('jobReference', None)
+        result = self.con.jobs().insert(projectId=project_id,
             body=body).execute(num_retries=3)
+        return int(result['statistics']['totalBytesProcessed'])
 
     def poll_job(self, job):
         """Waits for a job to complete.
         :type job: `googleapi.discovery.Resource`
         :param job: any job that has been initiated by the connector.
+
+        :raises RuntimeError: if job finished with errors.
+
+        :rtype: dict
+        :returns: statistics of finished job, see `job_statistics`.
         """
-        request = self.con.jobs().get(
-            projectId=job['jobReference']['projectId'],
-            jobId=job['jobReference']['jobId'])
-        while True:
-            result = request.execute(num_retries=3)
-            if result['status']['state'] == 'DONE':
-                if 'errorResult' in result['status']:
-                    raise RuntimeError(result['status']['errorResult'])
-                return
-            time.sleep(1)
+        for result in self.poll_jobs([job]):
+            if 'errorResult' in result['status']:
+                raise RuntimeError(result['status']['errorResult'])
+            return job_statistics(result)
+
+    def poll_jobs(self, jobs, expected_runtime=None):
+        """Waits for several jobs at once, see `JobPoller.wait`.
+
+        :type jobs: list
+        :param jobs: jobs that have been initiated by the connector.
+
+        :type expected_runtime: float
+        :param expected_runtime: how many seconds jobs are expected to run,
+                                 used to cap the interval between polls.
+
+        :rtype: generator
+        :returns: final job resources, yielded as soon as each job is done.
+        """
+        return JobPoller(self.con).wait(jobs, expected_runtime)
+
+    def create_table(self, project_id, dataset_id, table_id, schema):
+        """Creates table in BQ if it doesn't exist yet.
+
+        :type project_id: str
+        :param project_id: project where table is located.
+
+        :type dataset_id: str
+        :param dataset_id: dataset where table is located.
+
+        :type table_id: str
+        :param table_id: table name to create.
+
+        :type schema: list
+        :param schema: fields of table, as in `schema.fields` of BigQuery
+                       table resource.
+
+        :rtype: bool
+        :returns: True if table was created, False if it already existed.
+        """
+        try:
+            self.con.tables().insert(projectId=project_id,
+                datasetId=dataset_id, body={
+                    'tableReference': {'projectId': project_id,
+                                       'datasetId': dataset_id,
+                                       'tableId': table_id},
+                    'schema': {'fields': schema}}).execute(num_retries=3)
+        except HttpError as err:
+            if err.resp.status != 409:
+                raise
+            return False
+        return True
 
     def delete_table(self, project_id, dataset_id, table_id):
         """Deletes table in BQ.
@@ -86,3 +279,204 @@ class BigQueryService(object):
             return
         self.con.tables().delete(projectId=project_id, datasetId=dataset_id,
             tableId=table_id).execute(num_retries=3)
+
+    def list_tables(self, project_id, dataset_id):
+        """Lists every table in a dataset, following all result pages.
+
+        :type project_id: str
+        :param project_id: project where dataset is located.
+
+        :type dataset_id: str
+        :param dataset_id: dataset to list tables from.
+
+        :rtype: generator
+        :returns: table ids in dataset.
+        """
+        resource = self.con.tables()
+        request = resource.list(projectId=project_id, datasetId=dataset_id,
+            maxResults=1000)
+        while request is not None:
+            response = request.execute(num_retries=3)
+            for table in response.get('tables', []):
+                yield table['tableReference']['tableId']
+            request = resource.list_next(request, response)
+
+    def list_rows(self, project_id, dataset_id, table_id, page_size=10000):
+        """Reads every row of a table, following all result pages.
+
+        :type project_id: str
+        :param project_id: project where table is located.
+
+        :type dataset_id: str
+        :param dataset_id: dataset where table is located.
+
+        :type table_id: str
+        :param table_id: table to read rows from.
+
+        :type page_size: int
+        :param page_size: maximum rows in each response.
+
+        :rtype: generator
+        :returns: rows in the format of `tabledata().list`, such as
+                  ``{'f': [{'v': value}]}``.
+        """
+        resource = self.con.tabledata()
+        request = resource.list(projectId=project_id, datasetId=dataset_id,
+            tableId=table_id, maxResults=page_size)
+        while request is not None:
+            response = request.execute(num_retries=3)
+            for row in response.get('rows', []):
+                yield row
+            request = resource.list_next(request, response)
+
+    def delete_tables(self, project_id, dataset_id, table_ids,
+                      batch_size=50):
+        """Deletes several tables in BQ using batched requests. Tables that
+        do not exist are ignored.
+
+        :type project_id: str
+        :param project_id: project where tables are located.
+
+        :type dataset_id: str
+        :param dataset_id: dataset where tables are located.
+
+        :type table_ids: list
+        :param table_ids: table names to delete.
+
+        :type batch_size: int
+        :param batch_size: maximum number of deletions sent in a single
+                           batch.
+
+        :raises HttpError: if any deletion fails for a reason other than
+                           table not being found.
+        """
+        def callback(request_id, response, exception):
+            if exception is not None and not (isinstance(exception,
+                HttpError) and exception.resp.status == 404):
+                raise exception
+
+        for i in range(0, len(table_ids), batch_size):
+            batch = self.con.new_batch_http_request(callback=callback)
+            for table_id in table_ids[i: i + batch_size]:
+                batch.add(self.con.tables().delete(projectId=project_id,
+                    datasetId=dataset_id, tableId=table_id))
+            batch.execute()
+
+
+class JobPoller(object):
+    """Waits on many BigQuery jobs with a single poll loop.
+
+    Jobs still running are checked with one batched `jobs().get` call per
+    round and the interval between rounds grows exponentially, with jitter,
+    so long queries cost few API calls.
+
+    :type con: `googleapiclient.discovery.Resource`
+    :param con: BigQuery resource used to query jobs status.
+
+    :type initial_delay: float
+    :param initial_delay: seconds to wait after first poll.
+
+    :type max_delay: float
+    :param max_delay: maximum seconds to wait between two polls.
+
+    :type multiplier: float
+    :param multiplier: factor applied to delay after each poll.
+
+    :type jitter: float
+    :param jitter: fraction, between 0 and 1, of the delay that is randomly
+                   discounted so that concurrent pollers do not synchronize.
+
+    :type batch_size: int
+    :param batch_size: maximum number of requests sent in a single batch.
+    """
+    def __init__(self, con, initial_delay=1, max_delay=30, multiplier=2,
+                 jitter=0.5, batch_size=50):
+        self.con = con
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.batch_size = batch_size
+
+    def wait(self, jobs, expected_runtime=None):
+        """Polls ``jobs`` until all of them are done.
+
+        :type jobs: list
+        :param jobs: jobs resources, each with a `jobReference` key.
+
+        :type expected_runtime: float
+        :param expected_runtime: if set, the interval between polls never
+                                 exceeds this value in seconds.
+
+        :rtype: generator
+        :returns: job resource of each job as soon as it reaches `DONE`
+                  state. Errors are not raised, they are available in
+                  `status.errorResult` and statistics in `statistics`.
+        """
+        pending = dict(((job['jobReference']['projectId'],
+            job['jobReference']['jobId']), job['jobReference'])
+            for job in jobs)
+        attempt = 0
+        while pending:
+            for key, result in self._fetch(pending):
+                if result['status']['state'] == 'DONE':
+                    del pending[key]
+                    yield result
+            if pending:
+                time.sleep(self.delay(attempt, expected_runtime))
+                attempt += 1
+
+    def delay(self, attempt, expected_runtime=None):
+        """Computes how long to wait before next poll.
+
+        :type attempt: int
+        :param attempt: how many polls happened so far without all jobs
+                        being done.
+
+        :type expected_runtime: float
+        :param expected_runtime: caps the delay if set.
+
+        :rtype: float
+        :returns: seconds to sleep.
+        """
+        cap = self.max_delay
+        if expected_runtime:
+            cap = min(cap, max(expected_runtime, self.initial_delay))
+        delay = min(cap, self.initial_delay * self.multiplier ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    def _fetch(self, pending):
+        """Retrieves current resource of each pending job.
+
+        :type pending: dict
+        :param pending: maps (projectId, jobId) to the job reference.
+
+        :rtype: list
+        :returns: list of tuples (key, job resource). Jobs whose request
+                  failed with a server or rate limit error are left out
+                  so they are polled again in next round.
+        """
+        if len(pending) == 1:
+            key, reference = pending.items()[0]
+            return [(key, _get_job_request(self.con, reference).execute(
+                num_retries=3))]
+
+        results = []
+        keys = dict((str(i), key) for i, key in enumerate(pending))
+        def callback(request_id, response, exception):
+            if exception is not None:
+                if (isinstance(exception, HttpError) and
+                    (exception.resp.status == 429 or
+                     exception.resp.status >= 500)):
+                    return
+                raise exception
+            results.append((keys[request_id], response))
+
+        ids = sorted(keys, key=int)
+        for i in range(0, len(ids), self.batch_size):
+            batch = self.con.new_batch_http_request(callback=callback)
+            for request_id in ids[i: i + self.batch_size]:
+                batch.add(_get_job_request(self.con,
+                    pending[keys[request_id]]), request_id=request_id)
+            batch.execute()
+        return results
@@ -24,41 +24,79 @@
 """Main class with connectors to different services available in GCP."""
 
 
+import os
 import time
+import threading
 
-import google.auth.credentials
-import googleapiclient.discovery as disco
-from google.auth import app_engine
-from . import BigQueryService
+from startup import LazyModule
+from .bigquery import BigQueryService
+
+
+# auth libraries are loaded when the first service is built
+google_credentials = LazyModule('google.auth.credentials')
+app_engine = LazyModule('google.auth.app_engine')
+_auth = LazyModule('googleapiclient._auth')
+
+
+# clients are expensive to build so they are shared by every `GCPService`
+# of a thread with the same credentials; their http connections can't be
+# shared across threads
+_clients = threading.local()
 
 
 class GCPService(BigQueryService):
     _credentials = None
     _bigquery = None
-    def __init__(self, credentials=None):
+    _backend = None
+    def __init__(self, credentials=None, backend=None):
         """Builds a connector to interact with Google Cloud tools.
         :type credentials: `google.auth.credentials.Credentials` or
                             str
         :param credentials: certificates to connect to GCP, can be either
                             a Credentials class or a path to the json key
                             file.
+
+        :type backend: `connector.local.LocalBigQuery`
+        :param backend: in-memory backend used instead of GCP. If not sent
+                        and environment variable `PHOENIX_BACKEND` is
+                        "local" then a default `LocalBigQuery` is used.
+
         :raises: TypeError if credentials is not of type
                  google.auth.credentials
         """
         if (credentials is not None and not isinstance(credentials,
-            google.auth.credentials.Credentials)):
+            google_credentials.Credentials)):
             raise TypeError("credentials must be of type "
                             "google.auth.credentials") 
+        if backend is None and os.environ.get('PHOENIX_BACKEND') == 'local':
+            from .local import LocalBigQuery
+            backend = LocalBigQuery()
+        self._backend = backend
         # if no ``credentials`` is sent then assume we are running this
         # code in AppEngine environment
-        self._credentials = (app_engine.Credentials() if not credentials else
-            credentials)
+        self._credentials = (credentials if credentials or backend else
+            app_engine.Credentials())
         #from google.oauth2 import service_account
         #self._credentials = (service_account.Credentials.\
         #    from_service_account_file('./key.json'))            
 
     @property
     def bigquery(self):
-        if not self._bigquery:
-            self._bigquery = BigQueryService(self._credentials) 
-        return self._bigquery
+        if self._backend is not None:
+            if not self._bigquery:
+                self._bigquery = BigQueryService(self._credentials,
+                    con=self._backend)
+            return self._bigquery
+        clients = _clients.__dict__.setdefault('bigquery', {})
+        if self._credentials not in clients:
+            clients[self._credentials] = BigQueryService(self._credentials,
+                con=None)
+        return clients[self._credentials]
+
+    def warmup(self):
+        """Builds the BigQuery client of current thread and fetches an
+        access token if credentials have none yet."""
+        self.bigquery
+        if self._credentials is not None and not _auth.is_valid(
+            self._credentials):
+            _auth.refresh_credentials(self._credentials)
@@ -0,0 +1,495 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""In-memory stand-ins for BigQuery and task queue services, used to run
+and benchmark the pipeline offline. Latency, quota errors and jobs
+durations are configurable."""
+
+
+import re
+import copy
+import json
+import time
+import random
+import datetime
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+DML_STATEMENT = re.compile(r'^(\s*#[^\n]*\n)*\s*(INSERT|UPDATE|DELETE|MERGE)\b',
+    re.IGNORECASE)
+
+
+def _evaluate(value, *args):
+    """Returns ``value`` or, if it's callable, the result of calling it with
+    ``args``."""
+    return value(*args) if callable(value) else value
+
+
+def _http_error(status, reason, message):
+    resp = httplib2.Response({'status': status})
+    resp.reason = message
+    return HttpError(resp, json.dumps({'error': {'code': status,
+        'message': message, 'errors': [{'reason': reason,
+        'message': message}]}}))
+
+
+class LocalRequest(object):
+    """Emulates `googleapiclient.http.HttpRequest`.
+
+    :type backend: `LocalBigQuery`
+    :param backend: backend that executes the request.
+
+    :type method: str
+    :param method: name of API method, such as "jobs.get".
+
+    :type func: callable
+    :param func: runs the method and returns its response.
+    """
+    def __init__(self, backend, method, func):
+        self.backend = backend
+        self.method = method
+        self.func = func
+
+    def execute(self, num_retries=0, http=None):
+        """Runs request retrying quota and server errors up to
+        ``num_retries`` times, just like the real client does.
+
+        :raises HttpError: if request fails.
+        """
+        for attempt in range(num_retries + 1):
+            try:
+                self.backend.call(self.method)
+                return self.func()
+            except HttpError as err:
+                if attempt == num_retries or err.resp.status not in (403,
+                    429, 500, 503):
+                    raise
+                self.backend.sleep(self.backend.random.random() * 2 **
+                    attempt)
+
+
+class LocalBatch(object):
+    """Emulates `googleapiclient.http.BatchHttpRequest`; the whole batch
+    costs a single call of latency.
+
+    :type backend: `LocalBigQuery`
+    :param backend: backend that executes the requests.
+
+    :type callback: callable
+    :param callback: called with request id, response and exception of
+                     each request.
+    """
+    def __init__(self, backend, callback=None):
+        self.backend = backend
+        self.callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = (request_id if request_id is not None else
+            str(len(self._requests) + 1))
+        self._requests.append((request_id, request, callback or
+            self.callback))
+
+    def execute(self, http=None):
+        self.backend.call('batch')
+        for request_id, request, callback in self._requests:
+            try:
+                response, exception = request.func(), None
+            except HttpError as err:
+                response, exception = None, err
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class LocalBigQuery(object):
+    """In-memory BigQuery resource that can replace the one built by
+    `googleapiclient.discovery.build` in `BigQueryService`.
+
+    :type latency: float or callable
+    :param latency: seconds each API call takes, or a function of the
+                    method name returning it.
+
+    :type quota_error_rate: float
+    :param quota_error_rate: probability, between 0 and 1, of a call failing
+                             with a `rateLimitExceeded` error.
+
+    :type job_duration: float or callable
+    :param job_duration: seconds a job runs, or a function of the job body
+                         returning it.
+
+    :type bytes_processed: int or callable
+    :param bytes_processed: bytes each job processes, or a function of the
+                            job body returning it.
+
+    :type query_rows: list or callable
+    :param query_rows: rows, in the format of `tabledata().list`, saved in
+                       the destination table of query jobs, or a function of
+                       the job body returning them.
+
+    :type seed: int
+    :param seed: seed of random errors.
+
+    :type clock: callable
+    :param clock: returns current time in seconds.
+
+    :type sleep: callable
+    :param sleep: blocks for a number of seconds.
+    """
+    def __init__(self, latency=0, quota_error_rate=0, job_duration=0,
+                 bytes_processed=0, query_rows=None, seed=None,
+                 clock=time.time, sleep=time.sleep):
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.job_duration = job_duration
+        self.bytes_processed = bytes_processed
+        self.query_rows = query_rows if query_rows is not None else []
+        self.random = random.Random(seed)
+        self.clock = clock
+        self.sleep = sleep
+        self.calls = Counter()
+        self.jobs_store = {}
+        self.tables_store = {}
+
+    def call(self, method):
+        """Accounts for one API call of ``method``, applying latency and
+        quota errors.
+
+        :raises HttpError: randomly, according to `quota_error_rate`.
+        """
+        self.calls[method] += 1
+        latency = _evaluate(self.latency, method)
+        if latency:
+            self.sleep(latency)
+        if (self.quota_error_rate and
+            self.random.random() < self.quota_error_rate):
+            self.calls['quota_errors'] += 1
+            raise _http_error(403, 'rateLimitExceeded',
+                'Exceeded rate limits')
+
+    def new_batch_http_request(self, callback=None):
+        return LocalBatch(self, callback)
+
+    def jobs(self):
+        return _LocalJobs(self)
+
+    def tables(self):
+        return _LocalTables(self)
+
+    def tabledata(self):
+        return _LocalTabledata(self)
+
+    def create_table(self, project_id, dataset_id, table_id, rows=None,
+                     resource=None):
+        """Adds a table to the backend.
+
+        :type rows: list
+        :param rows: rows in the format returned by `tabledata().list`.
+
+        :type resource: dict
+        :param resource: extra keys of table resource.
+        """
+        table = dict((resource or {}).items() + [('tableReference', {
+            'projectId': project_id, 'datasetId': dataset_id,
+            'tableId': table_id})])
+        self.tables_store[(project_id, dataset_id, table_id)] = {
+            'resource': table, 'rows': list(rows or [])}
+
+    def _job_resource(self, key):
+        job = self.jobs_store[key]
+        now = self.clock()
+        resource = copy.deepcopy(job['resource'])
+        statistics = resource['statistics']
+        if now >= job['end']:
+            resource['status'] = {'state': 'DONE'}
+            statistics['startTime'] = str(int(job['start'] * 1000))
+            statistics['endTime'] = str(int(job['end'] * 1000))
+            if not job['finished']:
+                self._finish_job(job)
+        elif now >= job['start']:
+            resource['status'] = {'state': 'RUNNING'}
+            statistics['startTime'] = str(int(job['start'] * 1000))
+        return resource
+
+    def _finish_job(self, job):
+        job['finished'] = True
+        query = job['resource']['configuration'].get('query', {})
+        destination = query.get('destinationTable')
+        if destination:
+            self.create_table(destination['projectId'],
+                destination['datasetId'],
+                destination['tableId'].split('$')[0],
+                _evaluate(self.query_rows, job['resource']))
+
+
+class _LocalJobs(object):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def insert(self, projectId, body):
+        def func():
+            if body['configuration'].get('dryRun'):
+                return {'configuration': body['configuration'],
+                        'status': {'state': 'DONE'},
+                        'statistics': {'totalBytesProcessed': str(
+                            _evaluate(self.backend.bytes_processed, body))}}
+            job_id = body.get('jobReference', {}).get('jobId') or (
+                'job_{}'.format(len(self.backend.jobs_store)))
+            key = (projectId, job_id)
+            if key in self.backend.jobs_store:
+                raise _http_error(409, 'duplicate',
+                    'Already Exists: Job {}:{}'.format(projectId, job_id))
+            now = self.backend.clock()
+            total_bytes = str(_evaluate(self.backend.bytes_processed, body))
+            configuration = copy.deepcopy(body['configuration'])
+            # as in BigQuery, results of queries without destination are
+            # saved in anonymous tables
+            query = configuration.get('query')
+            if (query is not None and 'destinationTable' not in query and
+                not DML_STATEMENT.match(query.get('query', ''))):
+                query['destinationTable'] = {'projectId': projectId,
+                    'datasetId': '_anonymous', 'tableId': 'anon_' + job_id}
+            resource = {'jobReference': {'projectId': projectId,
+                                         'jobId': job_id},
+                        'configuration': configuration,
+                        'status': {'state': 'PENDING'},
+                        'statistics': {
+                            'creationTime': str(int(now * 1000)),
+                            'totalBytesProcessed': total_bytes,
+                            'query': {'totalBytesProcessed': total_bytes,
+                                      'totalBytesBilled': total_bytes,
+                                      'cacheHit': False}}}
+            self.backend.jobs_store[key] = {'resource': resource,
+                'start': now, 'end': now + _evaluate(
+                    self.backend.job_duration, body), 'finished': False}
+            return self.backend._job_resource(key)
+        return LocalRequest(self.backend, 'jobs.insert', func)
+
+    def get(self, projectId, jobId, location=None):
+        def func():
+            key = (projectId, jobId)
+            if key not in self.backend.jobs_store:
+                raise _http_error(404, 'notFound',
+                    'Not found: Job {}:{}'.format(projectId, jobId))
+            return self.backend._job_resource(key)
+        return LocalRequest(self.backend, 'jobs.get', func)
+
+
+class _LocalTables(object):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _get(self, projectId, datasetId, tableId):
+        key = (projectId, datasetId, tableId)
+        if key not in self.backend.tables_store:
+            raise _http_error(404, 'notFound', 'Not found: Table {}:{}.{}'
+                .format(projectId, datasetId, tableId))
+        return key
+
+    def get(self, projectId, datasetId, tableId):
+        def func():
+            key = self._get(projectId, datasetId, tableId)
+            return copy.deepcopy(self.backend.tables_store[key]['resource'])
+        return LocalRequest(self.backend, 'tables.get', func)
+
+    def insert(self, projectId, datasetId, body):
+        def func():
+            table_id = body['tableReference']['tableId']
+            if (projectId, datasetId, table_id) in self.backend.tables_store:
+                raise _http_error(409, 'duplicate', 'Already Exists: Table '
+                    '{}:{}.{}'.format(projectId, datasetId, table_id))
+            self.backend.create_table(projectId, datasetId, table_id,
+                resource=body)
+            return copy.deepcopy(self.backend.tables_store[(projectId,
+                datasetId, table_id)]['resource'])
+        return LocalRequest(self.backend, 'tables.insert', func)
+
+    def delete(self, projectId, datasetId, tableId):
+        def func():
+            del self.backend.tables_store[self._get(projectId, datasetId,
+                tableId)]
+            return ''
+        return LocalRequest(self.backend, 'tables.delete', func)
+
+    def list(self, projectId, datasetId, maxResults=50, pageToken=None):
+        def func():
+            keys = sorted(key for key in self.backend.tables_store if
+                key[:2] == (projectId, datasetId))
+            start = int(pageToken or 0)
+            response = {'tables': [copy.deepcopy(self.backend.tables_store[
+                key]['resource']) for key in keys[start: start + maxResults]],
+                'totalItems': len(keys)}
+            if start + maxResults < len(keys):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        request = LocalRequest(self.backend, 'tables.list', func)
+        request.kwargs = {'projectId': projectId, 'datasetId': datasetId,
+                          'maxResults': maxResults}
+        return request
+
+    def list_next(self, previous_request, previous_response):
+        if not previous_response.get('nextPageToken'):
+            return None
+        return self.list(pageToken=previous_response['nextPageToken'],
+            **previous_request.kwargs)
+
+
+class _LocalTabledata(object):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def list(self, projectId, datasetId, tableId, maxResults=None,
+             pageToken=None):
+        def func():
+            key = _LocalTables(self.backend)._get(projectId, datasetId,
+                tableId)
+            rows = self.backend.tables_store[key]['rows']
+            start = int(pageToken or 0)
+            end = start + maxResults if maxResults else len(rows)
+            response = {'rows': copy.deepcopy(rows[start: end]),
+                        'totalRows': str(len(rows))}
+            if end < len(rows):
+                response['pageToken'] = str(end)
+            return response
+        request = LocalRequest(self.backend, 'tabledata.list', func)
+        request.kwargs = {'projectId': projectId, 'datasetId': datasetId,
+                          'tableId': tableId, 'maxResults': maxResults}
+        return request
+
+    def list_next(self, previous_request, previous_response):
+        if not previous_response.get('pageToken'):
+            return None
+        return self.list(pageToken=previous_response['pageToken'],
+            **previous_request.kwargs)
+
+
+class LocalTaskQueueError(Exception):
+    """Base error of `LocalTaskQueue`."""
+
+
+class LocalTask(object):
+    """Emulates `google.appengine.api.taskqueue.Task`."""
+    def __init__(self, url=None, target=None, params=None, name=None,
+                 countdown=None, **kwargs):
+        self.url = url
+        self.target = target
+        self.params = dict(params or {})
+        self.name = name
+        self.countdown = countdown or 0
+        self.eta = None
+        self.eta_posix = None
+        self.enqueued = None
+        self.was_enqueued = False
+
+
+class LocalTaskQueue(object):
+    """In-memory task queue that can replace the
+    `google.appengine.api.taskqueue` module in `scheduler`.
+
+    :type latency: float
+    :param latency: seconds each call to add tasks takes.
+
+    :type clock: callable
+    :param clock: returns current time in seconds.
+
+    :type sleep: callable
+    :param sleep: blocks for a number of seconds.
+    """
+    MAX_TASKS_PER_ADD = 100
+    Task = LocalTask
+
+    class TaskAlreadyExistsError(LocalTaskQueueError):
+        pass
+
+    class TombstonedTaskError(LocalTaskQueueError):
+        pass
+
+    def __init__(self, latency=0, clock=time.time, sleep=time.sleep):
+        self.latency = latency
+        self.clock = clock
+        self.sleep = sleep
+        self.calls = Counter()
+        self.tasks = []
+        self.names = set()
+
+    def Queue(self, name='default'):
+        return _LocalQueue(self, name)
+
+    def add(self, url=None, target=None, params=None, name=None,
+            countdown=None, **kwargs):
+        return self.Queue().add(LocalTask(url=url, target=target,
+            params=params, name=name, countdown=countdown))
+
+    def run_tasks(self, handler):
+        """Runs pending tasks in order of ETA, including tasks enqueued
+        while running them. Tasks whose ETA is still to come are waited for
+        with `sleep`.
+
+        :type handler: callable
+        :param handler: receives each `LocalTask` to process.
+
+        :rtype: int
+        :returns: how many tasks were run.
+        """
+        count = 0
+        while self.tasks:
+            self.tasks.sort(key=lambda task: task.eta_posix)
+            task = self.tasks.pop(0)
+            wait = task.eta_posix - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            handler(task)
+            count += 1
+        return count
+
+
+class _LocalQueue(object):
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def add(self, task):
+        tasks = task if isinstance(task, list) else [task]
+        if len(tasks) > self.backend.MAX_TASKS_PER_ADD:
+            raise LocalTaskQueueError("Too many tasks in a single call")
+        self.backend.calls['taskqueue.add'] += 1
+        if self.backend.latency:
+            self.backend.sleep(self.backend.latency)
+        duplicated = False
+        for item in tasks:
+            if item.name in self.backend.names:
+                duplicated = True
+                continue
+            if item.name is None:
+                item.name = 'task{}'.format(len(self.backend.names) + 1)
+            self.backend.names.add(item.name)
+            item.enqueued = self.backend.clock()
+            item.eta_posix = item.enqueued + item.countdown
+            item.eta = datetime.datetime.utcfromtimestamp(item.eta_posix)
+            item.was_enqueued = True
+            self.backend.tasks.append(item)
+        if duplicated:
+            raise self.backend.TaskAlreadyExistsError()
+        return task
@@ -0,0 +1,109 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""History of bytes processed by query jobs, used to forecast their costs."""
+
+
+from google.appengine.ext import ndb
+
+
+class QueryCost(ndb.Model):
+    """Bytes processed by a job when run for a given date.
+
+    Entities are keyed by job name and date so that running a date again
+    replaces its previous record.
+    """
+    job_name = ndb.StringProperty(required=True)
+    date = ndb.StringProperty(required=True)
+    total_bytes_processed = ndb.IntegerProperty(required=True)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def build_key(cls, job_name, date):
+        """Builds key of entity for ``job_name`` and ``date``.
+
+        :type job_name: str
+        :param job_name: name of job as defined in `JobsFactory`.
+
+        :type date: str
+        :param date: date in format "%Y%m%d" the job processed.
+
+        :rtype: `ndb.Key`
+        :returns: key of entity.
+        """
+        return ndb.Key(cls, '{}:{}'.format(job_name, date))
+
+
+def record_cost(job_name, date, total_bytes_processed):
+    """Saves how many bytes ``job_name`` processes for ``date``.
+
+    :type job_name: str
+    :param job_name: name of job as defined in `JobsFactory`.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" the job processed.
+
+    :type total_bytes_processed: int
+    :param total_bytes_processed: bytes reported by BigQuery for the job.
+
+    :rtype: `QueryCost`
+    :returns: saved entity.
+    """
+    cost = QueryCost(key=QueryCost.build_key(job_name, date),
+        job_name=job_name, date=date,
+        total_bytes_processed=int(total_bytes_processed))
+    cost.put()
+    return cost
+
+
+def forecast_cost(job_name, dates, history_size=30):
+    """Estimates how many bytes running ``job_name`` for ``dates`` would
+    process. Dates that already have a record use it; the others use the
+    average of the ``history_size`` most recent records.
+
+    :type job_name: str
+    :param job_name: name of job as defined in `JobsFactory`.
+
+    :type dates: list
+    :param dates: dates in format "%Y%m%d" to forecast.
+
+    :type history_size: int
+    :param history_size: how many records to average.
+
+    :rtype: dict
+    :returns: forecast with total of `dates`, how many of them are already
+              `known`, how many records were used for the `average` and the
+              `total_bytes_processed` expected.
+    """
+    known = [cost for cost in ndb.get_multi([QueryCost.build_key(job_name,
+        date) for date in dates]) if cost is not None]
+    history = (QueryCost.query(QueryCost.job_name == job_name)
+        .order(-QueryCost.date).fetch(history_size))
+    average = (sum(cost.total_bytes_processed for cost in history) /
+        len(history) if history else 0)
+    return {'dates': len(dates),
+            'known': len(known),
+            'history': len(history),
+            'average_bytes_processed': average,
+            'total_bytes_processed': (sum(cost.total_bytes_processed for cost
+                in known) + average * (len(dates) - len(known)))}
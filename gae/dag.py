@@ -0,0 +1,112 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""State of the nodes of job DAGs, see `scheduler.DagSchedulerJob`. A node
+is done for a date once its task finishes, so runs of the same DAG and date
+only enqueue what is left."""
+
+
+from google.appengine.ext import ndb
+
+
+class NodeRun(ndb.Model):
+    """Node of a DAG that finished processing a date.
+
+    Entities are keyed by DAG, node, date and rerun token, so sending a new
+    token runs every node of the date again.
+    """
+    dag_name = ndb.StringProperty(required=True)
+    node = ndb.StringProperty(required=True)
+    date = ndb.StringProperty(required=True)
+    rerun = ndb.StringProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def build_key(cls, dag_name, node, date, rerun=None):
+        """Builds key of entity for ``node`` of ``dag_name`` and ``date``.
+
+        :type dag_name: str
+        :param dag_name: name of DAG as defined in `JobsFactory`.
+
+        :type node: str
+        :param node: name of node in DAG.
+
+        :type date: str
+        :param date: date in format "%Y%m%d" the node processed.
+
+        :type rerun: str
+        :param rerun: token of run that processed the date.
+
+        :rtype: `ndb.Key`
+        :returns: key of entity.
+        """
+        name = '{}:{}:{}'.format(dag_name, node, date)
+        if rerun:
+            name += ':' + rerun
+        return ndb.Key(cls, name)
+
+
+def mark_done(dag_name, node, date, rerun=None):
+    """Records that ``node`` finished processing ``date``.
+
+    :type dag_name: str
+    :param dag_name: name of DAG as defined in `JobsFactory`.
+
+    :type node: str
+    :param node: name of node in DAG.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" the node processed.
+
+    :type rerun: str
+    :param rerun: token of run that processed the date.
+
+    :rtype: `NodeRun`
+    :returns: saved entity.
+    """
+    run = NodeRun(key=NodeRun.build_key(dag_name, node, date, rerun),
+        dag_name=dag_name, node=node, date=date, rerun=rerun)
+    run.put()
+    return run
+
+
+def done_nodes(dag_name, nodes, date, rerun=None):
+    """Selects which of ``nodes`` already processed ``date``.
+
+    :type dag_name: str
+    :param dag_name: name of DAG as defined in `JobsFactory`.
+
+    :type nodes: list
+    :param nodes: names of nodes to check.
+
+    :type date: str
+    :param date: date in format "%Y%m%d".
+
+    :type rerun: str
+    :param rerun: token of run.
+
+    :rtype: set
+    :returns: names of nodes that are done.
+    """
+    return set(run.node for run in ndb.get_multi([NodeRun.build_key(
+        dag_name, node, date, rerun) for node in nodes]) if run is not None)
@@ -24,7 +24,7 @@
 """Factorizes scheduler to run in background."""
 
 
-from scheduler import SchedulerJob
+from scheduler import SchedulerJob, BackfillSchedulerJob, DagSchedulerJob
 
 
 class JobsFactory(object):
@@ -36,13 +36,15 @@ class JobsFactory(object):
         :param job_name: name of job to build.
 
         :rtype: `SchedulerJob`
-        :returns: scheduler that receives a `URL` and a `target` parameter
-                  to run tasks in background.
+        :returns: scheduler that receives the setup of the job, such as a
+                  `URL` and a `target` parameter, to run tasks in background.
         """
         job_setup = self.jobs_setup.get(job_name)
         if not job_setup: 
             raise TypeError("Please choose a valid job name.")
-        return SchedulerJob(url=job_setup['url'], target=job_setup['target'])
+        scheduler = job_setup.get('scheduler', SchedulerJob)
+        return scheduler(**dict((key, value) for key, value in
+            job_setup.items() if key != 'scheduler'))
 
     @property
     def jobs_setup(self):
@@ -50,7 +52,45 @@ class JobsFactory(object):
 
         :rtype: dict
         :returns: dict where keys are jobs names and values are their
-                  description.    
+                  description. The key `scheduler` is optional and sets
+                  which class to use for enqueueing tasks, defaults to
+                  `SchedulerJob`. DAGs of jobs use `DagSchedulerJob` and
+                  describe their `nodes` instead of a single `url`.
         """
         return {'update_dashboard_tables': {'url': '/update_dashboard_tables',
-                   'target': 'worker'}}
+                   'target': 'worker'},
+                'sweep_dashboard_tables': {
+                   'url': '/sweep_dashboard_tables',
+                   'target': 'worker'},
+                'backfill_dashboard_tables': {
+                   'url': '/update_dashboard_tables',
+                   'target': 'worker',
+                   'scheduler': BackfillSchedulerJob},
+                'update_search_terms': {'url': '/update_search_terms',
+                   'target': 'worker'},
+                'backfill_search_terms': {
+                   'url': '/update_search_terms',
+                   'target': 'worker',
+                   'scheduler': BackfillSchedulerJob},
+                'update_search_rollups': {'url': '/update_search_rollups',
+                   'target': 'worker'},
+                'daily_pipeline': {
+                   'name': 'daily_pipeline',
+                   'target': 'worker',
+                   'scheduler': DagSchedulerJob,
+                   'nodes': {
+                       'update_search_terms': {
+                           'url': '/update_search_terms',
+                           'queue_name': 'dag'},
+                       'update_dashboard_tables': {
+                           'url': '/update_dashboard_tables',
+                           'upstream': ['update_search_terms'],
+                           'queue_name': 'dag-kpis'},
+                       'update_search_rollups': {
+                           'url': '/update_search_rollups',
+                           'upstream': ['update_dashboard_tables'],
+                           'queue_name': 'dag-rollups'},
+                       'sweep_dashboard_tables': {
+                           'url': '/sweep_dashboard_tables',
+                           'upstream': ['update_dashboard_tables'],
+                           'queue_name': 'dag'}}}}
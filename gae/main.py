@@ -24,13 +24,22 @@
 """Main module working as entry point for routing different jobs."""
 
 
+import json
+import logging
+
 import utils
-from flask import Flask, request
+import startup
+import profiling
+import search_kpis
+from flask import Flask, Response, request
 from factory import JobsFactory
 import time
 
 
+startup.profiler.log('main')
+
 app = Flask(__name__)
+profiling.install(app)
 jobs_factory = JobsFactory()
 
 
@@ -39,12 +48,44 @@ def run_job(job_name):
     """This method works as a central manager to choose which job to run
     and respective input parameters.
 
+    If argument `forecast` is sent then nothing is enqueued and the
+    expected bytes processed by the job is returned instead.
+
     :type job_name: str
     :param job_name: specifies which job to run.
     """
     try:
         scheduler = jobs_factory.factor_job(job_name)
+        if request.args.get('forecast'):
+            return json.dumps(scheduler.forecast(request.args))
         scheduler.run(request.args)
         return str(scheduler)
     except Exception as err:
-        print str(err)
+        logging.exception("failed to run job %s", job_name)
+        return str(err), 500
+
+
+@app.route("/search_kpis/")
+def read_search_kpis():
+    """Returns as JSON the KPIs of each search summed from date `from` to
+    date `to`, or of a single one if argument `search` is sent.
+
+    Responses carry an ETag, so clients that send it back in
+    `If-None-Match` get an empty 304 response while results don't change.
+    """
+    try:
+        query = search_kpis.normalize_query(request.args)
+    except ValueError as err:
+        return str(err), 400
+    etag, payload = search_kpis.read_kpis(*query)
+    response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+@app.route("/_ah/warmup")
+def warmup():
+    """Loading request sent by App Engine before any other so that modules
+    are imported before the first request arrives."""
+    return ""
@@ -0,0 +1,145 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Execution metrics of query jobs run by the worker, kept to follow how
+long and how much each job takes from one date to the next."""
+
+
+import json
+import logging
+
+from google.appengine.ext import ndb
+
+
+class JobMetric(ndb.Model):
+    """Statistics of a finished job when run for a given date, along with
+    how long its task waited in the queue and how long the request that ran
+    it took until it was done.
+
+    Entities are keyed by job name and date so that running a date again
+    replaces its previous record.
+    """
+    job_name = ndb.StringProperty(required=True)
+    date = ndb.StringProperty(required=True)
+    elapsed_ms = ndb.IntegerProperty()
+    queued_ms = ndb.IntegerProperty()
+    slot_ms = ndb.IntegerProperty()
+    shuffle_bytes = ndb.IntegerProperty()
+    bytes_processed = ndb.IntegerProperty()
+    bytes_billed = ndb.IntegerProperty()
+    cache_hit = ndb.BooleanProperty()
+    creation_time = ndb.IntegerProperty()
+    start_time = ndb.IntegerProperty()
+    end_time = ndb.IntegerProperty()
+    task_wait_ms = ndb.IntegerProperty()
+    handling_ms = ndb.IntegerProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def build_key(cls, job_name, date):
+        """Builds key of entity for ``job_name`` and ``date``.
+
+        :type job_name: str
+        :param job_name: name of job that ran in the worker.
+
+        :type date: str
+        :param date: date in format "%Y%m%d" the job processed.
+
+        :rtype: `ndb.Key`
+        :returns: key of entity.
+        """
+        return ndb.Key(cls, '{}:{}'.format(job_name, date))
+
+    def to_json_dict(self):
+        """Represents metric with values that can be serialized to JSON.
+
+        :rtype: dict
+        :returns: every property but `updated`.
+        """
+        return self.to_dict(exclude=['updated'])
+
+
+def record_metric(job_name, date, statistics, task_wait_ms=None,
+                  handling_ms=None):
+    """Saves the metrics of ``job_name`` for ``date`` and logs them as a
+    JSON payload so they can also be filtered in the logs.
+
+    :type job_name: str
+    :param job_name: name of job that ran in the worker.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" the job processed.
+
+    :type statistics: dict
+    :param statistics: statistics of finished job, as returned by
+                       `connector.bigquery.job_statistics`.
+
+    :type task_wait_ms: int
+    :param task_wait_ms: milliseconds the task waited in the queue after the
+                         time it was scheduled to run.
+
+    :type handling_ms: int
+    :param handling_ms: milliseconds the request took until job was done.
+
+    :rtype: `JobMetric`
+    :returns: saved entity.
+    """
+    metric = JobMetric(key=JobMetric.build_key(job_name, date),
+        job_name=job_name, date=date, task_wait_ms=task_wait_ms,
+        handling_ms=handling_ms, **dict((name, statistics.get(name)) for name
+        in ('elapsed_ms', 'queued_ms', 'slot_ms', 'shuffle_bytes',
+            'bytes_processed', 'bytes_billed', 'cache_hit', 'creation_time',
+            'start_time', 'end_time')))
+    metric.put()
+    logging.info("job metrics %s", json.dumps(metric.to_json_dict(),
+        sort_keys=True))
+    return metric
+
+
+def job_history(job_name, limit=30):
+    """Reads the most recent metrics of ``job_name``.
+
+    :type job_name: str
+    :param job_name: name of job that ran in the worker.
+
+    :type limit: int
+    :param limit: how many dates to return.
+
+    :rtype: list
+    :returns: `JobMetric` entities, most recent date first.
+    """
+    return (JobMetric.query(JobMetric.job_name == job_name)
+        .order(-JobMetric.date).fetch(limit))
+
+
+def date_history(date):
+    """Reads the metrics of every job that ran for ``date``.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" the jobs processed.
+
+    :rtype: list
+    :returns: `JobMetric` entities sorted by job name.
+    """
+    return sorted(JobMetric.query(JobMetric.date == date).fetch(),
+        key=lambda metric: metric.job_name)
@@ -0,0 +1,427 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""WSGI middleware that times the requests of the Flask apps, counts the
+App Engine API calls each of them makes and profiles a sample of them.
+
+Metrics and profiles live in memory of the instance that served the
+requests and are read through the admin endpoints registered by
+`install`."""
+
+
+import os
+import json
+import time
+import bisect
+import pstats
+import random
+import cProfile
+import StringIO
+import itertools
+import threading
+import collections
+
+from flask import Blueprint, Response, abort
+from werkzeug.exceptions import HTTPException
+from google.appengine.api import runtime
+from google.appengine.api import apiproxy_stub_map
+
+try:
+    import resource
+except ImportError:
+    # not available in the App Engine sandbox, see `peak_memory_kb`
+    resource = None
+
+
+# upper bounds, in milliseconds, of the buckets of latency histograms
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+    10000, 30000, 60000, 600000)
+# requests with this header are always profiled
+PROFILE_HEADER = 'X-Phoenix-Profile'
+
+_request = threading.local()
+_hooked_proxy = None
+
+
+class LatencyHistogram(object):
+    """Counts latencies in buckets of fixed bounds so that percentiles can
+    be estimated with constant memory.
+
+    :type buckets: tuple
+    :param buckets: upper bounds, in milliseconds, of each bucket. Latencies
+                    above the last bound go to an extra bucket.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.
+        self.max_ms = 0.
+
+    def add(self, latency_ms):
+        """Counts a new latency.
+
+        :type latency_ms: float
+        :param latency_ms: milliseconds a request took.
+        """
+        self.counts[bisect.bisect_left(self.buckets, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, fraction):
+        """Estimates a percentile as the upper bound of the bucket where it
+        falls, never above the highest latency seen.
+
+        :type fraction: float
+        :param fraction: percentile between 0 and 1, such as 0.95.
+
+        :rtype: float
+        :returns: latency in milliseconds, ``None`` if nothing was counted.
+        """
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        """Summarizes the histogram.
+
+        :rtype: dict
+        :returns: `count`, `mean_ms`, `max_ms` and the 50th, 95th and 99th
+                  percentiles.
+        """
+        return {'count': self.count,
+                'mean_ms': self.total_ms / self.count if self.count else None,
+                'max_ms': self.max_ms,
+                'p50_ms': self.percentile(0.5),
+                'p95_ms': self.percentile(0.95),
+                'p99_ms': self.percentile(0.99)}
+
+
+class RequestMetrics(object):
+    """Latency histogram, errors and API calls of the requests of each
+    route. Safe to share among the threads of an instance."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, latency_ms, status, api_calls):
+        """Adds a finished request to the metrics of its route.
+
+        :type route: str
+        :param route: rule of route that handled the request.
+
+        :type latency_ms: float
+        :param latency_ms: milliseconds request took.
+
+        :type status: int
+        :param status: HTTP status of response.
+
+        :type api_calls: `collections.Counter`
+        :param api_calls: App Engine API calls per service made by request.
+        """
+        with self._lock:
+            stats = self.routes.setdefault(route, {'latency':
+                LatencyHistogram(), 'errors': 0,
+                'api_calls': collections.Counter()})
+            stats['latency'].add(latency_ms)
+            stats['errors'] += status >= 500
+            stats['api_calls'].update(api_calls)
+
+    def summary(self):
+        """Summarizes the metrics of every route.
+
+        :rtype: dict
+        :returns: for each route the summary of its latency histogram, how
+                  many requests failed and how many API calls, per service
+                  and on average, its requests made.
+        """
+        with self._lock:
+            result = {}
+            for route, stats in self.routes.items():
+                summary = stats['latency'].summary()
+                summary.update({'errors': stats['errors'],
+                    'api_calls': dict(stats['api_calls']),
+                    'api_calls_per_request': float(sum(
+                        stats['api_calls'].values())) / summary['count']})
+                result[route] = summary
+            return result
+
+
+class ProfileStore(object):
+    """Keeps the most recent profiles captured in the instance.
+
+    :type size: int
+    :param size: how many profiles to keep.
+    """
+    def __init__(self, size=20):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.profiles = collections.deque(maxlen=size)
+
+    def add(self, profile):
+        """Saves a profile, dropping the oldest one if store is full.
+
+        :type profile: dict
+        :param profile: profile with `stats` and its request description.
+
+        :rtype: int
+        :returns: id given to profile.
+        """
+        with self._lock:
+            profile['id'] = next(self._ids)
+            self.profiles.append(profile)
+            return profile['id']
+
+    def list(self):
+        """Lists profiles kept, most recent first.
+
+        :rtype: list
+        :returns: profiles without their `stats`.
+        """
+        with self._lock:
+            return [dict((key, value) for key, value in profile.items() if
+                key != 'stats') for profile in reversed(self.profiles)]
+
+    def get(self, profile_id):
+        """Finds profile by its id.
+
+        :type profile_id: int
+        :param profile_id: id given by `add`.
+
+        :rtype: dict
+        :returns: profile or ``None`` if it's no longer kept.
+        """
+        with self._lock:
+            for profile in self.profiles:
+                if profile['id'] == profile_id:
+                    return profile
+
+
+metrics = RequestMetrics()
+profiles = ProfileStore()
+
+
+def count_api_call(service, call, request, response):
+    """Pre-call hook of apiproxy that counts calls of current request."""
+    api_calls = getattr(_request, 'api_calls', None)
+    if api_calls is not None:
+        api_calls[service] += 1
+
+
+def install_api_hooks():
+    """Hooks `count_api_call` into the apiproxy in use. The apiproxy is
+    checked on each request as tests replace it through testbed."""
+    global _hooked_proxy
+    proxy = apiproxy_stub_map.apiproxy
+    if proxy is not _hooked_proxy:
+        proxy.GetPreCallHooks().Append('phoenix_api_calls', count_api_call)
+        _hooked_proxy = proxy
+
+
+def peak_memory_kb():
+    """Reads the peak memory used by the process. The App Engine sandbox
+    has no `resource` module, so there the memory the instance currently
+    uses, as told by the runtime API, is read instead.
+
+    :rtype: int
+    :returns: kilobytes.
+    """
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(runtime.memory_usage().current() * 1024)
+
+
+def flask_route(app):
+    """Builds function that tells which route of ``app`` handles a request,
+    so that metrics of routes with arguments are not split by URL.
+
+    :type app: `flask.Flask`
+    :param app: application whose routes are matched.
+
+    :rtype: function
+    :returns: function of WSGI environ that returns rule of route, or
+              "unmatched" if none handles the request.
+    """
+    def route(environ):
+        try:
+            return app.url_map.bind_to_environ(environ).match(
+                return_rule=True)[0].rule
+        except HTTPException:
+            return 'unmatched'
+    return route
+
+
+class ProfilingMiddleware(object):
+    """Times each request and counts its API calls. Requests with header
+    `PROFILE_HEADER`, and a random fraction of the others, also run under
+    `cProfile` and their profile is saved.
+
+    :type app: function
+    :param app: WSGI application to wrap.
+
+    :type route: function
+    :param route: tells route of request from WSGI environ, path is used if
+                  not set.
+
+    :type sample_rate: float
+    :param sample_rate: fraction, between 0 and 1, of requests to profile.
+
+    :type metrics: `RequestMetrics`
+    :param metrics: where latencies are recorded.
+
+    :type profiles: `ProfileStore`
+    :param profiles: where profiles are saved.
+    """
+    def __init__(self, app, route=None, sample_rate=0., metrics=metrics,
+                 profiles=profiles):
+        self.app = app
+        self.route = route or (lambda environ: environ.get('PATH_INFO', '/'))
+        self.sample_rate = sample_rate
+        self.metrics = metrics
+        self.profiles = profiles
+
+    def should_profile(self, environ):
+        """Tells whether request should be profiled.
+
+        :type environ: dict
+        :param environ: WSGI environ of request.
+
+        :rtype: bool
+        """
+        return ('HTTP_' + PROFILE_HEADER.upper().replace('-', '_') in
+            environ or random.random() < self.sample_rate)
+
+    def __call__(self, environ, start_response):
+        install_api_hooks()
+        statuses = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split(' ', 1)[0]))
+            return start_response(status, headers, exc_info)
+
+        profiler = cProfile.Profile() if self.should_profile(environ) else None
+        _request.api_calls = collections.Counter()
+        start = time.time()
+        try:
+            if profiler is None:
+                return self.app(environ, recording_start_response)
+            return profiler.runcall(self.app, environ,
+                recording_start_response)
+        finally:
+            latency_ms = (time.time() - start) * 1000
+            api_calls, _request.api_calls = _request.api_calls, None
+            route = self.route(environ)
+            status = statuses[-1] if statuses else 500
+            self.metrics.record(route, latency_ms, status, api_calls)
+            if profiler is not None:
+                self.save_profile(profiler, environ, route, latency_ms,
+                    status, api_calls)
+
+    def save_profile(self, profiler, environ, route, latency_ms, status,
+                     api_calls, limit=40):
+        """Saves the slowest functions, by cumulative time, of a profiled
+        request along with its description.
+
+        :type profiler: `cProfile.Profile`
+        :param profiler: profiler that ran request.
+
+        :type environ: dict
+        :param environ: WSGI environ of request.
+
+        :type route: str
+        :param route: rule of route that handled request.
+
+        :type latency_ms: float
+        :param latency_ms: milliseconds request took.
+
+        :type status: int
+        :param status: HTTP status of response.
+
+        :type api_calls: `collections.Counter`
+        :param api_calls: App Engine API calls per service made by request.
+
+        :type limit: int
+        :param limit: how many functions to keep.
+        """
+        stream = StringIO.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(
+            'cumulative').print_stats(limit)
+        self.profiles.add({'route': route,
+            'path': environ.get('PATH_INFO', '/'),
+            'method': environ.get('REQUEST_METHOD'),
+            'time': time.time(),
+            'latency_ms': latency_ms,
+            'status': status,
+            'api_calls': dict(api_calls),
+            'peak_memory_kb': peak_memory_kb(),
+            'stats': stream.getvalue()})
+
+
+admin = Blueprint('admin', __name__)
+
+
+@admin.route("/latency/")
+def latency():
+    """Returns as JSON the latency metrics of each route."""
+    return Response(json.dumps(metrics.summary()),
+        mimetype='application/json')
+
+
+@admin.route("/profiles/")
+def list_profiles():
+    """Returns as JSON the profiles kept in the instance."""
+    return Response(json.dumps(profiles.list()), mimetype='application/json')
+
+
+@admin.route("/profiles/<int:profile_id>/")
+def get_profile(profile_id):
+    """Returns as text the stats of a profile."""
+    profile = profiles.get(profile_id)
+    if profile is None:
+        abort(404)
+    return Response(profile['stats'], mimetype='text/plain')
+
+
+def install(app, sample_rate=None):
+    """Wraps ``app`` in `ProfilingMiddleware` and registers the admin
+    endpoints under "/_admin".
+
+    :type app: `flask.Flask`
+    :param app: application to profile.
+
+    :type sample_rate: float
+    :param sample_rate: fraction of requests to profile, read from
+                        environment variable `PHOENIX_PROFILE_SAMPLE_RATE`
+                        if not set.
+    """
+    if sample_rate is None:
+        sample_rate = float(os.environ.get('PHOENIX_PROFILE_SAMPLE_RATE', 0))
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, flask_route(app),
+        sample_rate)
+    app.register_blueprint(admin, url_prefix='/_admin')
@@ -0,0 +1,14 @@
+#standardSQL
+# Search KPIs summed from {start_date} to {end_date}, served by the
+# /search_kpis/ endpoint. An empty {search} reads every search.
+SELECT
+  d.search,
+  SUM(IFNULL(d.freq, 0)) freq,
+  SUM(IFNULL(d.clicks, 0)) clicks,
+  ROUND(SUM(IFNULL(d.net_revenue, 0)), 6) net_revenue,
+  SUM(IFNULL(d.bounce, 0)) bounce
+FROM `{dest_project_id}.{dest_dataset_id}.{source_table}`, UNNEST(results.search_data) d
+WHERE {date_column} BETWEEN '{start_date}' AND '{end_date}'
+  AND ('{search}' = '' OR d.search = '{search}')
+GROUP BY d.search
+ORDER BY freq DESC, d.search
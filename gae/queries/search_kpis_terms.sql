@@ -0,0 +1,120 @@
+#standardSQL
+CREATE TEMP FUNCTION removeAccents(phrase STRING) RETURNS STRING AS ((
+SELECT
+  REGEXP_REPLACE(
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(
+                REGEXP_REPLACE(phrase,
+                r'[àáâäåã]', 'a'),
+              r'[èéêëẽ]', 'e'),
+            r'[ìíîïĩ]', 'i'),
+          r'[òóôöøõ]', 'o'),
+        r'[ùúûüũ]', 'u'),
+      r'ç', 'c'),
+    r'ÿ', 'y'),
+  r'ñ', 'n')
+));
+
+CREATE TEMP FUNCTION slugify(phrase STRING) RETURNS STRING AS ((
+  SELECT 
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(removeAccents(LOWER(phrase)),
+                r'\s+', '-'), # replaces space with '-'
+              r'&', '-e-'), # replaces & with '-e-'
+            r'[^\w-]+', ''), # replaces non-word chars
+          r'--+', '-'), # replaces multiple '-' with single one
+        r'^-+', ''), # trim '-' from start of text
+      r'-+$', '') # trim '-' from end of text
+));
+
+CREATE TEMP FUNCTION isSearch(search_phrase STRING, URL STRING) RETURNS BOOL AS ((
+  SELECT LOGICAL_AND(STRPOS(URL, x) > 0 OR STRPOS(LOWER(URL), removeAccents(LOWER(x))) > 0) FROM UNNEST(SPLIT(search_phrase, ' ')) x
+));
+
+CREATE TEMP FUNCTION extractConfigSku(sku STRING) RETURNS STRING AS (
+  CASE WHEN (CHAR_LENGTH(sku) - CHAR_LENGTH(REGEXP_REPLACE(sku, r'-', '')) = 3) OR (CHAR_LENGTH(sku) - CHAR_LENGTH(REGEXP_REPLACE(sku, r'-', '')) = 1) THEN REGEXP_EXTRACT(sku, r'(.*)-[0-9A-Z]+')
+     ELSE sku END
+);
+
+CREATE TEMP FUNCTION processPurchases(skus_clicked ARRAY<STRING>, purchased_skus ARRAY<STRUCT<sku STRING, revenue FLOAT64> >) RETURNS FLOAT64 AS ((
+  SELECT SUM(revenue) FROM UNNEST(purchased_skus) WHERE EXISTS(SELECT 1 FROM UNNEST(skus_clicked) sku_clicked WHERE sku_clicked = sku)
+));
+
+CREATE TEMP FUNCTION buildFinalResult(hits ARRAY<STRUCT<search STRING, freq INT64, click INT64, net_revenue FLOAT64, bounce INT64>>, rvn FLOAT64) RETURNS STRUCT<search_data ARRAY<STRUCT<search STRING, freq INT64, clicks INT64, net_revenue FLOAT64, bounce INT64>>, search_flg INT64, net_search_flg INT64, search_rvn FLOAT64, net_search_rvn FLOAT64, u_conversion INT64, u_search_conversion INT64, net_clicks INT64> AS ((
+ # this solution is kinda ugly but we do so Datastudio can process final results reliably. 
+ STRUCT(ARRAY(SELECT AS STRUCT search, SUM(freq) AS freq, SUM(click) AS clicks, SUM(net_revenue) AS net_revenue, SUM(bounce) AS bounce FROM UNNEST(hits) GROUP BY search) AS data, CASE WHEN EXISTS(SELECT 1 FROM UNNEST(hits) WHERE freq > 0) THEN 1 END AS search_flg, CASE WHEN EXISTS(SELECT 1 FROM UNNEST(hits) WHERE net_revenue > 0) THEN 1 END AS net_search_flg, CASE WHEN EXISTS(SELECT 1 FROM UNNEST(hits) WHERE freq > 0) THEN rvn END AS search_rvn, (SELECT SUM(net_revenue) FROM UNNEST(hits)) AS net_search_rvn, IF(rvn > 0, 1, NULL) AS u_conversion, (CASE WHEN EXISTS(SELECT 1 FROM UNNEST(hits) WHERE freq > 0) AND rvn > 0 THEN 1 END) AS u_search_conversion, (SELECT SUM(click) FROM UNNEST(hits) WHERE freq > 0 and net_revenue > 0) AS net_clicks)
+));
+
+
+# Same as `search_kpis.sql` but slugs of search labels are read from the
+# search terms dimension table, kept by the job `update_search_terms`.
+# `slugify` only runs for labels missing from it. Labels inserted twice, such
+# as by concurrent runs of `update_search_terms`, are read only once.
+WITH sessions AS(
+  SELECT
+    fullvisitorid,
+    visitid,
+    date,
+    totals,
+    hits
+  FROM `{project_id}.{dataset_id}.{table_id}`
+  WHERE TRUE
+    AND REGEXP_EXTRACT(_TABLE_SUFFIX, r'.*_(\d+)') = '{date}'
+    AND EXISTS(SELECT 1 FROM UNNEST(hits) WHERE REGEXP_CONTAINS(page.hostname, r'{hostname}'))
+    AND NOT REGEXP_CONTAINS(LOWER(geonetwork.networklocation), r'{geonetworklocation}')
+),
+
+session_terms AS(
+  SELECT
+    fullvisitorid,
+    visitid,
+    ARRAY_AGG(STRUCT(raw_label, slug)) terms
+  FROM(
+    SELECT DISTINCT fullvisitorid, visitid, eventInfo.eventLabel raw_label
+    FROM sessions, UNNEST(hits)
+    WHERE eventInfo.eventCategory = 'search'
+  )
+  JOIN(
+    SELECT raw_label, ANY_VALUE(slug) slug
+    FROM `{terms_project_id}.{terms_dataset_id}.{terms_table_id}`
+    GROUP BY raw_label
+  ) USING(raw_label)
+  GROUP BY fullvisitorid, visitid
+)
+
+SELECT
+  date,
+  SUM(revenue) user_revenue,
+  buildFinalResult(ARRAY_CONCAT_AGG(hits), SUM(revenue)) results
+  FROM(
+    SELECT
+    fv,
+    date,
+    revenue,
+    ARRAY(SELECT AS STRUCT search, 1 AS freq, MAX(IF(sku_clicked IS NOT NULL, 1, 0)) click, processPurchases(ARRAY_AGG(DISTINCT sku_clicked IGNORE NULLS), products_purchased) net_revenue, MAX(bounce) bounce FROM UNNEST(hits) WHERE search IS NOT NULL GROUP BY search) hits
+    FROM(
+      SELECT
+         fv,
+         date,
+         revenue,
+         ARRAY(SELECT AS STRUCT FIRST_VALUE(slug) OVER (PARTITION BY flg ORDER BY hn) search, IF(isSearch(FIRST_VALUE(lbl) OVER (PARTITION BY flg ORDER BY hn), pp) AND EXISTS(SELECT 1 FROM UNNEST(product) WHERE isClick), ARRAY(SELECT productSku FROM UNNEST(product))[SAFE_OFFSET(0)], NULL) sku_clicked, IF(isSearch(FIRST_VALUE(lbl) OVER (PARTITION BY flg ORDER BY hn), pp) AND hn = MAX(hn) OVER(), 1, NULL) bounce FROM UNNEST(hits)) hits,
+         ARRAY(SELECT AS STRUCT extractConfigSku(productSku) sku, SUM(productQuantity * productPrice / 1e6) revenue FROM UNNEST(hits), UNNEST(product) WHERE act_type = '6' GROUP BY 1) products_purchased
+      FROM(
+        SELECT
+          fullvisitorid fv,
+          totals.totalTransactionRevenue / 1e6 revenue,
+          date,
+          ARRAY(SELECT AS STRUCT hitNumber hn, page.pagePath pp, eventInfo.eventCategory cat, IF(eventInfo.eventCategory = 'search', eventInfo.eventLabel, NULL) lbl, IF(eventInfo.eventCategory = 'search', COALESCE((SELECT slug FROM UNNEST(terms) WHERE raw_label = eventInfo.eventLabel), slugify(eventInfo.eventLabel)), NULL) slug, SUM(IF(eventInfo.eventCategory = 'search', 1, 0)) OVER(ORDER BY hitNumber) flg, ecommerceAction.action_type act_type, ARRAY(SELECT AS STRUCT productSku, isClick, productQuantity, productPrice FROM UNNEST(product)) product FROM UNNEST(hits)) hits
+        FROM sessions LEFT JOIN session_terms USING(fullvisitorid, visitid)
+      )
+    )
+  )
+GROUP BY fv, date
@@ -0,0 +1,11 @@
+#standardSQL
+# Approximate distinct visitors of each search from {start_date} to
+# {end_date}, merging the daily sketches saved by `search_sketches.sql`.
+# {sketches_source} is "sketches_table_id" with the date replaced by *.
+SELECT
+  search,
+  HLL_COUNT.MERGE(visitors) visitors
+FROM `{sketches_project_id}.{sketches_dataset_id}.{sketches_source}`
+WHERE _TABLE_SUFFIX BETWEEN '{start_date}' AND '{end_date}'
+GROUP BY search
+ORDER BY visitors DESC
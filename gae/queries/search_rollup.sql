@@ -0,0 +1,12 @@
+#standardSQL
+# Search KPIs summed over the days from {start_date} to {date}, used to
+# (re)build a rolling-window rollup.
+SELECT
+  d.search,
+  SUM(IFNULL(d.freq, 0)) freq,
+  SUM(IFNULL(d.clicks, 0)) clicks,
+  ROUND(SUM(IFNULL(d.net_revenue, 0)), 6) net_revenue,
+  SUM(IFNULL(d.bounce, 0)) bounce
+FROM `{dest_project_id}.{dest_dataset_id}.{source_table}`, UNNEST(results.search_data) d
+WHERE {date_column} BETWEEN '{start_date}' AND '{date}'
+GROUP BY d.search
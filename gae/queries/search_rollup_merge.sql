@@ -0,0 +1,26 @@
+#standardSQL
+# Moves a rolling-window rollup that ends the day before {date} to end at
+# it: adds search KPIs of {date} and subtracts those of {expired_date}, which
+# leaves the window.
+MERGE `{rollup_project_id}.{rollup_dataset_id}.{rollup_table}` T
+USING(
+  SELECT
+    d.search,
+    SUM(sign * IFNULL(d.freq, 0)) freq,
+    SUM(sign * IFNULL(d.clicks, 0)) clicks,
+    SUM(sign * IFNULL(d.net_revenue, 0)) net_revenue,
+    SUM(sign * IFNULL(d.bounce, 0)) bounce
+  FROM(
+    SELECT IF({date_column} = '{date}', 1, -1) sign, results
+    FROM `{dest_project_id}.{dest_dataset_id}.{source_table}`
+    WHERE {date_column} IN ('{date}', '{expired_date}')
+  ), UNNEST(results.search_data) d
+  GROUP BY d.search
+) S
+ON T.search = S.search
+WHEN MATCHED AND T.freq + S.freq <= 0 THEN
+  DELETE
+WHEN MATCHED THEN
+  UPDATE SET freq = T.freq + S.freq, clicks = T.clicks + S.clicks, net_revenue = ROUND(T.net_revenue + S.net_revenue, 6), bounce = T.bounce + S.bounce
+WHEN NOT MATCHED AND S.freq > 0 THEN
+  INSERT (search, freq, clicks, net_revenue, bounce) VALUES (S.search, S.freq, S.clicks, ROUND(S.net_revenue, 6), S.bounce)
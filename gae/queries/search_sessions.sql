@@ -0,0 +1,18 @@
+#standardSQL
+# Staging of `search_kpis_staged.sql`: sessions of {date} that pass the
+# hostname and network filters, with only the columns read by the KPIs.
+# Hits are kept only in sessions with search events as the others just add
+# to the revenue of their visitors.
+SELECT
+  fullvisitorid,
+  visitid,
+  date,
+  STRUCT(totals.totalTransactionRevenue) totals,
+  IF(EXISTS(SELECT 1 FROM UNNEST(hits) WHERE eventInfo.eventCategory = 'search'),
+    ARRAY(SELECT AS STRUCT hitNumber, STRUCT(page.pagePath) page, STRUCT(eventInfo.eventCategory, eventInfo.eventLabel) eventInfo, STRUCT(eCommerceAction.action_type) eCommerceAction, ARRAY(SELECT AS STRUCT productSku, isClick, productQuantity, productPrice FROM UNNEST(product)) product FROM UNNEST(hits)),
+    []) hits
+FROM `{project_id}.{dataset_id}.{table_id}`
+WHERE TRUE
+  AND REGEXP_EXTRACT(_TABLE_SUFFIX, r'.*_(\d+)') = '{date}'
+  AND EXISTS(SELECT 1 FROM UNNEST(hits) WHERE REGEXP_CONTAINS(page.hostname, r'{hostname}'))
+  AND NOT REGEXP_CONTAINS(LOWER(geonetwork.networklocation), r'{geonetworklocation}')
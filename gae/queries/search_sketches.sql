@@ -0,0 +1,56 @@
+#standardSQL
+CREATE TEMP FUNCTION removeAccents(phrase STRING) RETURNS STRING AS ((
+SELECT
+  REGEXP_REPLACE(
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(
+                REGEXP_REPLACE(phrase,
+                r'[àáâäåã]', 'a'),
+              r'[èéêëẽ]', 'e'),
+            r'[ìíîïĩ]', 'i'),
+          r'[òóôöøõ]', 'o'),
+        r'[ùúûüũ]', 'u'),
+      r'ç', 'c'),
+    r'ÿ', 'y'),
+  r'ñ', 'n')
+));
+
+CREATE TEMP FUNCTION slugify(phrase STRING) RETURNS STRING AS ((
+  SELECT 
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(removeAccents(LOWER(phrase)),
+                r'\s+', '-'), # replaces space with '-'
+              r'&', '-e-'), # replaces & with '-e-'
+            r'[^\w-]+', ''), # replaces non-word chars
+          r'--+', '-'), # replaces multiple '-' with single one
+        r'^-+', ''), # trim '-' from start of text
+      r'-+$', '') # trim '-' from end of text
+));
+
+# Sketches of distinct visitors that searched each slug in {date}, after the
+# same filters of `search_kpis.sql`. They are merged over any range of dates
+# by `search_reach.sql`.
+SELECT
+  slugify(hit.eventInfo.eventLabel) search,
+  HLL_COUNT.INIT(fullvisitorid) visitors
+FROM(
+  SELECT
+    fullvisitorid,
+    hits
+  FROM `{project_id}.{dataset_id}.{table_id}`
+  WHERE TRUE
+    AND REGEXP_EXTRACT(_TABLE_SUFFIX, r'.*_(\d+)') = '{date}'
+    AND EXISTS(SELECT 1 FROM UNNEST(hits) WHERE REGEXP_CONTAINS(page.hostname, r'{hostname}'))
+    AND NOT REGEXP_CONTAINS(LOWER(geonetwork.networklocation), r'{geonetworklocation}')
+), UNNEST(hits) hit
+WHERE hit.eventInfo.eventCategory = 'search'
+  AND slugify(hit.eventInfo.eventLabel) IS NOT NULL
+GROUP BY search
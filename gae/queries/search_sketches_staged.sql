@@ -0,0 +1,47 @@
+#standardSQL
+CREATE TEMP FUNCTION removeAccents(phrase STRING) RETURNS STRING AS ((
+SELECT
+  REGEXP_REPLACE(
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(
+                REGEXP_REPLACE(phrase,
+                r'[àáâäåã]', 'a'),
+              r'[èéêëẽ]', 'e'),
+            r'[ìíîïĩ]', 'i'),
+          r'[òóôöøõ]', 'o'),
+        r'[ùúûüũ]', 'u'),
+      r'ç', 'c'),
+    r'ÿ', 'y'),
+  r'ñ', 'n')
+));
+
+CREATE TEMP FUNCTION slugify(phrase STRING) RETURNS STRING AS ((
+  SELECT 
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(removeAccents(LOWER(phrase)),
+                r'\s+', '-'), # replaces space with '-'
+              r'&', '-e-'), # replaces & with '-e-'
+            r'[^\w-]+', ''), # replaces non-word chars
+          r'--+', '-'), # replaces multiple '-' with single one
+        r'^-+', ''), # trim '-' from start of text
+      r'-+$', '') # trim '-' from end of text
+));
+
+# Same as `search_sketches.sql` but reads the staging table of {date} saved
+# by `search_sessions.sql`, whose sessions already pass the hostname and
+# network filters, instead of scanning the GA export again.
+SELECT
+  slugify(hit.eventInfo.eventLabel) search,
+  HLL_COUNT.INIT(fullvisitorid) visitors
+FROM `{staging_project_id}.{staging_dataset_id}.{staging_table}`, UNNEST(hits) hit
+WHERE hit.eventInfo.eventCategory = 'search'
+  AND slugify(hit.eventInfo.eventLabel) IS NOT NULL
+GROUP BY search
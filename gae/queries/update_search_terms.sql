@@ -0,0 +1,46 @@
+#standardSQL
+# Inserts in the search terms dimension table the labels of search events of
+# {date} that are not there yet. Slugs follow the same rules as the UDFs
+# `removeAccents` and `slugify` of `search_kpis.sql`.
+INSERT INTO `{terms_project_id}.{terms_dataset_id}.{terms_table_id}` (raw_label, slug)
+SELECT
+  labels.raw_label,
+  REGEXP_REPLACE(
+    REGEXP_REPLACE(
+      REGEXP_REPLACE(
+        REGEXP_REPLACE(
+          REGEXP_REPLACE(
+            REGEXP_REPLACE(
+              REGEXP_REPLACE(
+                REGEXP_REPLACE(
+                  REGEXP_REPLACE(
+                    REGEXP_REPLACE(
+                      REGEXP_REPLACE(
+                        REGEXP_REPLACE(
+                          REGEXP_REPLACE(
+                            REGEXP_REPLACE(LOWER(labels.raw_label),
+                            r'[àáâäåã]', 'a'),
+                          r'[èéêëẽ]', 'e'),
+                        r'[ìíîïĩ]', 'i'),
+                      r'[òóôöøõ]', 'o'),
+                    r'[ùúûüũ]', 'u'),
+                  r'ç', 'c'),
+                r'ÿ', 'y'),
+              r'ñ', 'n'),
+            r'\s+', '-'),
+          r'&', '-e-'),
+        r'[^\w-]+', ''),
+      r'--+', '-'),
+    r'^-+', ''),
+  r'-+$', '') slug
+FROM(
+  SELECT DISTINCT eventInfo.eventLabel raw_label
+  FROM `{project_id}.{dataset_id}.{table_id}`, UNNEST(hits)
+  WHERE TRUE
+    AND REGEXP_EXTRACT(_TABLE_SUFFIX, r'.*_(\d+)') = '{date}'
+    AND eventInfo.eventCategory = 'search'
+    AND eventInfo.eventLabel IS NOT NULL
+) labels
+LEFT JOIN `{terms_project_id}.{terms_dataset_id}.{terms_table_id}` terms
+ON labels.raw_label = terms.raw_label
+WHERE terms.raw_label IS NULL
@@ -0,0 +1,108 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""State of rolling-window rollups of search KPIs. Each rollup moves one day
+at a time, adding the newest day and subtracting the one that leaves the
+window, so it must know which date it currently ends at."""
+
+
+from google.appengine.ext import ndb
+
+import utils
+
+
+class RollupState(ndb.Model):
+    """Last date included in the rollup of a window size.
+
+    Entities are keyed by window size, as there's one rollup table for each.
+    """
+    window = ndb.IntegerProperty(required=True)
+    end_date = ndb.StringProperty(required=True)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def build_key(cls, window):
+        """Builds key of entity for rollup of ``window`` days.
+
+        :type window: int
+        :param window: how many days the rollup sums.
+
+        :rtype: `ndb.Key`
+        :returns: key of entity.
+        """
+        return ndb.Key(cls, int(window))
+
+
+def plan_update(window, date, rebuild=False):
+    """Decides how the rollup of ``window`` days moves to end at ``date``.
+
+    :type window: int
+    :param window: how many days the rollup sums.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" the rollup should end at.
+
+    :type rebuild: bool
+    :param rebuild: if ``True`` sums the whole window again.
+
+    :rtype: tuple
+    :returns: action and date the rollup ends at after it. Action is "merge"
+              if rollup ends the day before ``date``, so only ``date`` is
+              added and the expired day subtracted; "rebuild" if it has no
+              state or has gaps, so the whole window is summed. Dates of a
+              range may finish out of order, so a ``date`` before the end of
+              the rollup but still inside its window also "rebuild"s it,
+              keeping its end date, as it was summed before ``date`` was
+              ready; ``None`` if ``date`` already left the window or the
+              rollup already ends at it.
+    """
+    state = RollupState.build_key(window).get()
+    if state is None or rebuild and state.end_date <= date:
+        return 'rebuild', date
+    if state.end_date == utils.shift_date(date, -1):
+        return 'merge', date
+    if state.end_date < date:
+        return 'rebuild', date
+    if state.end_date == date:
+        return None, date
+    if date > utils.shift_date(state.end_date, -window):
+        return 'rebuild', state.end_date
+    return None, state.end_date
+
+
+def save_state(window, date):
+    """Records that the rollup of ``window`` days now ends at ``date``.
+
+    :type window: int
+    :param window: how many days the rollup sums.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" of last day in rollup.
+
+    :rtype: `RollupState`
+    :returns: saved entity.
+    """
+    state = RollupState(key=RollupState.build_key(window), window=int(window),
+        end_date=date)
+    state.put()
+    return state
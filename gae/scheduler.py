@@ -24,10 +24,46 @@
 """Scheduler to run tasks in background in GAE."""
 
 
+import os
+import re
 import datetime
 
-from google.appengine.api import taskqueue
 import utils
+from startup import LazyModule
+# ndb and task queue are only loaded once a job is scheduled
+costs = LazyModule('costs')
+dag = LazyModule('dag')
+if os.environ.get('PHOENIX_BACKEND') == 'local':
+    from connector.local import LocalTaskQueue
+    taskqueue = LocalTaskQueue()
+else:
+    taskqueue = LazyModule('google.appengine.api.taskqueue')
+
+
+def enqueue_check(url, target, params, countdown, queue_name='default'):
+    """Enqueues a task that checks back on work started by another task,
+    such as a BigQuery job, so that it doesn't wait for it.
+
+    :type url: str
+    :param url: url to trigger for task call.
+
+    :type target: str
+    :param target: name of service to trigger.
+
+    :type params: dict
+    :param params: arguments of task.
+
+    :type countdown: int
+    :param countdown: seconds to wait before running task.
+
+    :type queue_name: str
+    :param queue_name: queue of task, as defined in `queue.yaml`.
+
+    :rtype: `taskqueue.Task`
+    :returns: enqueued task.
+    """
+    return taskqueue.add(url=url, target=target, params=params,
+        countdown=countdown, queue_name=queue_name)
 
 
 class SchedulerJob(object):
@@ -42,25 +78,373 @@ class SchedulerJob(object):
     
     def __init__(self, url, target):
         self.task = None
+        self.skipped = []
         self.url = url 
         self.target = target
 
+    @property
+    def job_name(self):
+        """Name of job, built from `self.url`."""
+        return self.url.strip('/').replace('/', '_')
+
+    def task_name(self, date, rerun=None):
+        """Builds the name of the task that processes ``date`` so that the
+        queue refuses to enqueue the same job and date twice.
+
+        :type date: str
+        :param date: date the task processes.
+
+        :type rerun: str
+        :param rerun: token to force a new task for an already enqueued
+                      date.
+
+        :rtype: str
+        :returns: task name.
+        """
+        name = '{}-{}'.format(self.job_name, date)
+        if rerun:
+            name += '-' + re.sub(r'[^a-zA-Z0-9_-]', '', rerun)
+        return name
+
     def run(self, args): 
-        """Executes the specified job in `self.url` and `self.target`.
+        """Executes the specified job in `self.url` and `self.target`. Tasks
+        are named after job and date; if it has already been enqueued then
+        nothing is done and its name is kept in `self.skipped`.
 
         :type args: dict
         :param args: dictionary with arguments to setup the job, such as which
-                     `date` to process data and so on.
+                     `date` to process data and so on. If `date` is not
+                     sent then yesterday is used.
 
         :raises ValueError: on `self.url` and `self.target` being False.
         """
         if not (self.url and self.target):
             raise ValueError("Please specify `URL` and `target`")
-        task = taskqueue.add(url=self.url, target=self.target,
-            params=args)
-        self.task = task
+        date = args.get('date') or utils.yesterday_date().strftime("%Y%m%d")
+        name = self.task_name(date, args.get('rerun'))
+        try:
+            self.task = taskqueue.add(url=self.url, target=self.target,
+                name=name, params=dict(args.items() + [('date', date)]))
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            self.skipped.append(name)
+
+    def dates(self, args):
+        """Dates a run with ``args`` processes.
+
+        :type args: dict
+        :param args: same arguments used in `run`.
+
+        :rtype: list
+        :returns: date strings in format "%Y%m%d".
+        """
+        return [utils.process_url_date(args.get('date')) or
+                utils.yesterday_date().strftime("%Y%m%d")]
+
+    def forecast(self, args):
+        """Estimates bytes processed by running the job with ``args``,
+        without enqueueing anything.
+
+        :type args: dict
+        :param args: same arguments used in `run`.
+
+        :rtype: dict
+        :returns: forecast as described in `costs.forecast_cost`.
+        """
+        return costs.forecast_cost(self.job_name, self.dates(args))
 
     def __str__(self):
+        if self.skipped:
+            return "Task {} already enqueued".format(self.skipped[0])
         if not self.task:
             return 'No task has been enqueued so far'
         return "Task {} enqued, ETA {}".format(self.task.name, self.task.eta) 
+
+
+class BackfillSchedulerJob(SchedulerJob):
+    """Job that enqueues one task per date in a range of dates.
+
+    Tasks are added in batches of up to `taskqueue.MAX_TASKS_PER_ADD` and
+    their countdowns are spread by ``countdown`` seconds so the worker
+    receives dates at a steady pace instead of all of them at once.
+
+    :type url: str
+    :param url: url to trigger for task call.
+
+    :type target: str
+    :param target: name of service to trigger when running background tasks.
+
+    :type countdown: int
+    :param countdown: seconds between the ETAs of two consecutive dates.
+
+    :type queue_name: str
+    :param queue_name: name of queue where tasks are added.
+    """
+    def __init__(self, url, target, countdown=60, queue_name='default'):
+        super(BackfillSchedulerJob, self).__init__(url, target)
+        self.countdown = countdown
+        self.queue_name = queue_name
+        self.tasks = []
+
+    def run(self, args):
+        """Enqueues tasks for each date between ``args['from']`` and
+        ``args['to']``.
+
+        :type args: dict
+        :param args: dictionary with arguments to setup the job, it must
+                     contain `from` and `to` dates in format "%Y%m%d". Other
+                     keys are sent along to each task. Dates whose task has
+                     already been enqueued are kept in `self.skipped`.
+
+        :raises ValueError: on `self.url` and `self.target` being False or
+                            on invalid range of dates.
+        """
+        if not (self.url and self.target):
+            raise ValueError("Please specify `URL` and `target`")
+        dates = self.dates(args)
+        params = dict((key, value) for key, value in args.items() if key not
+            in ('from', 'to'))
+        tasks = [taskqueue.Task(url=self.url, target=self.target,
+            name=self.task_name(date, args.get('rerun')),
+            countdown=i * self.countdown,
+            params=dict(params.items() + [('date', date)]))
+            for i, date in enumerate(dates)]
+
+        queue = taskqueue.Queue(self.queue_name)
+        for i in range(0, len(tasks), taskqueue.MAX_TASKS_PER_ADD):
+            batch = tasks[i: i + taskqueue.MAX_TASKS_PER_ADD]
+            try:
+                queue.add(batch)
+            except (taskqueue.TaskAlreadyExistsError,
+                    taskqueue.TombstonedTaskError):
+                # all other tasks of the batch are still added
+                pass
+            self.tasks.extend(task for task in batch if task.was_enqueued)
+            self.skipped.extend(task.name for task in batch if not
+                task.was_enqueued)
+        if self.tasks:
+            self.task = self.tasks[-1]
+
+    def dates(self, args):
+        """Dates a run with ``args`` processes.
+
+        :type args: dict
+        :param args: same arguments used in `run`.
+
+        :rtype: list
+        :returns: date strings in format "%Y%m%d".
+        """
+        if not (args.get('from') and args.get('to')):
+            raise ValueError("Please specify `from` and `to` dates")
+        return utils.date_range(args.get('from'), args.get('to'))
+
+    def __str__(self):
+        if not self.tasks:
+            return 'No task has been enqueued so far'
+        return "{} tasks enqued, {} already enqueued, last ETA {}".format(
+            len(self.tasks), len(self.skipped), self.task.eta)
+
+
+class DagSchedulerJob(SchedulerJob):
+    """Job made of nodes that depend on each other. Running it enqueues the
+    nodes without upstream nodes; each node, once its task finishes, calls
+    `complete` which enqueues the downstream nodes whose upstream nodes are
+    all done. Independent nodes and dates therefore run in parallel, up to
+    the concurrency of the queue of each node as set in `queue.yaml`.
+
+    Nodes already done for a date, see `dag.NodeRun`, are not enqueued
+    again unless a new `rerun` token is sent.
+
+    :type name: str
+    :param name: name of DAG, as defined in `JobsFactory`.
+
+    :type target: str
+    :param target: name of service to trigger when running background tasks.
+
+    :type nodes: dict
+    :param nodes: nodes names and their setup: `url` of its task, names of
+                  `upstream` nodes and optionally `queue_name`, defaults to
+                  "default".
+
+    :raises ValueError: if nodes depend on unknown nodes or on themselves.
+    """
+    def __init__(self, name, target, nodes):
+        super(DagSchedulerJob, self).__init__(None, target)
+        self.name = name
+        self.nodes = nodes
+        self.order = self._sort_nodes(nodes)
+        self.tasks = []
+
+    @staticmethod
+    def _sort_nodes(nodes):
+        """Sorts nodes so that each one comes after its upstream nodes.
+
+        :type nodes: dict
+        :param nodes: nodes of DAG.
+
+        :raises ValueError: if nodes depend on unknown nodes or on
+                            themselves.
+
+        :rtype: list
+        :returns: names of nodes.
+        """
+        order = []
+        pending = dict((node, set(setup.get('upstream', []))) for node, setup
+            in nodes.items())
+        for node, upstream in pending.items():
+            if upstream - set(nodes):
+                raise ValueError("node {} depends on unknown nodes {}".format(
+                    node, sorted(upstream - set(nodes))))
+        while pending:
+            ready = sorted(node for node, upstream in pending.items() if not
+                upstream - set(order))
+            if not ready:
+                raise ValueError("nodes {} have cyclic dependencies".format(
+                    sorted(pending)))
+            order.extend(ready)
+            for node in ready:
+                del pending[node]
+        return order
+
+    @property
+    def job_name(self):
+        """Name of job, same as the DAG."""
+        return self.name
+
+    def downstream(self, node):
+        """Nodes that depend directly on ``node``.
+
+        :type node: str
+        :param node: name of node in DAG.
+
+        :rtype: list
+        :returns: names of nodes.
+        """
+        return [name for name in self.order if node in self.nodes[name].get(
+            'upstream', [])]
+
+    def node_task_name(self, node, date, rerun=None):
+        """Builds the name of the task that runs ``node`` for ``date``.
+
+        :type node: str
+        :param node: name of node in DAG.
+
+        :type date: str
+        :param date: date the task processes.
+
+        :type rerun: str
+        :param rerun: token to force a new task for an already enqueued
+                      date.
+
+        :rtype: str
+        :returns: task name.
+        """
+        name = '{}-{}-{}'.format(self.name, node, date)
+        if rerun:
+            name += '-' + re.sub(r'[^a-zA-Z0-9_-]', '', rerun)
+        return name
+
+    def run(self, args):
+        """Enqueues the nodes without upstream nodes for each date.
+
+        :type args: dict
+        :param args: arguments sent to every node, such as `date` or `from`
+                     and `to` dates for a range. If none is sent then
+                     yesterday is used.
+
+        :raises ValueError: on `self.target` being False or on invalid range
+                            of dates.
+        """
+        if not self.target:
+            raise ValueError("Please specify `target`")
+        params = dict((key, value) for key, value in args.items() if key not
+            in ('from', 'to', 'date'))
+        for date in self.dates(args):
+            for node in self.order:
+                if not self.nodes[node].get('upstream'):
+                    self.enqueue(node, dict(params.items() + [('date',
+                        date)]))
+
+    def complete(self, node, args):
+        """Marks ``node`` as done and enqueues its downstream nodes that are
+        ready to run.
+
+        :type node: str
+        :param node: name of node that finished.
+
+        :type args: dict
+        :param args: arguments of the task that ran ``node``, with `date`.
+        """
+        date, rerun = args['date'], args.get('rerun')
+        dag.mark_done(self.name, node, date, rerun)
+        params = dict((key, value) for key, value in args.items() if key not
+            in ('dag', 'node'))
+        for child in self.downstream(node):
+            upstream = self.nodes[child]['upstream']
+            if dag.done_nodes(self.name, upstream, date, rerun) == set(
+                upstream):
+                self.enqueue(child, params)
+
+    def enqueue(self, node, args):
+        """Adds the task of ``node`` to its queue, unless it's already done
+        or enqueued for the date in ``args``.
+
+        :type node: str
+        :param node: name of node in DAG.
+
+        :type args: dict
+        :param args: arguments of task, with `date`.
+        """
+        date, rerun = args['date'], args.get('rerun')
+        name = self.node_task_name(node, date, rerun)
+        if dag.done_nodes(self.name, [node], date, rerun):
+            self.skipped.append(name)
+            return
+        task = taskqueue.Task(url=self.nodes[node]['url'],
+            target=self.target, name=name, params=dict(args.items() + [
+            ('dag', self.name), ('node', node)]))
+        try:
+            taskqueue.Queue(self.nodes[node].get('queue_name',
+                'default')).add(task)
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            self.skipped.append(name)
+            return
+        self.tasks.append(task)
+        self.task = task
+
+    def dates(self, args):
+        """Dates a run with ``args`` processes.
+
+        :type args: dict
+        :param args: same arguments used in `run`.
+
+        :rtype: list
+        :returns: date strings in format "%Y%m%d".
+        """
+        if not (args.get('from') or args.get('to')):
+            return super(DagSchedulerJob, self).dates(args)
+        if not (args.get('from') and args.get('to')):
+            raise ValueError("Please specify `from` and `to` dates")
+        return utils.date_range(args.get('from'), args.get('to'))
+
+    def forecast(self, args):
+        """Estimates bytes processed by each node running with ``args``.
+
+        :type args: dict
+        :param args: same arguments used in `run`.
+
+        :rtype: dict
+        :returns: forecast of each node as described in
+                  `costs.forecast_cost`.
+        """
+        dates = self.dates(args)
+        return dict((node, costs.forecast_cost(SchedulerJob(setup['url'],
+            self.target).job_name, dates)) for node, setup in
+            self.nodes.items())
+
+    def __str__(self):
+        if not self.tasks:
+            return 'No task has been enqueued so far'
+        return "{} tasks enqued, {} already done or enqueued".format(
+            len(self.tasks), len(self.skipped))
@@ -0,0 +1,255 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Reads the search KPIs saved by `update_dashboard_tables` for a range of
+dates so that consumers don't query the daily tables themselves.
+
+Results are kept in an in-process cache with time to live and, when many
+requests ask for the same KPIs at once, only one of them queries BigQuery
+while the others wait for its results."""
+
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import utils
+import slugs
+from config import config
+from connector.gcp import GCPService
+
+
+# columns selected by `queries/search_kpis_read.sql`, in order
+KPI_FIELDS = [('search', unicode), ('freq', int), ('clicks', int),
+    ('net_revenue', float), ('bounce', int)]
+
+_gcp_service = None
+
+
+class TTLCache(object):
+    """Least recently used cache whose entries also expire after a while.
+    Safe to share among the threads of an instance.
+
+    :type maxsize: int
+    :param maxsize: maximum number of entries kept.
+
+    :type ttl: float
+    :param ttl: seconds an entry is valid for.
+
+    :type timer: function
+    :param timer: returns current time in seconds.
+    """
+    def __init__(self, maxsize=256, ttl=600, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.stats = {'hits': 0, 'misses': 0}
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Reads entry of ``key``, marking it as recently used.
+
+        :rtype: object
+        :returns: value of entry or ``None`` if it's missing or expired.
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] <= self.timer():
+                self.stats['misses'] += 1
+                return None
+            self._data[key] = entry
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Saves ``value`` in ``key``, evicting the least recently used
+        entries above `maxsize`."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self.timer() + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._data.clear()
+
+
+class _Call(object):
+    """Call in progress of `SingleFlight`."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Collapses concurrent calls with the same key into one execution."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Runs ``func`` unless a call with ``key`` is already running, in
+        which case its result is waited for and returned instead.
+
+        :type key: object
+        :param key: identifies calls that return the same result.
+
+        :type func: function
+        :param func: called without arguments.
+
+        :raises Exception: whatever ``func`` raised, for every caller.
+
+        :returns: result of ``func``.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+setup = config['jobs'].get('search_kpis', {})
+cache = TTLCache(setup.get('cache_size', 256), setup.get('cache_ttl', 600))
+flights = SingleFlight()
+
+
+def gcp_service():
+    """Builds the service used to query BigQuery on first use, so that
+    instances don't load credentials before a read arrives.
+
+    :rtype: `connector.gcp.GCPService`
+    """
+    global _gcp_service
+    if _gcp_service is None:
+        _gcp_service = GCPService()
+    return _gcp_service
+
+
+def normalize_query(args):
+    """Validates and normalizes arguments of a read so that equivalent
+    requests share the same cache entry.
+
+    :type args: dict
+    :param args: `from` and `to` dates in format "%Y%m%d", both yesterday
+                 if not sent, and `search` as typed by customers or as a
+                 slug.
+
+    :raises ValueError: if dates are invalid, out of order or span more
+                        than `max_days`.
+
+    :rtype: tuple
+    :returns: first date, last date and slug of search, empty if all
+              searches are read.
+    """
+    end_date = (utils.process_url_date(args.get('to')) or
+        utils.yesterday_date().strftime("%Y%m%d"))
+    start_date = utils.process_url_date(args.get('from')) or end_date
+    if start_date > end_date:
+        raise ValueError("from {} is after to {}".format(start_date,
+            end_date))
+    max_days = setup.get('max_days', 90)
+    if utils.shift_date(start_date, max_days) <= end_date:
+        raise ValueError("at most {} days can be read".format(max_days))
+    return start_date, end_date, slugs.slugify(args.get('search')) or ''
+
+
+def query_kpis(start_date, end_date, search):
+    """Queries the KPIs of each search from ``start_date`` to
+    ``end_date``.
+
+    :type start_date: str
+    :param start_date: first date, in format "%Y%m%d".
+
+    :type end_date: str
+    :param end_date: last date, in format "%Y%m%d".
+
+    :type search: str
+    :param search: slug of search to read, empty to read all of them.
+
+    :raises RuntimeError: if query fails.
+
+    :rtype: list
+    :returns: KPIs of each search, most frequent first.
+    """
+    source_setup = config['jobs']['update_dashboard_tables']
+    source_table, date_column, date_format = utils.source_table(source_setup)
+    body = utils.read_query_job_body(**dict(source_setup.items() +
+        setup.items() + [('source_table', source_table),
+        ('date_column', date_column),
+        ('start_date', utils.format_date(start_date, date_format)),
+        ('end_date', utils.format_date(end_date, date_format)),
+        ('search', search)]))
+    bigquery = gcp_service().bigquery
+    job = next(bigquery.poll_jobs([bigquery.execute_job(
+        setup['project_id'], body)]))
+    if 'errorResult' in job['status']:
+        raise RuntimeError(job['status']['errorResult'])
+    table = job['configuration']['query']['destinationTable']
+    return [dict((name, None if cell['v'] is None else type_(cell['v']))
+        for (name, type_), cell in zip(KPI_FIELDS, row['f'])) for row in
+        bigquery.list_rows(table['projectId'], table['datasetId'],
+        table['tableId'])]
+
+
+def read_kpis(start_date, end_date, search):
+    """Reads KPIs as in `query_kpis`, from cache when possible.
+
+    :rtype: tuple
+    :returns: ETag of results and results serialized as JSON.
+    """
+    key = (start_date, end_date, search)
+    result = cache.get(key)
+    if result is None:
+        result = flights.do(key, lambda: cache.get(key) or _fetch(key))
+    return result
+
+
+def _fetch(key):
+    """Queries KPIs of ``key`` and saves them in cache."""
+    payload = json.dumps({'from': key[0], 'to': key[1],
+        'search': key[2] or None, 'kpis': query_kpis(*key)}, sort_keys=True)
+    result = (hashlib.sha1(payload).hexdigest(), payload)
+    cache.set(key, result)
+    return result
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Canonicalization of search phrases, with the same rules as the UDFs
+`removeAccents` and `slugify` of ``queries/search_kpis.sql``.
+
+Rules run as translation tables instead of chains of regexes. BigQuery
+regexes are ASCII only, so ``\s`` is ``[\t\n\f\r ]`` and ``\w`` is
+``[0-9A-Za-z_]``, and these are the sets used here.
+"""
+
+
+import sys
+import json
+import string
+import threading
+from collections import OrderedDict
+
+
+ACCENTS = [(u'àáâäåã', u'a'), (u'èéêëẽ', u'e'), (u'ìíîïĩ', u'i'),
+           (u'òóôöøõ', u'o'), (u'ùúûüũ', u'u'), (u'ç', u'c'), (u'ÿ', u'y'),
+           (u'ñ', u'n')]
+
+ACCENTS_TABLE = dict((ord(char), replacement) for chars, replacement in
+    ACCENTS for char in chars)
+
+SLUG_TABLE = dict(ACCENTS_TABLE.items() + [(ord(char), u'-') for char in
+    u'\t\n\f\r '] + [(ord(u'&'), u'-e-')])
+
+NON_WORD_CHARS = ''.join(chr(i) for i in range(128) if chr(i) not in
+    string.ascii_letters + string.digits + '_-')
+
+LOOKUP_SCHEMA = [{'name': 'raw_label', 'type': 'STRING', 'mode': 'REQUIRED'},
+                 {'name': 'slug', 'type': 'STRING', 'mode': 'NULLABLE'}]
+
+
+def _to_unicode(phrase):
+    return phrase.decode('utf-8') if isinstance(phrase, str) else phrase
+
+
+def remove_accents(phrase):
+    """Same as `removeAccents` UDF, only lower case letters are replaced.
+
+    :type phrase: str
+    :param phrase: text to have its accents removed.
+
+    :rtype: unicode
+    :returns: ``phrase`` without accents or None if it's None.
+    """
+    if phrase is None:
+        return None
+    return _to_unicode(phrase).translate(ACCENTS_TABLE)
+
+
+def slugify(phrase):
+    """Same as `slugify` UDF.
+
+    Characters out of ``\w`` are either non ASCII, which are dropped when
+    encoding, or removed with ``str.translate``; splitting on "-" then
+    merges repeated dashes and trims them from both ends.
+
+    :type phrase: str
+    :param phrase: search phrase typed by customers.
+
+    :rtype: str
+    :returns: slug of ``phrase`` or None if it's None.
+    """
+    if phrase is None:
+        return None
+    phrase = (_to_unicode(phrase).lower().translate(SLUG_TABLE)
+        .encode('ascii', 'ignore').translate(None, NON_WORD_CHARS))
+    return '-'.join(part for part in phrase.split('-') if part)
+
+
+class Slugifier(object):
+    """Slugifies phrases keeping the most recent ones in memory, as the same
+    searches are repeated all the time.
+
+    :type cache_size: int
+    :param cache_size: maximum number of phrases kept in memory.
+    """
+    def __init__(self, cache_size=100000):
+        self.cache_size = cache_size
+        self.stats = {'hits': 0, 'misses': 0}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def slugify(self, phrase):
+        """Same as `slugify` but reading from cache first.
+
+        :type phrase: str
+        :param phrase: search phrase typed by customers.
+
+        :rtype: str
+        :returns: slug of ``phrase``.
+        """
+        with self._lock:
+            if phrase in self._cache:
+                slug = self._cache.pop(phrase)
+                self._cache[phrase] = slug
+                self.stats['hits'] += 1
+                return slug
+        slug = slugify(phrase)
+        with self._lock:
+            self._cache[phrase] = slug
+            self.stats['misses'] += 1
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return slug
+
+    def bulk(self, phrases):
+        """Slugifies all ``phrases`` computing each distinct one only once.
+
+        :type phrases: iterable
+        :param phrases: search phrases, None values are allowed.
+
+        :rtype: list
+        :returns: slug of each phrase, in the same order.
+        """
+        slugs = {}
+        results = []
+        for phrase in phrases:
+            if phrase not in slugs:
+                slugs[phrase] = self.slugify(phrase)
+            results.append(slugs[phrase])
+        return results
+
+    def clear(self):
+        """Removes all phrases from cache."""
+        with self._lock:
+            self._cache.clear()
+
+
+slugifier = Slugifier()
+
+
+def dump_lookup_table(labels, f, slugifier=slugifier):
+    """Writes each distinct label and its slug as newline delimited JSON,
+    ready to be loaded in BigQuery with schema `LOOKUP_SCHEMA`.
+
+    :type labels: iterable
+    :param labels: raw labels of search events.
+
+    :type f: file
+    :param f: file where rows are written to.
+
+    :type slugifier: `Slugifier`
+    :param slugifier: used to compute slugs.
+
+    :rtype: int
+    :returns: how many rows were written.
+    """
+    seen = set()
+    for label in labels:
+        label = _to_unicode(label)
+        if label is None or label in seen:
+            continue
+        seen.add(label)
+        f.write(json.dumps({'raw_label': label,
+            'slug': slugifier.slugify(label)}) + '\n')
+    return len(seen)
+
+
+if __name__ == '__main__':
+    # usage: python slugs.py < labels.txt > lookup.json
+    dump_lookup_table((line.rstrip('\r\n') for line in sys.stdin),
+        sys.stdout)
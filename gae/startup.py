@@ -0,0 +1,165 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Tools to measure and cut the time services take to start.
+
+Set environment variable `PHOENIX_PROFILE_IMPORTS` in the yaml of a service
+so that `appengine_config` installs `profiler` before the app is imported;
+its report of the slowest imports is then logged once the app is loaded.
+It's also available from the command line, run from `gae/` folder::
+
+    python startup.py main worker
+"""
+
+
+import sys
+import json
+import time
+import logging
+import importlib
+import __builtin__
+
+
+class LazyModule(object):
+    """Module that is only imported on first access to one of its
+    attributes, so heavy dependencies don't slow down the start of services
+    that may never use them.
+
+    :type name: str
+    :param name: absolute name of module, such as
+                 "googleapiclient.discovery".
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __repr__(self):
+        return "<lazy module '{}'{}>".format(self._name, '' if
+            self._module is None else ' (loaded)')
+
+
+class ImportProfiler(object):
+    """Measures how long each module takes to be imported by wrapping
+    `__import__`. Each record has the `cumulative_ms`, which includes the
+    modules it imports, and the `self_ms` spent in the module itself.
+    """
+    def __init__(self):
+        self.records = {}
+        self.installed = False
+        self._import = None
+        self._children = []
+
+    def install(self):
+        """Starts recording imports."""
+        if self.installed:
+            return
+        self._import = __builtin__.__import__
+        __builtin__.__import__ = self._profiled_import
+        self.installed = True
+
+    def uninstall(self):
+        """Stops recording imports."""
+        if not self.installed:
+            return
+        __builtin__.__import__ = self._import
+        self.installed = False
+
+    def _profiled_import(self, name, *args, **kwargs):
+        loaded = set(sys.modules)
+        self._children.append(0.)
+        start = time.time()
+        try:
+            return self._import(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            new_modules = set(sys.modules) - loaded
+            if new_modules:
+                # implicit relative imports are loaded with their package
+                candidates = [module for module in new_modules if module ==
+                    name or module.endswith('.' + name)]
+                module = min(candidates, key=len) if candidates else name
+                self.records[module] = {
+                    'module': module,
+                    'cumulative_ms': round(elapsed * 1000, 2),
+                    'self_ms': round((elapsed - children) * 1000, 2)}
+
+    def report(self, limit=20, key='cumulative_ms'):
+        """Slowest imports recorded so far.
+
+        :type limit: int
+        :param limit: how many modules to return.
+
+        :type key: str
+        :param key: either "cumulative_ms" or "self_ms", to sort modules.
+
+        :rtype: list
+        :returns: records of slowest modules.
+        """
+        return sorted(self.records.values(), key=lambda r: r[key],
+            reverse=True)[:limit]
+
+    def log(self, service, limit=20):
+        """Logs report of slowest imports if profiler is installed.
+
+        :type service: str
+        :param service: name of service that finished loading.
+
+        :type limit: int
+        :param limit: how many modules to log.
+        """
+        if self.installed:
+            logging.info("slowest imports of %s: %s", service,
+                json.dumps(self.report(limit)))
+
+
+profiler = ImportProfiler()
+
+
+if __name__ == '__main__':
+    report = {}
+    for service in sys.argv[1:] or ['main']:
+        profiler.records = {}
+        profiler.install()
+        start = time.time()
+        importlib.import_module(service)
+        report[service] = {'total_ms': round((time.time() - start) * 1000,
+            2), 'slowest': profiler.report(10)}
+        profiler.uninstall()
+    print json.dumps(report, indent=2)
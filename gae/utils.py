@@ -25,8 +25,15 @@
 
 
 import datetime
-import uuid
 import time
+import re
+import json
+import hashlib
+import os
+import string
+import logging
+import threading
+from collections import OrderedDict
 
 
 def yesterday_date():
@@ -39,6 +46,93 @@ def yesterday_date():
              datetime.timedelta(days=-1))
 
 
+def date_range(start, end):
+    """Builds every date between ``start`` and ``end``, both inclusive.
+
+    :type start: str
+    :param start: first date, in format "%Y%m%d".
+
+    :type end: str
+    :param end: last date, in format "%Y%m%d".
+
+    :raises: `ValueError` if ``start`` comes after ``end`` or if any of them
+             is not in format "%Y%m%d".
+
+    :rtype: list
+    :returns: list of date strings in format "%Y%m%d".
+    """
+    start_dt = datetime.datetime.strptime(start, "%Y%m%d")
+    end_dt = datetime.datetime.strptime(end, "%Y%m%d")
+    if start_dt > end_dt:
+        raise ValueError("`from` date must not be greater than `to` date")
+    return [(start_dt + datetime.timedelta(days=i)).strftime("%Y%m%d")
+            for i in range((end_dt - start_dt).days + 1)]
+
+
+def shift_date(date, days):
+    """Moves ``date`` by ``days``.
+
+    :type date: str
+    :param date: date in format "%Y%m%d".
+
+    :type days: int
+    :param days: how many days to add, negative values go back in time.
+
+    :rtype: str
+    :returns: shifted date in format "%Y%m%d".
+    """
+    return (datetime.datetime.strptime(date, "%Y%m%d") +
+        datetime.timedelta(days=days)).strftime("%Y%m%d")
+
+
+def build_job_id(job_name, date, configuration, rerun=None):
+    """Builds a deterministic id for a BigQuery job so that running it again
+    for the same date and configuration attaches to the previous execution
+    instead of submitting a new one.
+
+    :type job_name: str
+    :param job_name: name of job as defined in `JobsFactory`.
+
+    :type date: str
+    :param date: date in format "%Y%m%d" the job processes.
+
+    :type configuration: dict
+    :param configuration: job configuration, including the query.
+
+    :type rerun: str
+    :param rerun: token to force a new execution of an already run job.
+
+    :rtype: str
+    :returns: job id made of job name, date, hash of configuration and
+              ``rerun`` token if any.
+    """
+    digest = hashlib.sha1(json.dumps(configuration,
+        sort_keys=True)).hexdigest()[:16]
+    job_id = '{}_{}_{}'.format(job_name, date, digest)
+    if rerun:
+        job_id += '_' + re.sub(r'[^a-zA-Z0-9_-]', '', rerun)
+    return job_id
+
+
+def source_table(setup):
+    """Daily results of search KPIs and the column that tells their date.
+
+    :type setup: dict
+    :param setup: configuration of `update_dashboard_tables` job.
+
+    :rtype: tuple
+    :returns: table_id to query in destination dataset of ``setup``, the
+              column to filter by date and the format of dates compared to
+              it. That's the wildcard suffix if results are saved in one
+              table per day, else the partitioning column, so that filters
+              prune the partitions that are not read.
+    """
+    if setup.get('output_mode') == 'partitioned':
+        return (setup['dest_partition_table_id'], setup.get(
+            'partition_field', '_PARTITIONDATE'), "%Y-%m-%d")
+    return setup['dest_table_id'].format('*'), '_TABLE_SUFFIX', "%Y%m%d"
+
+
 def search_query_job_body(**kwargs):
     """Returns the body to be used in a query job.
 
@@ -67,13 +161,49 @@ def search_query_job_body(**kwargs):
       :type destination.project_id: str
       :param destination.project_id: project_id where results should be saved.
 
+      :type job_name: str
+      :param job_name: used to build job id, defaults to "search".
+
+      :type rerun: str
+      :param rerun: token sent to force a new execution for `date`, see
+                    `build_job_id`.
+
+      :type maximum_bytes_billed: int
+      :param maximum_bytes_billed: jobs that would bill more bytes than this
+                                   fail without cost, defaults to 100 GBs.
+
+      :type output_mode: str
+      :param output_mode: either "sharded" (default), which saves results in
+                          one table per date named after `dest_table_id`,
+                          or "partitioned", which overwrites the date
+                          partition of `dest_partition_table_id`.
+
+      :type dest_partition_table_id: str
+      :param dest_partition_table_id: partitioned table where results are
+                                      saved in "partitioned" mode.
+
+      :type partition_field: str
+      :param partition_field: column used to partition the table. If not
+                              set, table is partitioned by ingestion date.
+
+      :type clustering_fields: list
+      :param clustering_fields: top level columns used to cluster the
+                                partitioned table.
+
+      :type total_days: int
+      :param total_days: partitions expire ``1 + total_days`` days after
+                         their date.
+
+      :type write_disposition: str
+      :param write_disposition: what to do if destination table already
+                                exists, such as "WRITE_TRUNCATE".
+
     :rtype: dict
     :returns: dict containing body to setup job execution.
     """
     query = load_file_content(**kwargs)
-    return {'jobReference': {
-                'projectId': kwargs['project_id'],
-                'jobId': str(uuid.uuid4())
+    body = {'jobReference': {
+                'projectId': kwargs['project_id']
                 },
             'configuration': {
                 'query': {
@@ -83,16 +213,316 @@ def search_query_job_body(**kwargs):
                             kwargs['date']),
                         'projectId': kwargs['dest_project_id']
                          },
-                    'maximumBytesBilled': 100000000000, #100 GBs max is allowed
+                    'maximumBytesBilled': kwargs.get('maximum_bytes_billed',
+                        100000000000), #100 GBs max is allowed by default
                     'query': query,
                     'useLegacySql': False
                     }
                 }
             }
+    if kwargs.get('output_mode') == 'partitioned':
+        query_config = body['configuration']['query']
+        query_config['destinationTable']['tableId'] = '{}${}'.format(
+            kwargs['dest_partition_table_id'], kwargs['date'])
+        query_config['writeDisposition'] = 'WRITE_TRUNCATE'
+        query_config['timePartitioning'] = {'type': 'DAY',
+            'expirationMs': str((1 + kwargs['total_days']) * 86400000)}
+        if kwargs.get('partition_field'):
+            query_config['timePartitioning']['field'] = kwargs[
+                'partition_field']
+        if kwargs.get('clustering_fields'):
+            query_config['clustering'] = {'fields': list(kwargs[
+                'clustering_fields'])}
+    if kwargs.get('write_disposition'):
+        body['configuration']['query']['writeDisposition'] = kwargs[
+            'write_disposition']
+    body['jobReference']['jobId'] = build_job_id(kwargs.get('job_name',
+        'search'), kwargs['date'], body['configuration'], kwargs.get('rerun'))
+    return body
+
+
+def dml_query_job_body(**kwargs):
+    """Returns the body of a query job running a DML statement, such as an
+    ``INSERT``, which writes to the tables referenced in the query itself.
+
+    :type kwargs:
+      :type date: str
+      :param date: date to format query period.
+
+      :type query_path: str
+      :param query_path: path of query template to run.
+
+      :type project_id: str
+      :param project_id: project where to run query from.
+
+      :type job_name: str
+      :param job_name: used to build job id.
+
+      :type rerun: str
+      :param rerun: token sent to force a new execution for `date`, see
+                    `build_job_id`.
+
+      :type maximum_bytes_billed: int
+      :param maximum_bytes_billed: jobs that would bill more bytes than this
+                                   fail without cost, defaults to 100 GBs.
+
+    :rtype: dict
+    :returns: dict containing body to setup job execution.
+    """
+    body = {'jobReference': {
+                'projectId': kwargs['project_id']
+                },
+            'configuration': {
+                'query': {
+                    'maximumBytesBilled': kwargs.get('maximum_bytes_billed',
+                        100000000000),
+                    'query': load_file_content(**kwargs),
+                    'useLegacySql': False
+                    }
+                }
+            }
+    body['jobReference']['jobId'] = build_job_id(kwargs['job_name'],
+        kwargs['date'], body['configuration'], kwargs.get('rerun'))
+    return body
+
+
+def extract_job_body(**kwargs):
+    """Returns the body of a job that exports the search KPIs of ``date``
+    to Cloud Storage, by default as Avro files compressed with deflate.
+
+    :type kwargs:
+      :type date: str
+      :param date: date whose results are exported.
+
+      :type project_id: str
+      :param project_id: project where to run job from.
+
+      :type export_uri: str
+      :param export_uri: Cloud Storage URI of files, such as
+                         "gs://bucket/search_kpis/{}/part-*.avro". The {} is
+                         formatted to the date.
+
+      :type export_format: str
+      :param export_format: format of files, defaults to "AVRO".
+
+      :type export_compression: str
+      :param export_compression: compression of files, defaults to
+                                 "DEFLATE".
+
+      :type dest_project_id: str
+      :param dest_project_id: project where results of date are saved.
+
+      :type dest_dataset_id: str
+      :param dest_dataset_id: dataset where results of date are saved.
+
+      :type dest_table_id: str
+      :param dest_table_id: table of results in "sharded" mode.
+
+      :type output_mode: str
+      :param output_mode: "partitioned" to export the date partition of
+                          `dest_partition_table_id`, see
+                          `search_query_job_body`.
+
+      :type job_name: str
+      :param job_name: used to build job id, defaults to
+                       "export_search_kpis".
+
+      :type rerun: str
+      :param rerun: token sent to force a new execution for `date`, see
+                    `build_job_id`.
+
+    :rtype: dict
+    :returns: dict containing body to setup job execution.
+    """
+    table_id = ('{}${}'.format(kwargs['dest_partition_table_id'],
+        kwargs['date']) if kwargs.get('output_mode') == 'partitioned' else
+        kwargs['dest_table_id'].format(kwargs['date']))
+    body = {'jobReference': {
+                'projectId': kwargs['project_id']
+                },
+            'configuration': {
+                'extract': {
+                    'sourceTable': {
+                        'projectId': kwargs['dest_project_id'],
+                        'datasetId': kwargs['dest_dataset_id'],
+                        'tableId': table_id
+                        },
+                    'destinationUris': [kwargs['export_uri'].format(
+                        kwargs['date'])],
+                    'destinationFormat': kwargs.get('export_format', 'AVRO'),
+                    'compression': kwargs.get('export_compression',
+                        'DEFLATE')
+                    }
+                }
+            }
+    body['jobReference']['jobId'] = build_job_id(kwargs.get('job_name',
+        'export_search_kpis'), kwargs['date'], body['configuration'],
+        kwargs.get('rerun'))
+    return body
+
+
+def read_query_job_body(**kwargs):
+    """Returns the body of a query job whose results are read as soon as it
+    finishes, from the anonymous table in
+    `configuration.query.destinationTable` of the job. Jobs get a new id on
+    each run so BigQuery's own cache decides whether they cost anything.
+
+    :type kwargs:
+      :type query_path: str
+      :param query_path: path of query template to run.
+
+      :type project_id: str
+      :param project_id: project where to run query from.
+
+      :type maximum_bytes_billed: int
+      :param maximum_bytes_billed: jobs that would bill more bytes than this
+                                   fail without cost, defaults to 100 GBs.
+
+    :rtype: dict
+    :returns: dict containing body to setup job execution.
+    """
+    return {'jobReference': {
+                'projectId': kwargs['project_id']
+                },
+            'configuration': {
+                'query': {
+                    'maximumBytesBilled': kwargs.get('maximum_bytes_billed',
+                        100000000000),
+                    'query': load_file_content(**kwargs),
+                    'useLegacySql': False
+                    }
+                }
+            }
+
+
+class QueryTemplates(object):
+    """Registry of query templates that are read from disk only once.
+
+    Files are parsed when loaded so that only the fields a template uses
+    are considered when rendering it; rendered queries are cached by
+    these fields values.
+
+    :type check_interval: float
+    :param check_interval: seconds between checks of files modification
+                           time; templates whose files changed are
+                           reloaded.
+
+    :type cache_size: int
+    :param cache_size: maximum number of rendered queries kept in memory.
+    """
+    def __init__(self, check_interval=60, cache_size=128):
+        self.check_interval = check_interval
+        self.cache_size = cache_size
+        self.stats = {'loads': 0, 'renders': 0, 'hits': 0,
+                      'render_time': 0., 'last_render_time': 0.}
+        self._templates = {}
+        self._rendered = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load_dir(self, dir_path, extension='.sql'):
+        """Loads every template in ``dir_path``.
+
+        :type dir_path: str
+        :param dir_path: folder where templates are located.
+
+        :type extension: str
+        :param extension: only files ending with this value are loaded.
+        """
+        for name in sorted(os.listdir(dir_path)):
+            if name.endswith(extension):
+                self.load(os.path.join(dir_path, name))
+
+    def load(self, path):
+        """Reads and parses the template in ``path``.
+
+        :type path: str
+        :param path: path to template file.
+
+        :rtype: tuple
+        :returns: template string and names of fields it uses.
+        """
+        path = os.path.abspath(path)
+        mtime = os.path.getmtime(path)
+        with open(path) as f:
+            template = f.read()
+        fields = tuple(sorted(set(re.split(r'[.\[]', name)[0] for _, name,
+            _, _ in string.Formatter().parse(template) if name)))
+        with self._lock:
+            self._templates[path] = {'template': template, 'fields': fields,
+                                     'mtime': mtime, 'checked': time.time()}
+            for key in [key for key in self._rendered if key[0] == path]:
+                del self._rendered[key]
+            self.stats['loads'] += 1
+        return template, fields
+
+    def get(self, path):
+        """Returns template in ``path``, loading it if it's not available
+        yet or if its file changed since it was loaded.
+
+        :type path: str
+        :param path: path to template file.
+
+        :rtype: tuple
+        :returns: template string and names of fields it uses.
+        """
+        path = os.path.abspath(path)
+        entry = self._templates.get(path)
+        if entry is None:
+            return self.load(path)
+        if time.time() - entry['checked'] >= self.check_interval:
+            if os.path.getmtime(path) != entry['mtime']:
+                return self.load(path)
+            entry['checked'] = time.time()
+        return entry['template'], entry['fields']
+
+    def render(self, path, params):
+        """Formats template in ``path`` with ``params``.
+
+        :type path: str
+        :param path: path to template file.
+
+        :type params: dict
+        :param params: keys and values to render the template.
+
+        :rtype: str
+        :returns: rendered template.
+        """
+        start = time.time()
+        template, fields = self.get(path)
+        key = (os.path.abspath(path),) + tuple((field, params.get(field))
+            for field in fields)
+        try:
+            with self._lock:
+                result = self._rendered.pop(key)
+                self._rendered[key] = result
+                self.stats['hits'] += 1
+        except KeyError:
+            result = template.format(**params).strip()
+            with self._lock:
+                self._rendered[key] = result
+                while len(self._rendered) > self.cache_size:
+                    self._rendered.popitem(last=False)
+        except TypeError:
+            # unhashable values can't be cached
+            result = template.format(**params).strip()
+
+        elapsed = time.time() - start
+        with self._lock:
+            self.stats['renders'] += 1
+            self.stats['render_time'] += elapsed
+            self.stats['last_render_time'] = elapsed
+        logging.info("rendered query %s in %.3f ms", path, elapsed * 1000)
+        return result
+
+
+query_templates = QueryTemplates()
+query_templates.load_dir(os.path.join(os.path.dirname(os.path.abspath(
+    __file__)), 'queries'))
 
 
 def load_file_content(**kwargs):
-    """Reads the string from a source file and formats it using ``kwargs``.
+    """Renders the template in ``kwargs['query_path']`` using ``kwargs``.
+    Templates are read from disk only once, see `QueryTemplates`.
 
     :type kwargs: dict
     :param kwargs: it contains keys and values to render query template.
@@ -100,7 +530,7 @@ def load_file_content(**kwargs):
     :rtype: str
     :returns: file string after format processing with ``kwargs`` input.
     """
-    return open(kwargs.get('query_path')).read().format(**kwargs).strip()
+    return query_templates.render(kwargs.get('query_path'), kwargs)
 
 
 def format_date(input_date, format="%Y-%m-%d"):
@@ -138,3 +568,22 @@ def process_url_date(date):
         except ValueError:
             raise
     return date
+
+
+def extract_table_date(table_id, pattern):
+    """Gets the date used to build ``table_id`` from ``pattern``.
+
+    :type table_id: str
+    :param table_id: name of table, such as "search_20171010".
+
+    :type pattern: str
+    :param pattern: template used to name tables, such as "search_{}".
+
+    :rtype: str
+    :returns: date string in format "%Y%m%d" or `None` if ``table_id`` was
+              not built from ``pattern``.
+    """
+    prefix, suffix = pattern.split('{}', 1)
+    match = re.match(r'^{}(\d{{8}}){}$'.format(re.escape(prefix),
+        re.escape(suffix)), table_id)
+    return match.group(1) if match else None
@@ -24,34 +24,499 @@
 """Worker module used to run background operations"""
 
 
+import json
+import time
+import logging
+
 import utils
-from flask import Flask, request 
+import slugs
+import startup
+import profiling
+import scheduler
+from flask import Flask, request, g
 from config import config
+from factory import JobsFactory
 from connector.gcp import GCPService
+from connector.bigquery import job_statistics
 from datetime import datetime, timedelta
 
 
+# ndb is only loaded by requests that record costs, metrics or rollups state
+costs = startup.LazyModule('costs')
+metrics = startup.LazyModule('metrics')
+rollups = startup.LazyModule('rollups')
+startup.profiler.log('worker')
+
 app = Flask(__name__)
+profiling.install(app)
 gcp_service = GCPService() 
+jobs_factory = JobsFactory()
+# seconds before first check of a job submitted in continuation mode, the
+# delay doubles on each check up to `MAX_CHECK_DELAY`
+CHECK_DELAY = 15
+MAX_CHECK_DELAY = 300
+# queue of tasks that check back on jobs, see `queue.yaml`
+CHECK_QUEUE = 'dag-checks'
+# arguments added by `check_back` to the tasks that check on a job, which
+# are not sent to the downstream nodes of a DAG
+CHECK_PARAMS = ('stage', 'attempt', 'job_project_id', 'job_id',
+    'job_location')
+
+
+@app.before_request
+def start_timer():
+    """Keeps when request started so that metrics can tell how long it
+    took."""
+    g.request_start = time.time()
+
+
+def task_wait_ms():
+    """Computes how long the task that triggered the request waited in the
+    queue after the time it was scheduled to run.
+
+    :rtype: int
+    :returns: milliseconds, or ``None`` if request wasn't sent by a task.
+    """
+    eta = request.headers.get('X-AppEngine-TaskETA')
+    return (int((g.request_start - float(eta)) * 1000) if eta is not None
+        else None)
+
+
+def handling_ms():
+    """Computes how long the request has taken so far.
+
+    :rtype: int
+    :returns: milliseconds since request started.
+    """
+    return int((time.time() - g.request_start) * 1000)
+
+
+def record_job_metrics(job_name, date, statistics):
+    """Saves the statistics of a finished job along with task and request
+    timings, see `metrics.record_metric`.
+
+    :type job_name: str
+    :param job_name: name of job that ran.
+
+    :type date: str
+    :param date: date in format %Y%m%d processed by job.
+
+    :type statistics: dict
+    :param statistics: statistics of job, see
+                       `connector.bigquery.job_statistics`.
+    """
+    metrics.record_metric(job_name, date, statistics,
+        task_wait_ms=task_wait_ms(), handling_ms=handling_ms())
+
+
+@app.after_request
+def log_request_metrics(response):
+    """Logs as a JSON payload how long the request waited in the task
+    queue and how long it took to be handled."""
+    logging.info("request metrics %s", json.dumps({'path': request.path,
+        'status': response.status_code, 'task_wait_ms': task_wait_ms(),
+        'handling_ms': handling_ms()}, sort_keys=True))
+    return response
+
+
+@app.after_request
+def complete_dag_node(response):
+    """Enqueues the nodes that depend on the DAG node that just finished,
+    when the task was enqueued by a `DagSchedulerJob`. Only the arguments
+    of the DAG are sent downstream, not those of `check_back`. Jobs refused
+    for going over budget, see `submit_search_tables_stage`, answer 200 so
+    that the task isn't retried but don't complete the node."""
+    if (response.status_code == 200 and request.form.get('dag') and not
+        getattr(g, 'refused', False)):
+        jobs_factory.factor_job(request.form['dag']).complete(
+            request.form['node'], dict((key, value) for key, value in
+            request.form.items() if key not in CHECK_PARAMS))
+    return response
+
+
+@app.route("/_ah/warmup")
+def warmup():
+    """Loading request sent by App Engine before any other. Builds the
+    BigQuery client and fetches credentials so the first task doesn't wait
+    for them."""
+    gcp_service.warmup()
+    return ""
+
+
+def request_date():
+    """Reads date sent in the task that triggered the request.
+
+    :rtype: str
+    :returns: date in format "%Y%m%d", yesterday if none was sent.
+    """
+    return (utils.yesterday_date().strftime("%Y%m%d") if
+            'date' not in request.form else
+            utils.process_url_date(request.form.get('date')))
+
+
+def search_tables_stages(setup):
+    """Jobs that `update_search_tables` runs, in order.
+
+    :type setup: dict
+    :param setup: configuration of `update_dashboard_tables` job.
+
+    :rtype: list
+    :returns: names of jobs.
+    """
+    return [stage for stage, key in (
+        ('stage_search_sessions', 'staging_query_path'),
+        ('update_dashboard_tables', 'query_path'),
+        ('export_search_kpis', 'export_uri'),
+        ('update_search_sketches', 'sketches_query_path')) if setup.get(key)]
+
+
+def search_tables_job_body(stage, setup, date, rerun=None):
+    """Builds the body of the job of ``stage``:
+
+      - "stage_search_sessions" saves in the staging table of ``date`` only
+        the sessions, and their columns, that the search KPIs read so they
+        don't scan the GA export.
+      - "update_dashboard_tables" saves the search KPIs of ``date``, reading
+        the staging table if set.
+      - "export_search_kpis" extracts the search KPIs of ``date`` to Cloud
+        Storage so they can be loaded in `offline.store` without querying
+        them again.
+      - "update_search_sketches" saves sketches of visitors per search,
+        which are kept to merge over any range of dates, reading the
+        staging table if set.
+
+    :type stage: str
+    :param stage: one of `search_tables_stages`.
+
+    :type setup: dict
+    :param setup: configuration of `update_dashboard_tables` job.
+
+    :type date: str
+    :param date: date in format %Y%m%d to process.
+
+    :type rerun: str
+    :param rerun: token to force a new execution of the job.
+
+    :rtype: dict
+    :returns: job body.
+    """
+    params = setup.items() + [('date', date), ('job_name', stage),
+        ('rerun', rerun)]
+    if stage == 'export_search_kpis':
+        return utils.extract_job_body(**dict(params))
+    if stage == 'stage_search_sessions':
+        params += [('query_path', setup['staging_query_path']),
+            ('dest_project_id', setup['staging_project_id']),
+            ('dest_dataset_id', setup['staging_dataset_id']),
+            ('dest_table_id', setup['staging_table_id']),
+            ('output_mode', 'sharded'),
+            ('write_disposition', 'WRITE_TRUNCATE')]
+    elif stage == 'update_search_sketches':
+        params += [('query_path', setup['sketches_query_path']),
+            ('dest_project_id', setup['sketches_project_id']),
+            ('dest_dataset_id', setup['sketches_dataset_id']),
+            ('dest_table_id', setup['sketches_table_id']),
+            ('output_mode', 'sharded'),
+            ('write_disposition', 'WRITE_TRUNCATE')]
+    if stage != 'stage_search_sessions' and setup.get('staging_query_path'):
+        params += [('staging_table', setup['staging_table_id'].format(date))]
+    return utils.search_query_job_body(**dict(params))
+
+
+def submit_search_tables_stage(stage, setup, date, rerun=None):
+    """Submits the job of ``stage`` without waiting for it. The KPIs job is
+    first checked against `bytes_budget`: jobs above budget are either
+    refused, setting `g.refused` so the DAG node isn't completed, or run
+    with batch priority.
+
+    :type stage: str
+    :param stage: one of `search_tables_stages`.
+
+    :type setup: dict
+    :param setup: configuration of `update_dashboard_tables` job.
+
+    :type date: str
+    :param date: date in format %Y%m%d to process.
+
+    :type rerun: str
+    :param rerun: token to force a new execution of the job.
+
+    :rtype: tuple
+    :returns: job resource and ``None``, or ``None`` and a message if the
+              job was refused.
+    """
+    query_job_body = search_tables_job_body(stage, setup, date, rerun)
+    if stage == 'update_dashboard_tables':
+        total_bytes = gcp_service.bigquery.dry_run(setup['project_id'],
+            query_job_body)
+        costs.record_cost('update_dashboard_tables', date, total_bytes)
+        if setup.get('bytes_budget') and total_bytes > setup['bytes_budget']:
+            message = "job for date {} processes {} bytes, budget is {}".format(
+                date, total_bytes, setup['bytes_budget'])
+            if setup.get('budget_action', 'refuse') == 'refuse':
+                logging.warning("refused %s", message)
+                g.refused = True
+                return None, "refused {}".format(message)
+            logging.warning("downgraded to batch priority %s", message)
+            query_job_body['configuration']['query']['priority'] = 'BATCH'
+    return gcp_service.bigquery.execute_job(setup['project_id'],
+        query_job_body), None
+
+
+def finish_search_tables(setup):
+    """Deletes the tables that expired once the tables of a date are
+    updated. Partitioned tables expire their partitions by themselves.
+
+    :type setup: dict
+    :param setup: configuration of `update_dashboard_tables` job.
+    """
+    expired_date = (datetime.now() - timedelta(days=1 + setup['total_days'])
+        ).strftime("%Y%m%d")
+    if setup.get('staging_query_path'):
+        gcp_service.bigquery.delete_table(
+            project_id=setup['staging_project_id'],
+            dataset_id=setup['staging_dataset_id'],
+            table_id=setup['staging_table_id'].format(expired_date))
+    if setup.get('output_mode') != 'partitioned':
+        gcp_service.bigquery.delete_table(
+            project_id=setup['dest_project_id'],
+            dataset_id=setup['dest_dataset_id'],
+            table_id=setup['dest_table_id'].format(expired_date))
+
+
+def continue_search_tables(stage, setup, date, countdown=None):
+    """Submits the job of ``stage`` and enqueues a task that checks back on
+    it, see `check_search_tables`, instead of waiting for it.
+
+    :type stage: str
+    :param stage: one of `search_tables_stages`.
+
+    :type setup: dict
+    :param setup: configuration of `update_dashboard_tables` job.
+
+    :type date: str
+    :param date: date in format %Y%m%d to process.
+
+    :returns: response of request, see `check_back`, or message if job was
+              refused.
+    """
+    job, message = submit_search_tables_stage(stage, setup, date,
+        request.form.get('rerun'))
+    if job is None:
+        return message
+    return check_back(job, stage, date)
+
+
+def check_back(job, stage, date, attempt=0):
+    """Enqueues a task that checks ``job`` after a delay that grows with
+    ``attempt``. The task carries the arguments of current request so the
+    DAG node that ran it, if any, completes only when it finishes.
+
+    :type job: dict
+    :param job: job resource.
+
+    :type stage: str
+    :param stage: one of `search_tables_stages`.
+
+    :type date: str
+    :param date: date in format %Y%m%d being processed.
+
+    :type attempt: int
+    :param attempt: how many checks were done so far.
+
+    :rtype: tuple
+    :returns: response with status 202 as work is not finished yet.
+    """
+    reference = job['jobReference']
+    params = dict(request.form.to_dict().items() + [('date', date),
+        ('stage', stage), ('attempt', str(attempt)),
+        ('job_project_id', reference['projectId']),
+        ('job_id', reference['jobId']),
+        ('job_location', reference.get('location', ''))])
+    scheduler.enqueue_check('/check_dashboard_tables', 'worker', params,
+        countdown=min(CHECK_DELAY * 2 ** attempt, MAX_CHECK_DELAY),
+        queue_name=CHECK_QUEUE)
+    return "submitted job {}".format(reference['jobId']), 202
+
 
 @app.route("/update_dashboard_tables", methods=['POST'])
 def update_search_tables():
-    """Creates a new table and deletes previous table if condition mets."""
+    """Creates a new table and deletes previous table if condition mets.
+
+    If `continuation` is set in config then each job is submitted and
+    checked back by a later task, so the request doesn't wait for it and
+    returns status 202.
+    """
     setup = config['jobs']['update_dashboard_tables'] 
-    date = (utils.yesterday_date().strftime("%Y%m%d") if
-            'date' not in request.form else
-            utils.process_url_date(request.form.get('date')))
+    date = request_date()
+    stages = search_tables_stages(setup)
+
+    if setup.get('continuation'):
+        return continue_search_tables(stages[0], setup, date)
+
+    for stage in stages:
+        job, message = submit_search_tables_stage(stage, setup, date,
+            request.form.get('rerun'))
+        if job is None:
+            return message
+        record_job_metrics(stage, date, gcp_service.bigquery.poll_job(job))
 
-    query_job_body = utils.search_query_job_body(**dict(setup.items() +
-        [('date', date)]))
+    finish_search_tables(setup)
+    return "finished"
+
+
+@app.route("/check_dashboard_tables", methods=['POST'])
+def check_search_tables():
+    """Checks back on a job submitted by `update_search_tables` in
+    continuation mode, submitting the job of next stage once it's done or
+    the same stage again if it failed."""
+    setup = config['jobs']['update_dashboard_tables']
+    date = request_date()
+    stages = search_tables_stages(setup)
+    stage = request.form['stage']
+
+    job = gcp_service.bigquery.get_job({
+        'projectId': request.form['job_project_id'],
+        'jobId': request.form['job_id'],
+        'location': request.form.get('job_location')})
+    if job['status']['state'] != 'DONE':
+        return check_back(job, stage, date,
+            int(request.form.get('attempt', 0)) + 1)
+    if 'errorResult' in job['status']:
+        # the failed job is submitted again under a new id, see
+        # `BigQueryService.execute_job`
+        logging.error("job %s failed: %s", request.form['job_id'],
+            job['status']['errorResult'])
+        return continue_search_tables(stage, setup, date)
+    record_job_metrics(stage, date, job_statistics(job))
+
+    if stage != stages[-1]:
+        return continue_search_tables(stages[stages.index(stage) + 1], setup,
+            date)
+    finish_search_tables(setup)
+    return "finished"
+
+
+@app.route("/sweep_dashboard_tables", methods=['POST'])
+def sweep_search_tables():
+    """Deletes every table in destination dataset that is older than
+    `total_days`."""
+    setup = config['jobs']['update_dashboard_tables']
+    threshold = (datetime.now() - timedelta(days=1 + setup['total_days'])
+        ).strftime("%Y%m%d")
+
+    expired = []
+    for table_id in gcp_service.bigquery.list_tables(
+        project_id=setup['dest_project_id'],
+        dataset_id=setup['dest_dataset_id']):
+        date = utils.extract_table_date(table_id, setup['dest_table_id'])
+        if date and date <= threshold:
+            expired.append(table_id)
+
+    gcp_service.bigquery.delete_tables(project_id=setup['dest_project_id'],
+        dataset_id=setup['dest_dataset_id'], table_ids=expired)
+
+    return "deleted {} tables".format(len(expired))
 
+
+@app.route("/update_search_terms", methods=['POST'])
+def update_search_terms():
+    """Inserts in the search terms dimension table every label searched in
+    date that is not there yet, with its slug."""
+    setup = config['jobs']['update_search_terms']
+    date = request_date()
+
+    gcp_service.bigquery.create_table(project_id=setup['terms_project_id'],
+        dataset_id=setup['terms_dataset_id'],
+        table_id=setup['terms_table_id'], schema=slugs.LOOKUP_SCHEMA)
+
+    query_job_body = utils.dml_query_job_body(**dict(setup.items() +
+        [('date', date), ('job_name', 'update_search_terms'),
+         ('rerun', request.form.get('rerun'))]))
     job = gcp_service.bigquery.execute_job(setup['project_id'],
         query_job_body)
-    gcp_service.bigquery.poll_job(job)
-
-    gcp_service.bigquery.delete_table(project_id=setup['dest_project_id'],
-        dataset_id=setup['dest_dataset_id'],
-        table_id=setup['dest_table_id'].format((datetime.now() - 
-            timedelta(days=1 + setup['total_days'])).strftime("%Y%m%d")))
+    record_job_metrics('update_search_terms', date,
+        gcp_service.bigquery.poll_job(job))
 
     return "finished"
+
+
+@app.route("/update_search_rollups", methods=['POST'])
+def update_search_rollups():
+    """Moves the rollup tables of each window to end at date, adding the
+    KPIs of date and subtracting those of the day that left the window."""
+    setup = config['jobs']['update_search_rollups']
+    source_setup = config['jobs']['update_dashboard_tables']
+    date = request_date()
+    source_table, date_column, date_format = utils.source_table(source_setup)
+    # the day subtracted by a merge, `window` days before date, must not
+    # have been deleted yet, and results older than `total_days` are
+    # deleted, so windows must be smaller than `total_days`
+    total_days = source_setup['total_days']
+    rebuild = bool(request.form.get('rebuild'))
+
+    updated = []
+    for window in setup['windows']:
+        if window >= total_days:
+            logging.error("rollup of %s days needs more than %s days kept",
+                window, total_days)
+            continue
+        action, end_date = rollups.plan_update(window, date, rebuild)
+        if action is None:
+            continue
+        rerun = request.form.get('rerun')
+        if rebuild:
+            # job ids are deterministic, so a requested rebuild would
+            # attach to the job of an earlier one instead of summing again
+            rerun = '{}rebuild{}'.format(rerun or '', int(g.request_start))
+        elif end_date != date:
+            # a late date sums again the window that already ends at
+            # end_date, which needs a new job id
+            rerun = '{}late{}'.format(rerun or '', date)
+        params = dict(source_setup.items() + setup.items() + [
+            ('date', utils.format_date(end_date, date_format)),
+            ('rerun', rerun),
+            ('job_name', 'update_search_rollups_{}d'.format(window)),
+            ('source_table', source_table), ('date_column', date_column),
+            ('rollup_table', setup['rollup_table_id'].format(window))])
+        if action == 'merge':
+            query_job_body = utils.dml_query_job_body(**dict(params.items() +
+                [('query_path', setup['merge_query_path']),
+                 ('expired_date', utils.format_date(utils.shift_date(
+                    end_date, -window), date_format))]))
+        else:
+            query_job_body = utils.search_query_job_body(**dict(
+                params.items() + [
+                ('start_date', utils.format_date(utils.shift_date(
+                    end_date, 1 - window), date_format)),
+                ('dest_project_id', setup['rollup_project_id']),
+                ('dest_dataset_id', setup['rollup_dataset_id']),
+                ('dest_table_id', params['rollup_table']),
+                ('output_mode', 'sharded'),
+                ('write_disposition', 'WRITE_TRUNCATE')]))
+        job = gcp_service.bigquery.execute_job(setup['project_id'],
+            query_job_body)
+        record_job_metrics(params['job_name'], date,
+            gcp_service.bigquery.poll_job(job))
+        rollups.save_state(window, end_date)
+        updated.append("{} {}d".format(action, window))
+
+    return "updated {}".format(", ".join(updated) or "nothing")
+
+
+@app.route("/metrics")
+def job_metrics():
+    """Returns as JSON the history of metrics of the jobs run by worker.
+
+    Argument `job_name` selects the most recent dates of a job, up to
+    `limit`, and argument `date` every job that ran for a date.
+    """
+    if request.args.get('job_name'):
+        history = metrics.job_history(request.args['job_name'],
+            int(request.args.get('limit', 30)))
+    elif request.args.get('date'):
+        history = metrics.date_history(utils.process_url_date(
+            request.args['date']))
+    else:
+        return "either job_name or date is required", 400
+    return json.dumps([metric.to_json_dict() for metric in history])
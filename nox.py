@@ -53,3 +53,49 @@ def session_unit_gae(session):
         '--cov=.',
         '--cov-report=html')
 
+
+
+def session_benchmark_gae(session):
+    """Runs the end to end benchmark of AppEngine services against the
+    in-memory backends and saves results in `bench_output.json`. To run it,
+    type `nox --session benchmark_gae`
+    """
+    session.interpreter = 'python2.7'
+    session.virtualenv_dirname = 'unit-gae'
+
+    session.install('-r', 'tests/unit/data/gae/test_requirements.txt')
+    session.install('mock')
+
+    if not os.path.isdir('/google-cloud-sdk/platform/google_appengine/'):
+        raise RuntimeError("Please install gcloud components for app engine"
+                           " in order to simulate an AppEngine environment "
+                           " for testing")
+
+    session.env = {'PYTHONPATH': (':/google-cloud-sdk/platform/' 
+        'google_appengine/:./:./gae/:/google-cloud-sdk/platform/'
+        'google_appenigne/lib/yaml/lib')}
+
+    session.run(
+        'python',
+        'tests/benchmark/gae/bench_pipeline.py',
+        '--output',
+        'bench_output.json')
+
+
+def session_unit_offline(session):
+    """Tests the offline computation of search KPIs. To run it, type
+    `nox --session unit_offline`
+    """
+    session.interpreter = 'python2.7'
+    session.virtualenv_dirname = 'unit-offline'
+
+    session.install('-r', 'offline/requirements.txt')
+    session.install('pytest', 'pytest-cov')
+
+    session.env = {'PYTHONPATH': './'}
+
+    session.run(
+        'py.test',
+        'tests/unit/offline/',
+        '--cov=offline',
+        '--cov-report=html')
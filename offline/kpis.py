@@ -0,0 +1,354 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Offline reproduction of the KPIs computed by
+``gae/queries/search_kpis.sql``.
+
+Sessions exported from Google Analytics are flattened into columnar frames
+and each step of the query (search attribution, purchases attribution and
+the final aggregation per visitor) runs as vectorized operations so that KPI
+definitions can be validated locally before paying for a full scan.
+"""
+
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from gae import slugs
+from offline.reader import Session, project_session
+
+
+CONFIG_SKU = re.compile(r'(.*)-[0-9A-Z]+')
+
+SESSION_COLUMNS = [('fv', object), ('date', object), ('revenue', np.float64)]
+
+HIT_COLUMNS = [('sid', np.int64), ('hn', np.int64), ('pp', object),
+    ('event', bool), ('lbl', object), ('has_click', bool),
+    ('first_sku', object)]
+
+PURCHASE_COLUMNS = [('sid', np.int64), ('sku', object),
+    ('revenue', np.float64)]
+
+SEARCH_COLUMNS = ['sid', 'search', 'click', 'net_revenue', 'bounce']
+
+
+def is_search(search_phrase, url):
+    """Same as `isSearch` UDF, tells whether ``url`` is the result page of
+    ``search_phrase``. As the query only uses it in conditions, NULL results
+    are returned as False.
+
+    :type search_phrase: str
+    :param search_phrase: search typed by customers.
+
+    :type url: str
+    :param url: page path of hit.
+
+    :rtype: bool
+    :returns: True if every word of ``search_phrase`` is in ``url``.
+    """
+    if search_phrase is None or url is None:
+        return False
+    lower_url = url.lower()
+    return all(word in url or slugs.remove_accents(word.lower()) in lower_url
+        for word in search_phrase.split(' '))
+
+
+def extract_config_sku(sku):
+    """Same as `extractConfigSku` UDF, removes size and color from skus.
+
+    :type sku: str
+    :param sku: sku as registered in product hits.
+
+    :rtype: str
+    :returns: config sku.
+    """
+    if sku is None or sku.count('-') not in (1, 3):
+        return sku
+    match = CONFIG_SKU.search(sku)
+    return match.group(1) if match else None
+
+
+def _contains(pattern, value):
+    """Same as `REGEXP_CONTAINS`, where NULL values never match."""
+    return value is not None and pattern.search(value) is not None
+
+
+def _to_float(value):
+    return np.nan if value is None else float(value)
+
+
+def _frame(columns, values):
+    """Builds frame from lists in ``values`` typed as in ``columns``."""
+    return pd.DataFrame(OrderedDict((name, np.array(values[name],
+        dtype=dtype)) for name, dtype in columns))
+
+
+def build_frames(sessions, hostname=None, geonetworklocation=None):
+    """Flattens GA sessions into columnar frames. When ``hostname`` and
+    ``geonetworklocation`` are given sessions are filtered just like in the
+    query.
+
+    :type sessions: iterable
+    :param sessions: `Session` objects, such as streamed by
+                     `reader.iter_sessions`, or records in the schema of GA
+                     exports to BigQuery.
+
+    :type hostname: str
+    :param hostname: regex one of the hits hostnames must match.
+
+    :type geonetworklocation: str
+    :param geonetworklocation: regex sessions network location must not
+                               match.
+
+    :rtype: tuple
+    :returns: frames of `sessions` with `fv`, `date` and `revenue`; `hits`
+              with `sid`, `hn`, `pp`, `event`, `lbl`, `has_click` and
+              `first_sku`; `purchases` with `sid`, `sku` and `revenue`.
+    """
+    hostname = re.compile(hostname) if hostname is not None else None
+    geonetworklocation = (re.compile(geonetworklocation) if
+        geonetworklocation is not None else None)
+    s_cols = dict((name, []) for name, _ in SESSION_COLUMNS)
+    h_cols = dict((name, []) for name, _ in HIT_COLUMNS)
+    p_cols = dict((name, []) for name, _ in PURCHASE_COLUMNS)
+
+    for session in sessions:
+        if not isinstance(session, Session):
+            session = project_session(session)
+        if hostname is not None and not any(_contains(hostname,
+                hit.hostname) for hit in session.hits):
+            continue
+        if geonetworklocation is not None and (
+                session.network_location is None or _contains(
+                geonetworklocation, session.network_location.lower())):
+            continue
+
+        sid = len(s_cols['fv'])
+        s_cols['fv'].append(session.fv)
+        s_cols['date'].append(session.date)
+        s_cols['revenue'].append(_to_float(session.revenue) / 1e6)
+
+        for hit in session.hits:
+            event = hit.category == 'search'
+            products = hit.products
+            h_cols['sid'].append(sid)
+            h_cols['hn'].append(hit.hn)
+            h_cols['pp'].append(hit.pp)
+            h_cols['event'].append(event)
+            h_cols['lbl'].append(hit.label if event else None)
+            h_cols['has_click'].append(any(product.is_click for product in
+                products))
+            h_cols['first_sku'].append(products[0].sku if products else
+                None)
+            if hit.action_type != '6':
+                continue
+            for product in products:
+                p_cols['sid'].append(sid)
+                p_cols['sku'].append(product.sku)
+                p_cols['revenue'].append(np.nan if product.quantity is None
+                    or product.price is None else
+                    product.quantity * product.price / 1e6)
+
+    return (_frame(SESSION_COLUMNS, s_cols), _frame(HIT_COLUMNS, h_cols),
+            _frame(PURCHASE_COLUMNS, p_cols))
+
+
+def _apply_unique(func, *columns):
+    """Runs ``func`` only once for each distinct combination of values in
+    ``columns`` and broadcasts results back to all rows.
+
+    :rtype: `np.ndarray`
+    :returns: result of ``func`` for each row.
+    """
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        column_codes, uniques = pd.factorize(column)
+        codes = codes * (len(uniques) + 1) + column_codes + 1
+    _, first, inverse = np.unique(codes, return_index=True,
+        return_inverse=True)
+    results = np.empty(len(first), dtype=object)
+    results[:] = [func(*[column[i] for column in columns]) for i in first]
+    return results[inverse]
+
+
+def attribute_searches(hits):
+    """Attributes each hit to the search that preceded it in the session,
+    same as the `flg` running sum and `FIRST_VALUE` windows of the query.
+
+    :type hits: `pd.DataFrame`
+    :param hits: hits frame as returned by `build_frames`.
+
+    :rtype: `pd.DataFrame`
+    :returns: ``hits`` sorted by session and hit number with columns
+              `search` (slug of attributed search), `sku_clicked` and
+              `bounce` (bool).
+    """
+    hits = hits.sort_values(['sid', 'hn'], kind='mergesort').reset_index(
+        drop=True)
+    if hits.empty:
+        return hits.assign(search=np.array([], dtype=object),
+            sku_clicked=np.array([], dtype=object),
+            bounce=np.array([], dtype=bool))
+
+    sid = hits['sid'].values
+    flg = hits.groupby('sid')['event'].cumsum().values
+    start = np.r_[True, (sid[1:] != sid[:-1]) | (flg[1:] != flg[:-1])]
+    first_lbl = hits['lbl'].values[np.flatnonzero(start)][
+        np.cumsum(start) - 1]
+    is_search_page = _apply_unique(is_search, first_lbl,
+        hits['pp'].values).astype(bool)
+    last_hit = hits['hn'].values == hits.groupby('sid')['hn'].transform(
+        'max').values
+
+    return hits.assign(
+        search=np.array(slugs.slugifier.bulk(first_lbl), dtype=object),
+        sku_clicked=np.where(is_search_page & hits['has_click'].values,
+            hits['first_sku'].values, None),
+        bounce=is_search_page & last_hit)
+
+
+def aggregate_searches(hits, purchases):
+    """Aggregates attributed hits by session and search. Revenue of a search
+    is the revenue of purchased skus that were clicked after it.
+
+    :type hits: `pd.DataFrame`
+    :param hits: hits as returned by `attribute_searches`.
+
+    :type purchases: `pd.DataFrame`
+    :param purchases: purchases frame as returned by `build_frames`.
+
+    :rtype: `pd.DataFrame`
+    :returns: frame with `sid`, `search`, `click`, `net_revenue` and
+              `bounce`, where `bounce` and `net_revenue` are NaN when NULL.
+    """
+    hits = hits[hits['search'].notnull()]
+    grouped = hits.groupby(['sid', 'search'])
+    searches = pd.DataFrame({
+        'click': (grouped['sku_clicked'].count() > 0).astype(np.int64),
+        'bounce': grouped['bounce'].any().map({True: 1.0, False: np.nan})})
+
+    searches['net_revenue'] = np.nan
+    clicked = hits.loc[hits['sku_clicked'].notnull(), ['sid', 'search',
+        'sku_clicked']].drop_duplicates()
+    # pandas loses dtypes when grouping empty frames so they can't be merged
+    if clicked.empty or purchases.empty:
+        return searches.reset_index()[SEARCH_COLUMNS]
+
+    purchased = (purchases.assign(sku=_apply_unique(extract_config_sku,
+        purchases['sku'].values)).groupby(['sid', 'sku'])['revenue']
+        .sum(min_count=1).reset_index()
+        .rename(columns={'sku': 'sku_clicked'}))
+    searches['net_revenue'] = (clicked.merge(purchased, on=['sid',
+        'sku_clicked']).groupby(['sid', 'search'])['revenue']
+        .sum(min_count=1).reindex(searches.index))
+    return searches.reset_index()[SEARCH_COLUMNS]
+
+
+def _value(value):
+    """Converts NaN to None and numpy scalars to python types."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def build_final_results(sessions, searches):
+    """Same as `buildFinalResult` UDF applied to each visitor and date.
+
+    :type sessions: `pd.DataFrame`
+    :param sessions: sessions frame as returned by `build_frames`.
+
+    :type searches: `pd.DataFrame`
+    :param searches: searches as returned by `aggregate_searches`.
+
+    :rtype: list
+    :returns: one row for each visitor and date sorted by them, having
+              `fv`, `date`, `user_revenue` and `results`, same as the query
+              output except for `fv` which the query doesn't select.
+    """
+    keys = ['fv', 'date']
+    searches = searches.join(sessions[keys], on='sid')
+    grouped = searches.groupby(keys + ['search'])
+    data = pd.DataFrame({'freq': grouped.size(),
+        'clicks': grouped['click'].sum(),
+        'net_revenue': grouped['net_revenue'].sum(min_count=1),
+        'bounce': grouped['bounce'].sum(min_count=1)}).reset_index()
+    search_data = {}
+    for row in data.itertuples(index=False):
+        search_data.setdefault((row.fv, row.date), []).append({
+            'search': row.search, 'freq': _value(row.freq),
+            'clicks': _value(row.clicks),
+            'net_revenue': _value(row.net_revenue),
+            'bounce': _value(row.bounce)})
+
+    visitors = sessions.groupby(keys)['revenue'].sum(min_count=1)
+    grouped = searches.groupby(keys)
+    net = searches[searches['net_revenue'] > 0].groupby(keys)
+    stats = pd.DataFrame({'user_revenue': visitors,
+        'searched': grouped.size().reindex(visitors.index).notnull(),
+        'net_searched': net.size().reindex(visitors.index).notnull(),
+        'net_search_rvn': grouped['net_revenue'].sum(min_count=1),
+        'net_clicks': net['click'].sum()}, index=visitors.index)
+
+    rows = []
+    for visitor, row in zip(stats.index, stats.itertuples(index=False)):
+        revenue = _value(row.user_revenue)
+        converted = revenue is not None and revenue > 0
+        rows.append({'fv': visitor[0], 'date': visitor[1],
+            'user_revenue': revenue,
+            'results': {
+                'search_data': search_data.get(visitor, []),
+                'search_flg': 1 if row.searched else None,
+                'net_search_flg': 1 if row.net_searched else None,
+                'search_rvn': revenue if row.searched else None,
+                'net_search_rvn': _value(row.net_search_rvn),
+                'u_conversion': 1 if converted else None,
+                'u_search_conversion': (1 if row.searched and converted
+                    else None),
+                'net_clicks': _value(row.net_clicks)}})
+    return rows
+
+
+def search_kpis(sessions, hostname=None, geonetworklocation=None):
+    """Computes the same results as `search_kpis.sql` for ``sessions``.
+
+    :type sessions: iterable
+    :param sessions: `Session` objects or records of GA exports.
+
+    :type hostname: str
+    :param hostname: regex one of the hits hostnames must match.
+
+    :type geonetworklocation: str
+    :param geonetworklocation: regex sessions network location must not
+                               match.
+
+    :rtype: list
+    :returns: results of each visitor and date as described in
+              `build_final_results`.
+    """
+    sessions, hits, purchases = build_frames(sessions, hostname,
+        geonetworklocation)
+    searches = aggregate_searches(attribute_searches(hits), purchases)
+    return build_final_results(sessions, searches)
@@ -0,0 +1,253 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Streams sessions exported from Google Analytics to BigQuery, either as
+newline delimited JSON or Avro files, keeping only the fields that
+``gae/queries/search_kpis.sql`` reads.
+
+Files are never loaded at once: JSON lines are split from a memory mapped
+file and each record is projected into slotted structures as soon as it's
+parsed, so memory stays flat regardless of how big a day of data is.
+"""
+
+
+import os
+import json
+import mmap
+import gzip
+
+try:
+    import fastavro
+except ImportError:
+    fastavro = None
+
+
+class Product(object):
+    """Product of a hit, as in `hits.product`."""
+    __slots__ = ('sku', 'is_click', 'quantity', 'price')
+
+    def __init__(self, sku, is_click, quantity, price):
+        self.sku = sku
+        self.is_click = is_click
+        self.quantity = quantity
+        self.price = price
+
+
+class Hit(object):
+    """Hit of a session with the fields used to attribute searches."""
+    __slots__ = ('hn', 'pp', 'hostname', 'category', 'label', 'action_type',
+        'products')
+
+    def __init__(self, hn, pp, hostname, category, label, action_type,
+            products):
+        self.hn = hn
+        self.pp = pp
+        self.hostname = hostname
+        self.category = category
+        self.label = label
+        self.action_type = action_type
+        self.products = products
+
+
+class Session(object):
+    """Session of a visitor with its hits."""
+    __slots__ = ('fv', 'visit_id', 'date', 'revenue', 'network_location',
+        'hits')
+
+    def __init__(self, fv, visit_id, date, revenue, network_location, hits):
+        self.fv = fv
+        self.visit_id = visit_id
+        self.date = date
+        self.revenue = revenue
+        self.network_location = network_location
+        self.hits = hits
+
+
+def get_field(record, *path):
+    """Reads nested field from a session record. As in BigQuery, names are
+    case insensitive so `eCommerceAction` and `ecommerceAction` are the
+    same field.
+
+    :type record: dict
+    :param record: session, hit or product record.
+
+    :type path: tuple
+    :param path: names of fields to go through, such as `page`, `pagePath`.
+
+    :rtype: object
+    :returns: value found in ``path`` or None if it doesn't exist.
+    """
+    for name in path:
+        if record is None:
+            return None
+        value = record.get(name)
+        if value is None and name not in record:
+            name = name.lower()
+            value = next((v for k, v in record.items() if k.lower() == name),
+                None)
+        record = value
+    return record
+
+
+def _cast(value, type_):
+    """BigQuery exports integers in JSON as strings, so values are cast
+    before being used."""
+    return None if value is None else type_(value)
+
+
+def project_product(record):
+    """Projects product record into `Product`."""
+    return Product(get_field(record, 'productSku'),
+        bool(get_field(record, 'isClick')),
+        _cast(get_field(record, 'productQuantity'), int),
+        _cast(get_field(record, 'productPrice'), float))
+
+
+def project_hit(record):
+    """Projects hit record into `Hit`."""
+    page = get_field(record, 'page')
+    event = get_field(record, 'eventInfo')
+    return Hit(_cast(get_field(record, 'hitNumber'), int),
+        get_field(page, 'pagePath'),
+        get_field(page, 'hostname'),
+        get_field(event, 'eventCategory'),
+        get_field(event, 'eventLabel'),
+        get_field(record, 'eCommerceAction', 'action_type'),
+        [project_product(e) for e in get_field(record, 'product') or []])
+
+
+def project_session(record):
+    """Projects session as exported by GA into `Session`, discarding all
+    fields `search_kpis.sql` doesn't use.
+
+    :type record: dict
+    :param record: session in the schema of GA exports.
+
+    :rtype: `Session`
+    :returns: projected session.
+    """
+    return Session(get_field(record, 'fullVisitorId'),
+        _cast(get_field(record, 'visitId'), int),
+        get_field(record, 'date'),
+        _cast(get_field(record, 'totals', 'totalTransactionRevenue'),
+            float),
+        get_field(record, 'geoNetwork', 'networkLocation'),
+        [project_hit(e) for e in get_field(record, 'hits') or []])
+
+
+def iter_lines(path):
+    """Yields non empty lines of a file. Plain files are memory mapped so
+    that pages already read can be released by the OS while gzip files
+    are decompressed as they are read.
+
+    :type path: str
+    :param path: path of file to read.
+
+    :rtype: generator
+    :returns: lines without their line break.
+    """
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip(b'\r\n')
+        return
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = buf.find(b'\n', start)
+                if end == -1:
+                    end = size
+                line = buf[start:end]
+                if line.strip():
+                    yield line
+                start = end + 1
+        finally:
+            buf.close()
+
+
+def iter_records(path):
+    """Yields records of newline delimited JSON or Avro files, chosen by
+    their extension.
+
+    :type path: str
+    :param path: path of export file.
+
+    :raises ImportError: if reading Avro files without `fastavro`.
+
+    :rtype: generator
+    :returns: records as dicts.
+    """
+    if path.endswith('.avro'):
+        if fastavro is None:
+            raise ImportError("Please install fastavro in order to read"
+                              " Avro files")
+        with open(path, 'rb') as f:
+            for record in fastavro.reader(f):
+                yield record
+        return
+
+    for line in iter_lines(path):
+        yield json.loads(line)
+
+
+def iter_sessions(*paths):
+    """Streams projected sessions of export files.
+
+    :type paths: tuple
+    :param paths: paths of export files, such as all the shards of a day.
+
+    :rtype: generator
+    :returns: `Session` for each record found.
+    """
+    for path in paths:
+        for record in iter_records(path):
+            yield project_session(record)
+
+
+def iter_chunks(paths, chunk_size=10000):
+    """Groups sessions of ``paths`` in lists of up to ``chunk_size``.
+
+    :type paths: list
+    :param paths: paths of export files.
+
+    :type chunk_size: int
+    :param chunk_size: maximum sessions in each chunk.
+
+    :rtype: generator
+    :returns: lists of `Session`.
+    """
+    chunk = []
+    for session in iter_sessions(*paths):
+        chunk.append(session)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
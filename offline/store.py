@@ -0,0 +1,232 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Local column store of the daily search KPIs exported to Cloud Storage
+by the `export_search_kpis` stage of the worker.
+
+The nested `results.search_data` of each visitor is flattened and summed by
+date and search slug, same as ``gae/queries/search_rollup.sql`` does for a
+single day. Each date is saved in its own directory with one ``.npy`` file
+per column and rows sorted by search, so reading a date only memory maps
+its files and a search is found by binary search, without parsing or
+copying anything.
+"""
+
+
+import os
+import json
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from offline.reader import get_field, iter_records
+
+
+KPI_COLUMNS = [('freq', np.int64), ('clicks', np.int64),
+    ('net_revenue', np.float64), ('bounce', np.int64)]
+
+
+def _encode(search):
+    """Slugs are kept as utf-8 bytes in fixed width columns."""
+    return search if isinstance(search, bytes) else search.encode('utf-8')
+
+
+def flatten_search_data(rows):
+    """Flattens the searches of each visitor and sums them by date and
+    search. NULL values count as zero.
+
+    :type rows: iterable
+    :param rows: rows of search KPIs tables, as exported to Avro or JSON
+                 files or as returned by `offline.kpis.search_kpis`.
+
+    :rtype: `pd.DataFrame`
+    :returns: frame with `date`, `search`, `freq`, `clicks`, `net_revenue`
+              and `bounce` sorted by date and search.
+    """
+    cols = dict((name, []) for name in ['date', 'search'] + [name for name,
+        _ in KPI_COLUMNS])
+    for row in rows:
+        date = get_field(row, 'date')
+        for data in get_field(row, 'results', 'search_data') or []:
+            search = get_field(data, 'search')
+            if search is None:
+                continue
+            cols['date'].append(date)
+            cols['search'].append(search)
+            for name, dtype in KPI_COLUMNS:
+                cols[name].append(dtype(get_field(data, name) or 0))
+
+    frame = pd.DataFrame(OrderedDict([('date', np.array(cols['date'],
+        dtype=object)), ('search', np.array(cols['search'], dtype=object))] +
+        [(name, np.array(cols[name], dtype=dtype)) for name, dtype in
+        KPI_COLUMNS]))
+    if frame.empty:
+        return frame
+    return frame.groupby(['date', 'search'])[[name for name, _ in
+        KPI_COLUMNS]].sum().reset_index()
+
+
+class DayColumns(object):
+    """Memory mapped columns of a date.
+
+    :type path: str
+    :param path: directory where columns of date were saved by
+                 `ColumnStore.write`.
+    """
+    def __init__(self, path):
+        self.columns = dict((name, np.load(os.path.join(path, name +
+            '.npy'), mmap_mode='r')) for name in ['search'] + [name for
+            name, _ in KPI_COLUMNS])
+
+    def __len__(self):
+        return len(self.columns['search'])
+
+    def find(self, search):
+        """Finds row of ``search`` by binary search.
+
+        :type search: str
+        :param search: slug of search.
+
+        :rtype: int
+        :returns: index of row or ``None`` if search is not in date.
+        """
+        key = _encode(search)
+        index = int(np.searchsorted(self.columns['search'], key))
+        if index < len(self) and self.columns['search'][index] == key:
+            return index
+
+    def lookup(self, search):
+        """Reads the KPIs of ``search``.
+
+        :type search: str
+        :param search: slug of search.
+
+        :rtype: dict
+        :returns: `freq`, `clicks`, `net_revenue` and `bounce` of search or
+                  ``None`` if it's not in date.
+        """
+        index = self.find(search)
+        if index is None:
+            return None
+        return dict((name, self.columns[name][index].item()) for name, _ in
+            KPI_COLUMNS)
+
+
+class ColumnStore(object):
+    """Search KPIs saved in columns, one directory per date.
+
+    :type root: str
+    :param root: directory of store.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def dates(self):
+        """Lists dates saved in store.
+
+        :rtype: list
+        :returns: dates in format "%Y%m%d", sorted.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if not
+            name.startswith('.') and os.path.isfile(os.path.join(self.root,
+            name, 'meta.json')))
+
+    def write(self, date, frame):
+        """Saves the KPIs of ``date``, replacing the ones saved before.
+        Columns are written to a temporary directory first so readers never
+        see a date partially written. The previous directory of the date is
+        renamed aside before the new one is renamed in and only deleted
+        after, so a reader opening the date in between fails with `IOError`
+        rather than reading missing files.
+
+        :type date: str
+        :param date: date in format "%Y%m%d".
+
+        :type frame: `pd.DataFrame`
+        :param frame: KPIs of date with the columns of `flatten_search_data`.
+        """
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        search = np.array([_encode(e) for e in frame['search']],
+            dtype=bytes)
+        order = np.argsort(search, kind='mergesort')
+        tmp_dir = tempfile.mkdtemp(prefix='.{}'.format(date), dir=self.root)
+        np.save(os.path.join(tmp_dir, 'search.npy'), search[order])
+        for name, dtype in KPI_COLUMNS:
+            np.save(os.path.join(tmp_dir, name + '.npy'),
+                frame[name].values.astype(dtype)[order])
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'date': date, 'rows': len(search)}, f)
+
+        path = os.path.join(self.root, date)
+        old_dir = None
+        if os.path.isdir(path):
+            old_dir = tmp_dir + '.old'
+            os.rename(path, old_dir)
+        os.rename(tmp_dir, path)
+        if old_dir is not None:
+            shutil.rmtree(old_dir)
+
+    def load(self, date):
+        """Memory maps the columns of ``date``.
+
+        :type date: str
+        :param date: date in format "%Y%m%d".
+
+        :raises IOError: if date is not in store.
+
+        :rtype: `DayColumns`
+        :returns: columns of date.
+        """
+        return DayColumns(os.path.join(self.root, date))
+
+    def lookup(self, date, search):
+        """Reads the KPIs of ``search`` in ``date``, see
+        `DayColumns.lookup`."""
+        return self.load(date).lookup(search)
+
+    def load_export(self, paths):
+        """Saves in store the KPIs of export files, replacing the dates
+        found in them.
+
+        :type paths: list
+        :param paths: paths of Avro or newline delimited JSON files, see
+                      `offline.reader.iter_records`.
+
+        :rtype: list
+        :returns: dates saved.
+        """
+        frame = flatten_search_data(record for path in paths for record in
+            iter_records(path))
+        if frame.empty:
+            return []
+        dates = []
+        for date, day in frame.groupby('date'):
+            self.write(date, day)
+            dates.append(date)
+        return dates
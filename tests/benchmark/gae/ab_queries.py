@@ -0,0 +1,253 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""A/B comparison of two versions of the search KPIs query.
+
+Both queries run in BigQuery with cache disabled, either for the same date
+of the source tables set in `update_dashboard_tables` or against the `data`
+fixture embedded in them. Results are compared row by row and statistics
+of the jobs (elapsed time, slot-ms, bytes shuffled and processed) are
+reported, so a rewritten query is only adopted once it is equivalent and
+faster.
+
+Run it from the repository root with the same PYTHONPATH used for unit
+tests and the `config.py` of the services::
+
+    python tests/benchmark/gae/ab_queries.py --date 20171220
+    python tests/benchmark/gae/ab_queries.py --fixture --repeat 3
+"""
+
+
+import os
+import re
+import sys
+import json
+import argparse
+import datetime
+from collections import Counter
+
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
+    '..', '..'))
+
+# source table and its filters are replaced by the `data` fixture
+FIXTURE_SOURCE = re.compile(r"^(\s*)#FROM `data`\n\s*FROM `\{project_id\}"
+    r"[^\n]*\n\s*WHERE TRUE\n(\s*(#|AND)[^\n]*\n)*", re.MULTILINE)
+
+
+def render_query(path, setup, date=None, fixture=False):
+    """Renders query template in ``path``.
+
+    :type path: str
+    :param path: path of query template.
+
+    :type setup: dict
+    :param setup: parameters of template, as in `update_dashboard_tables`.
+
+    :type date: str
+    :param date: date to run the query for, in format "%Y%m%d".
+
+    :type fixture: bool
+    :param fixture: if True, the query reads its `data` fixture instead of
+                    the source tables.
+
+    :rtype: str
+    :returns: query ready to run.
+    """
+    with open(path) as f:
+        template = f.read()
+    if not fixture:
+        return template.format(**dict(setup.items() + [('date', date)]))
+    query, count = FIXTURE_SOURCE.subn(r"\1FROM `data`\n", template)
+    if count != 1:
+        raise ValueError("Query {} has no `data` fixture to read from"
+            .format(path))
+    return query
+
+
+def canonical(row, fields):
+    """Converts a row to a dict of its columns where only the values of
+    REPEATED fields are sorted, as their order is not defined. Cells of rows
+    and structs keep the order of their schema.
+
+    :type row: dict
+    :param row: row in the format of `tabledata().list` or a struct in it,
+                such as ``{'f': [{'v': value}]}``.
+
+    :type fields: list
+    :param fields: schema of row, as in `schema.fields` of table resource.
+
+    :rtype: dict
+    :returns: value of each column by name.
+    """
+    return dict((field['name'], _canonical_value(cell['v'], field)) for
+        field, cell in zip(fields, row['f']))
+
+
+def _canonical_value(value, field):
+    """Canonical form of a cell, see `canonical`."""
+    if field.get('mode') == 'REPEATED':
+        return sorted((_canonical_item(item['v'], field) for item in value or
+            []), key=lambda item: json.dumps(item, sort_keys=True))
+    return _canonical_item(value, field)
+
+
+def _canonical_item(value, field):
+    """Canonical form of a single value of ``field``."""
+    if field['type'] in ('RECORD', 'STRUCT') and value is not None:
+        return canonical(value, field['fields'])
+    return value
+
+
+def compare_rows(baseline, candidate, baseline_fields, candidate_fields):
+    """Compares two sets of rows regardless of their order.
+
+    :type baseline: list
+    :param baseline: rows in the format of `tabledata().list`.
+
+    :type candidate: list
+    :param candidate: rows in the format of `tabledata().list`.
+
+    :type baseline_fields: list
+    :param baseline_fields: schema of ``baseline`` rows.
+
+    :type candidate_fields: list
+    :param candidate_fields: schema of ``candidate`` rows.
+
+    :rtype: dict
+    :returns: whether rows are `equal`, their totals and how many rows are
+              only in `baseline` (`missing`) or only in `candidate`
+              (`extra`).
+    """
+    def count(rows, fields):
+        return Counter(json.dumps(canonical(row, fields), sort_keys=True) for
+            row in rows)
+
+    baseline = count(baseline, baseline_fields)
+    candidate = count(candidate, candidate_fields)
+    missing = sum((baseline - candidate).values())
+    extra = sum((candidate - baseline).values())
+    return {'equal': not missing and not extra,
+            'baseline_rows': sum(baseline.values()),
+            'candidate_rows': sum(candidate.values()),
+            'missing': missing,
+            'extra': extra}
+
+
+def run_query(service, project_id, query):
+    """Runs ``query`` without cache and waits for it.
+
+    :rtype: tuple
+    :returns: statistics of finished job, rows of its results and their
+              schema.
+    """
+    from connector.bigquery import job_statistics
+    job = service.execute_job(project_id, {'configuration': {'query': {
+        'query': query, 'useLegacySql': False, 'useQueryCache': False}}})
+    job = next(service.poll_jobs([job]))
+    if 'errorResult' in job['status']:
+        raise RuntimeError(job['status']['errorResult'])
+    destination = job['configuration']['query']['destinationTable']
+    fields = service.con.tables().get(projectId=destination['projectId'],
+        datasetId=destination['datasetId'],
+        tableId=destination['tableId']).execute(num_retries=3)['schema'][
+        'fields']
+    rows = list(service.list_rows(destination['projectId'],
+        destination['datasetId'], destination['tableId']))
+    return job_statistics(job), rows, fields
+
+
+def median(values):
+    values = sorted(value for value in values if value is not None)
+    return values[len(values) // 2] if values else None
+
+
+def run(service, setup, baseline, candidate, date=None, fixture=False,
+        repeat=1):
+    """Runs ``baseline`` and ``candidate`` queries ``repeat`` times each,
+    alternating them.
+
+    :type service: `connector.bigquery.BigQueryService`
+    :param service: service used to run queries.
+
+    :type setup: dict
+    :param setup: setup of `update_dashboard_tables` job.
+
+    :rtype: dict
+    :returns: median statistics of each query and comparison of results.
+    """
+    queries = {'baseline': render_query(baseline, setup, date, fixture),
+               'candidate': render_query(candidate, setup, date, fixture)}
+    statistics = {'baseline': [], 'candidate': []}
+    rows, fields = {}, {}
+    for _ in range(repeat):
+        for name in ['baseline', 'candidate']:
+            stats, rows[name], fields[name] = run_query(service,
+                setup['project_id'], queries[name])
+            statistics[name].append(stats)
+
+    report = {'benchmark': 'ab_queries',
+              'created': datetime.datetime.utcnow().isoformat(),
+              'source': 'fixture' if fixture else date,
+              'repeat': repeat,
+              'comparison': compare_rows(rows['baseline'],
+                  rows['candidate'], fields['baseline'],
+                  fields['candidate'])}
+    for name, path in [('baseline', baseline), ('candidate', candidate)]:
+        report[name] = dict([('query_path', path)] + [(key, median(
+            stats[key] for stats in statistics[name])) for key in [
+            'elapsed_ms', 'slot_ms', 'shuffle_bytes', 'bytes_processed',
+            'bytes_billed']])
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--baseline', default=os.path.join(ROOT_PATH, 'gae',
+        'queries', 'search_kpis.sql'), help='path of current query')
+    parser.add_argument('--candidate', default=os.path.join(ROOT_PATH,
+        'gae', 'queries', 'search_kpis_optimized.sql'),
+        help='path of rewritten query')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--date', help='date of source tables to query, in '
+        'format "%%Y%%m%%d"')
+    group.add_argument('--fixture', action='store_true', help='query the '
+        '`data` fixture of queries')
+    parser.add_argument('--repeat', type=int, default=1, help='how many '
+        'times each query runs')
+    parser.add_argument('--output', help='file where JSON results are '
+        'written, defaults to stdout')
+    args = parser.parse_args()
+
+    from config import config
+    from connector.gcp import GCPService
+    report = run(GCPService().bigquery, config['jobs'][
+        'update_dashboard_tables'], args.baseline, args.candidate, args.date,
+        args.fixture, args.repeat)
+    results = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results)
+    else:
+        print results
+    sys.exit(0 if report['comparison']['equal'] else 1)
@@ -0,0 +1,209 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""End to end throughput benchmark of the search tables pipeline.
+
+Requests go through `main.run_job`, the scheduler and
+`worker.update_search_tables` while BigQuery and task queue are replaced
+by the in-memory backends of `connector.local`. Latency of API calls and
+jobs durations are simulated with a virtual clock, so results combine
+simulated waits with the actual processing time of the services. Latency
+of each task goes from its ETA until it's handled.
+
+Run it from the repository root with the same PYTHONPATH used for unit
+tests::
+
+    python tests/benchmark/gae/bench_pipeline.py --output bench_output.json
+"""
+
+
+import os
+import sys
+import json
+import time
+import types
+import resource
+import argparse
+import datetime
+
+import mock
+import webtest
+from google.appengine.ext import testbed
+
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
+    '..', '..'))
+
+
+class VirtualClock(object):
+    """Clock whose `sleep` advances time instead of blocking."""
+    def __init__(self):
+        self.offset = 0.
+
+    def time(self):
+        return time.time() + self.offset
+
+    def sleep(self, seconds):
+        self.offset += seconds
+
+    def __call__(self):
+        return self.time()
+
+
+def percentile(values, q):
+    """Nearest-rank percentile ``q``, between 0 and 100, of ``values``."""
+    values = sorted(values)
+    index = max(0, int(round(q / 100. * len(values))) - 1)
+    return values[index]
+
+
+def build_config(query_path):
+    """Registers the `config` module read by the worker."""
+    module = types.ModuleType('config')
+    module.config = {'jobs': {'update_dashboard_tables': {
+        'table_id': 'ga_sessions_*',
+        'dataset_id': 'source_dataset',
+        'project_id': 'project123',
+        'query_path': query_path,
+        'dest_table_id': 'search_{}',
+        'dest_dataset_id': 'dest_dataset',
+        'dest_project_id': 'dest_project',
+        'hostname': 'hostname',
+        'geonetworklocation': 'geo_location',
+        'total_days': 30}}}
+    sys.modules['config'] = module
+    return module.config
+
+
+def run_scenario(total_dates, api_latency, job_duration):
+    """Processes ``total_dates`` dates through the pipeline.
+
+    :type total_dates: int
+    :param total_dates: how many dates to process.
+
+    :type api_latency: float
+    :param api_latency: simulated seconds of each API call.
+
+    :type job_duration: float
+    :param job_duration: simulated seconds each query job runs.
+
+    :rtype: dict
+    :returns: metrics of the scenario.
+    """
+    import main
+    import worker
+    import scheduler
+    import connector.bigquery
+    from connector.gcp import GCPService
+    from connector.local import LocalBigQuery, LocalTaskQueue
+    clock = VirtualClock()
+    bigquery = LocalBigQuery(latency=api_latency, job_duration=job_duration,
+        bytes_processed=10 ** 9, clock=clock, sleep=clock.sleep)
+    queue = LocalTaskQueue(latency=api_latency, clock=clock,
+        sleep=clock.sleep)
+    main_app = webtest.TestApp(main.app)
+    worker_app = webtest.TestApp(worker.app)
+
+    end = datetime.datetime(2017, 12, 31)
+    dates = [(end - datetime.timedelta(days=i)).strftime("%Y%m%d")
+             for i in range(total_dates)][::-1]
+    latencies = []
+    with mock.patch.object(scheduler, 'taskqueue', queue), \
+         mock.patch.object(worker, 'gcp_service',
+             GCPService(backend=bigquery)), \
+         mock.patch.object(connector.bigquery, 'time', clock):
+        start = clock()
+        if total_dates == 1:
+            main_app.get('/run_job/update_dashboard_tables/',
+                {'date': dates[0]})
+        else:
+            main_app.get('/run_job/backfill_dashboard_tables/',
+                {'from': dates[0], 'to': dates[-1]})
+
+        def handler(task):
+            # latency counts from the ETA of each task, which is when it was
+            # enqueued unless it has a countdown, such as staggered backfill
+            # batches
+            worker_app.post(task.url, task.params)
+            latencies.append(clock() - task.eta_posix)
+        processed = queue.run_tasks(handler)
+        elapsed = clock() - start
+
+    api_calls = sum(bigquery.calls.values()) + sum(queue.calls.values())
+    return {'dates': total_dates,
+            'processed': processed,
+            'api_latency': api_latency,
+            'job_duration': job_duration,
+            'elapsed_seconds': elapsed,
+            'requests_per_second': processed / elapsed,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p99': percentile(latencies, 99),
+            'api_calls_per_job': float(api_calls) / processed,
+            'api_calls': dict(bigquery.calls.items() + queue.calls.items()),
+            'peak_memory_kb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run(sizes=(1, 10, 1000), api_latency=0.05, job_duration=30):
+    """Runs one scenario for each size in ``sizes``.
+
+    :rtype: dict
+    :returns: results of every scenario.
+    """
+    os.chdir(os.path.join(ROOT_PATH, 'gae'))
+    build_config(os.path.join(ROOT_PATH, 'gae', 'queries',
+        'search_kpis.sql'))
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    try:
+        scenarios = [run_scenario(size, api_latency, job_duration)
+                     for size in sizes]
+    finally:
+        bed.deactivate()
+    return {'benchmark': 'pipeline',
+            'created': datetime.datetime.utcnow().isoformat(),
+            'python': sys.version.split()[0],
+            'scenarios': scenarios}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10,
+        1000], help='number of dates of each scenario')
+    parser.add_argument('--api-latency', type=float, default=0.05,
+        help='simulated seconds of each API call')
+    parser.add_argument('--job-duration', type=float, default=30,
+        help='simulated seconds each query job runs')
+    parser.add_argument('--output', help='file where JSON results are '
+        'written, defaults to stdout')
+    args = parser.parse_args()
+
+    results = json.dumps(run(args.sizes, args.api_latency,
+        args.job_duration), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results)
+    else:
+        print results
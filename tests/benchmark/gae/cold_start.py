@@ -0,0 +1,134 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Cold start time of the BigQuery client.
+
+Each scenario runs several times in a fresh interpreter, so it includes the
+imports of `googleapiclient`, and reports the median seconds taken to have a
+client ready:
+
+  - `fetch`: `discovery.build`, which downloads the discovery document,
+    as done before it was bundled.
+  - `bundled`: `discovery.build_from_document` with the bundled copy read
+    by `connector.bigquery.discovery_document`.
+  - `shared`: a client built once more in a process that already read the
+    bundled copy, as happens in other threads after `/_ah/warmup`.
+
+Credentials are left out so only discovery and building are measured. Run
+it from the repository root with the same PYTHONPATH used for unit tests::
+
+    python tests/benchmark/gae/cold_start.py --repeat 5
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+SCENARIOS = ('fetch', 'bundled', 'shared')
+
+
+def build_client(scenario):
+    """Builds a BigQuery client as in ``scenario``.
+
+    :type scenario: str
+    :param scenario: one of `SCENARIOS`.
+
+    :rtype: float
+    :returns: seconds taken.
+    """
+    start = time.time()
+    import httplib2
+    import googleapiclient.discovery as disco
+    from connector import bigquery
+    if scenario == 'fetch':
+        disco.build('bigquery', 'v2', http=httplib2.Http(),
+            cache_discovery=False)
+    else:
+        if scenario == 'shared':
+            bigquery.discovery_document()
+            start = time.time()
+        disco.build_from_document(bigquery.discovery_document(),
+            http=httplib2.Http())
+    return time.time() - start
+
+
+def median(values):
+    """Median of ``values``.
+
+    :type values: list
+    :param values: numbers.
+
+    :rtype: float
+    :returns: median.
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    return (values[middle] if len(values) % 2 else
+        (values[middle - 1] + values[middle]) / 2.)
+
+
+def run(repeat):
+    """Runs each scenario ``repeat`` times in new processes.
+
+    :type repeat: int
+    :param repeat: runs of each scenario.
+
+    :rtype: dict
+    :returns: median seconds of each scenario, or the error that stopped it
+              such as no network access to download the document.
+    """
+    report = {}
+    for scenario in SCENARIOS:
+        timings = []
+        for _ in range(repeat):
+            process = subprocess.Popen([sys.executable, __file__,
+                '--scenario', scenario], stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+            out, err = process.communicate()
+            if process.returncode:
+                report[scenario] = {'error': err.strip().split('\n')[-1]}
+                break
+            timings.append(float(out))
+        else:
+            report[scenario] = {'median_seconds': round(median(timings), 4),
+                'runs': repeat}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5, help='how many '
+        'times each scenario runs')
+    parser.add_argument('--scenario', choices=SCENARIOS,
+        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print build_client(args.scenario)
+    else:
+        print json.dumps(run(args.repeat), indent=2, sort_keys=True)
@@ -40,7 +40,8 @@ class BaseTests(object):
             shutil.copyfile(self.config1_path, self.config2_path)
             self._recover_flg = True
             os.remove(self.config1_path)
-        shutil.copyfile(self.test_config, self.config1_path)
+        with open(self.config1_path, 'w') as f:
+            f.write('config = ' + open(self.test_config).read())
 
     def clean_environ(self):
         if self._recover_flg:
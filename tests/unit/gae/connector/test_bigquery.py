@@ -42,19 +42,51 @@ class TestBigqueryService(unittest.TestCase):
 
         return BigQueryService
 
+    @staticmethod
+    def _get_target_module():
+        import gae.connector.bigquery as bigquery
+
+
+        return bigquery
+
     @mock.patch('gae.connector.bigquery.disco')
     def test_cto(self, disco_mock):
         mock_cre = self._make_credentials()
-        disco_mock.build.return_value = 'con'
+        disco_mock.build_from_document.return_value = 'con'
         klass = self._get_target_klass()(mock_cre) 
         self.assertEqual(klass.con, 'con')
-        disco_mock.build.assert_called_once_with('bigquery', 'v2',
+        disco_mock.build_from_document.assert_called_once_with(
+            self._get_target_module().discovery_document(),
             credentials=mock_cre)
 
+    def test_discovery_document(self):
+        module = self._get_target_module()
+        result = module.discovery_document()
+        self.assertEqual(result['name'], 'bigquery')
+        self.assertEqual(result['version'], 'v2')
+        self.assertTrue(module.discovery_document() is result)
+        for resource, method in [('jobs', 'insert'), ('jobs', 'get'),
+            ('jobs', 'query'), ('tables', 'insert'), ('tables', 'delete'),
+            ('tables', 'list'), ('tabledata', 'list')]:
+            self.assertIn(method, result['resources'][resource]['methods'])
+
+    def test_build_from_discovery_document(self):
+        import httplib2
+        import googleapiclient.discovery as disco
+
+
+        con = disco.build_from_document(
+            self._get_target_module().discovery_document(),
+            http=httplib2.Http())
+        request = con.jobs().get(projectId='project123', jobId='1')
+        self.assertEqual(request.uri,
+            'https://bigquery.googleapis.com/bigquery/v2/projects/'
+            'project123/jobs/1?alt=json')
+
     @mock.patch('gae.connector.bigquery.disco')
     def test_execute_job(self, disco_mock):
         con_mock = mock.Mock()
-        disco_mock.build.return_value = con_mock
+        disco_mock.build_from_document.return_value = con_mock
         klass = self._get_target_klass()('cre') 
     
         job_mock = mock.Mock()
@@ -72,11 +104,105 @@ class TestBigqueryService(unittest.TestCase):
             **{'projectId': project_id, 'body': body})
         execute_mock.execute.assert_called_once_with(**{'num_retries': 3})
 
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_execute_job_already_exists(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+        jobs_mock = con_mock.jobs.return_value
+        jobs_mock.insert.return_value.execute.side_effect = HttpError(
+            mock.Mock(status=409), 'duplicate')
+        job = {'status': {'state': 'RUNNING'}}
+        jobs_mock.get.return_value.execute.return_value = job
+
+        body = {'jobReference': {'jobId': '1', 'location': 'EU'}}
+        self.assertEqual(klass.execute_job('project123', body), job)
+        jobs_mock.get.assert_called_once_with(projectId='project123',
+            jobId='1', location='EU')
+        jobs_mock.get.return_value.execute.assert_called_once_with(
+            num_retries=3)
+
+        jobs_mock.insert.return_value.execute.side_effect = HttpError(
+            mock.Mock(status=400), 'invalid')
+        with self.assertRaises(HttpError):
+            klass.execute_job('project123', body)
+
+        jobs_mock.insert.return_value.execute.side_effect = HttpError(
+            mock.Mock(status=409), 'duplicate')
+        with self.assertRaises(HttpError):
+            klass.execute_job('project123', {})
+
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_execute_job_failed(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+        jobs_mock = con_mock.jobs.return_value
+        failed = {'status': {'state': 'DONE', 'errorResult': {
+            'reason': 'backendError'}}}
+        jobs_mock.insert.return_value.execute.side_effect = [
+            HttpError(mock.Mock(status=409), 'duplicate'),
+            HttpError(mock.Mock(status=409), 'duplicate'), 'job']
+        jobs_mock.get.return_value.execute.return_value = failed
+
+        body = {'jobReference': {'projectId': 'project123', 'jobId': '1'},
+            'configuration': {}}
+        self.assertEqual(klass.execute_job('project123', body), 'job')
+        self.assertEqual([call[1]['body']['jobReference']['jobId'] for call
+            in jobs_mock.insert.call_args_list], ['1', '1_a1', '1_a2'])
+        self.assertEqual([call[1]['jobId'] for call in
+            jobs_mock.get.call_args_list], ['1', '1_a1'])
+        self.assertEqual(body['jobReference']['jobId'], '1')
+
+        jobs_mock.insert.return_value.execute.side_effect = HttpError(
+            mock.Mock(status=409), 'duplicate')
+        with self.assertRaises(RuntimeError):
+            klass.execute_job('project123', body, max_attempts=2)
+        with self.assertRaises(ValueError):
+            klass.execute_job('project123', body, max_attempts=0)
+
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_get_job(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+        jobs_mock = con_mock.jobs.return_value
+        jobs_mock.get.return_value.execute.return_value = 'job'
+
+        self.assertEqual(klass.get_job({'projectId': 'project123',
+            'jobId': '1', 'location': ''}), 'job')
+        jobs_mock.get.assert_called_once_with(projectId='project123',
+            jobId='1')
+        jobs_mock.get.return_value.execute.assert_called_once_with(
+            num_retries=3)
+
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_dry_run(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+        insert_mock = con_mock.jobs.return_value.insert
+        insert_mock.return_value.execute.return_value = {'statistics': {
+            'totalBytesProcessed': '1024'}}
+
+        body = {'jobReference': {'jobId': '1'},
+                'configuration': {'query': {'query': 'SELECT 1'}}}
+        result = klass.dry_run('project123', body)
+        self.assertEqual(result, 1024)
+        insert_mock.assert_called_once_with(projectId='project123',
+            body={'configuration': {'query': {'query': 'SELECT 1'},
+                  'dryRun': True}})
+        insert_mock.return_value.execute.assert_called_once_with(
+            num_retries=3)
+        # input body is left untouched
+        self.assertEqual(body, {'jobReference': {'jobId': '1'},
+            'configuration': {'query': {'query': 'SELECT 1'}}})
+
     @mock.patch('gae.connector.bigquery.time')
     @mock.patch('gae.connector.bigquery.disco')
     def test_poll_job(self, disco_mock, time_mock):
         con_mock = mock.Mock()
-        disco_mock.build.return_value = con_mock
+        disco_mock.build_from_document.return_value = con_mock
         klass = self._get_target_klass()('cre') 
     
         job_mock = mock.Mock()
@@ -95,7 +221,7 @@ class TestBigqueryService(unittest.TestCase):
     @mock.patch('gae.connector.bigquery.disco')
     def test_poll_job_running_time(self, disco_mock, time_mock):
         con_mock = mock.Mock()
-        disco_mock.build.return_value = con_mock
+        disco_mock.build_from_document.return_value = con_mock
         klass = self._get_target_klass()('cre') 
     
         job_mock = mock.Mock()
@@ -106,17 +232,22 @@ class TestBigqueryService(unittest.TestCase):
         klass.con = job_mock
     
         request_mock.execute.side_effect = [{"status": {"state": "RUNNING"}},
-            {"status": {"state": "DONE"}}]
+            {"status": {"state": "DONE"}, "statistics": {"startTime": "10",
+            "endTime": "30", "query": {"totalBytesProcessed": "7"}}}]
         job = {"jobReference": {"projectId": "project123", "jobId": "1"}}
-        klass.poll_job(job)
+        statistics = klass.poll_job(job)
+        self.assertEqual(statistics['elapsed_ms'], 20)
+        self.assertEqual(statistics['bytes_processed'], 7)
         request_mock.execute.assert_called_with(**{'num_retries': 3})    
-        time_mock.sleep.assert_called_once_with(1)
+        self.assertEqual(time_mock.sleep.call_count, 1)
+        delay = time_mock.sleep.call_args[0][0]
+        self.assertTrue(0.5 <= delay <= 1)
     
     @mock.patch('gae.connector.bigquery.time')
     @mock.patch('gae.connector.bigquery.disco')
     def test_poll_job(self, disco_mock, time_mock):
         con_mock = mock.Mock()
-        disco_mock.build.return_value = con_mock
+        disco_mock.build_from_document.return_value = con_mock
         klass = self._get_target_klass()('cre') 
     
         job_mock = mock.Mock()
@@ -132,10 +263,38 @@ class TestBigqueryService(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             klass.poll_job(job)
 
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_create_table(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+        tables_mock = con_mock.tables.return_value
+        schema = [{'name': 'raw_label', 'type': 'STRING'}]
+
+        self.assertTrue(klass.create_table('project123', 'dataset_id',
+            'table_id', schema))
+        tables_mock.insert.assert_called_once_with(projectId='project123',
+            datasetId='dataset_id', body={'tableReference': {
+                'projectId': 'project123', 'datasetId': 'dataset_id',
+                'tableId': 'table_id'}, 'schema': {'fields': schema}})
+        tables_mock.insert.return_value.execute.assert_called_once_with(
+            num_retries=3)
+
+        tables_mock.insert.return_value.execute.side_effect = HttpError(
+            mock.Mock(status=409), 'duplicate')
+        self.assertFalse(klass.create_table('project123', 'dataset_id',
+            'table_id', schema))
+
+        tables_mock.insert.return_value.execute.side_effect = HttpError(
+            mock.Mock(status=403), 'forbidden')
+        with self.assertRaises(HttpError):
+            klass.create_table('project123', 'dataset_id', 'table_id',
+                schema)
+
     @mock.patch('gae.connector.bigquery.disco')
     def test_delete_table(self, disco_mock):
         con_mock = mock.Mock()
-        disco_mock.build.return_value = con_mock
+        disco_mock.build_from_document.return_value = con_mock
         klass = self._get_target_klass()('cre') 
     
         table_mock = mock.Mock()
@@ -165,3 +324,223 @@ class TestBigqueryService(unittest.TestCase):
         table_mock.delete.assert_called_once_with(projectId=project_id,
             datasetId=dataset_id, tableId=table_id)
         delete_mock.execute.assert_called_once_with(num_retries=3)
+
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_list_tables(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+
+        tables_mock = con_mock.tables.return_value
+        page1, page2 = mock.Mock(), mock.Mock()
+        page1.execute.return_value = {'tables': [
+            {'tableReference': {'tableId': 'table1'}},
+            {'tableReference': {'tableId': 'table2'}}],
+            'nextPageToken': 'token'}
+        page2.execute.return_value = {'tables': [
+            {'tableReference': {'tableId': 'table3'}}]}
+        tables_mock.list.return_value = page1
+        tables_mock.list_next.side_effect = [page2, None]
+
+        result = list(klass.list_tables('project123', 'dataset_id'))
+        self.assertEqual(result, ['table1', 'table2', 'table3'])
+        tables_mock.list.assert_called_once_with(projectId='project123',
+            datasetId='dataset_id', maxResults=1000)
+        page1.execute.assert_called_once_with(num_retries=3)
+        tables_mock.list_next.assert_called_with(page2,
+            page2.execute.return_value)
+
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_list_rows(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+
+        data_mock = con_mock.tabledata.return_value
+        page1, page2 = mock.Mock(), mock.Mock()
+        page1.execute.return_value = {'rows': [{'f': [{'v': '1'}]}],
+            'pageToken': 'token'}
+        page2.execute.return_value = {'totalRows': '1'}
+        data_mock.list.return_value = page1
+        data_mock.list_next.side_effect = [page2, None]
+
+        result = list(klass.list_rows('project123', 'dataset_id', 'table_id',
+            page_size=1))
+        self.assertEqual(result, [{'f': [{'v': '1'}]}])
+        data_mock.list.assert_called_once_with(projectId='project123',
+            datasetId='dataset_id', tableId='table_id', maxResults=1)
+        page2.execute.assert_called_once_with(num_retries=3)
+
+    def test_job_statistics(self):
+        from gae.connector.bigquery import job_statistics
+
+
+        job = {'statistics': {'creationTime': '400', 'startTime': '1000',
+            'endTime': '3500', 'totalBytesProcessed': '20', 'query': {
+            'totalSlotMs': '700', 'totalBytesProcessed': '20',
+            'totalBytesBilled': '10485760', 'cacheHit': False,
+            'queryPlan': [{'shuffleOutputBytes': '30'},
+            {'shuffleOutputBytes': '12'}, {}]}}}
+        self.assertEqual(job_statistics(job), {'elapsed_ms': 2500,
+            'queued_ms': 600, 'slot_ms': 700, 'shuffle_bytes': 42,
+            'bytes_processed': 20, 'bytes_billed': 10485760,
+            'cache_hit': False, 'creation_time': 400, 'start_time': 1000,
+            'end_time': 3500})
+        self.assertEqual(job_statistics({'statistics': {
+            'totalBytesProcessed': '5'}}), {'elapsed_ms': None,
+            'queued_ms': None, 'slot_ms': 0, 'shuffle_bytes': 0,
+            'bytes_processed': 5, 'bytes_billed': 0, 'cache_hit': False,
+            'creation_time': None, 'start_time': None, 'end_time': None})
+
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_delete_tables(self, disco_mock):
+        con_mock = mock.Mock()
+        disco_mock.build_from_document.return_value = con_mock
+        klass = self._get_target_klass()('cre')
+
+        responses = [None, HttpError(mock.Mock(status=404), 'not found'),
+            None]
+        batches = []
+        def new_batch(callback):
+            batches.append(FakeBatch(responses, callback))
+            return batches[-1]
+        con_mock.new_batch_http_request.side_effect = new_batch
+        con_mock.tables.return_value.delete.side_effect = lambda **kw: kw
+
+        klass.delete_tables('project123', 'dataset_id', ['t1', 't2', 't3'],
+            batch_size=2)
+        self.assertEqual(len(batches), 2)
+        self.assertEqual([r for _, r in batches[1].requests],
+            [{'projectId': 'project123', 'datasetId': 'dataset_id',
+              'tableId': 't3'}])
+
+        responses.append(HttpError(mock.Mock(status=403), 'forbidden'))
+        with self.assertRaises(HttpError):
+            klass.delete_tables('project123', 'dataset_id', ['t1'])
+
+    @mock.patch('gae.connector.bigquery.JobPoller')
+    @mock.patch('gae.connector.bigquery.disco')
+    def test_poll_jobs(self, disco_mock, poller_mock):
+        disco_mock.build_from_document.return_value = 'con'
+        klass = self._get_target_klass()('cre')
+        poller_mock.return_value.wait.return_value = 'results'
+        result = klass.poll_jobs(['job1', 'job2'], 10)
+        self.assertEqual(result, 'results')
+        poller_mock.assert_called_once_with('con')
+        poller_mock.return_value.wait.assert_called_once_with(['job1',
+            'job2'], 10)
+
+
+class FakeBatch(object):
+    def __init__(self, responses, callback):
+        self.responses = responses
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self.requests:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                self.callback(request_id, None, response)
+            else:
+                self.callback(request_id, response, None)
+
+
+class TestJobPoller(unittest.TestCase):
+    @staticmethod
+    def _get_target_klass():
+        from gae.connector.bigquery import JobPoller
+
+
+        return JobPoller
+
+    @staticmethod
+    def _make_job(job_id, state='DONE', **kwargs):
+        status = dict([('state', state)] + kwargs.items())
+        return {'jobReference': {'projectId': 'project123', 'jobId': job_id},
+                'status': status}
+
+    def test_cto(self):
+        klass = self._get_target_klass()('con')
+        self.assertEqual(klass.con, 'con')
+        self.assertEqual(klass.initial_delay, 1)
+        self.assertEqual(klass.max_delay, 30)
+        self.assertEqual(klass.multiplier, 2)
+        self.assertEqual(klass.jitter, 0.5)
+        self.assertEqual(klass.batch_size, 50)
+
+    @mock.patch('gae.connector.bigquery.random')
+    def test_delay(self, random_mock):
+        random_mock.random.return_value = 0
+        klass = self._get_target_klass()('con')
+        self.assertEqual([klass.delay(i) for i in range(7)],
+            [1, 2, 4, 8, 16, 30, 30])
+        self.assertEqual(klass.delay(5, expected_runtime=10), 10)
+        self.assertEqual(klass.delay(0, expected_runtime=0.1), 1)
+
+        random_mock.random.return_value = 1
+        self.assertEqual(klass.delay(2), 2)
+
+    @mock.patch('gae.connector.bigquery.time')
+    def test_wait_single_job(self, time_mock):
+        con_mock = mock.Mock()
+        request_mock = con_mock.jobs.return_value.get.return_value
+        request_mock.execute.side_effect = [self._make_job('1', 'RUNNING'),
+            self._make_job('1')]
+        klass = self._get_target_klass()(con_mock)
+        job = self._make_job('1', 'PENDING')
+        job['jobReference']['location'] = 'EU'
+
+        result = list(klass.wait([job]))
+        self.assertEqual(result, [self._make_job('1')])
+        con_mock.jobs.return_value.get.assert_called_with(
+            projectId='project123', jobId='1', location='EU')
+        request_mock.execute.assert_called_with(num_retries=3)
+        con_mock.new_batch_http_request.assert_not_called()
+        self.assertEqual(time_mock.sleep.call_count, 1)
+
+    @mock.patch('gae.connector.bigquery.time')
+    def test_wait_many_jobs(self, time_mock):
+        con_mock = mock.Mock()
+        responses = [self._make_job('0', 'RUNNING'),
+                     self._make_job('1', errorResult='error'),
+                     self._make_job('2', 'RUNNING'),
+                     self._make_job('0', 'RUNNING'),
+                     HttpError(mock.Mock(status=503), 'unavailable'),
+                     self._make_job('0'),
+                     self._make_job('2')]
+        batches = []
+        def new_batch(callback):
+            batches.append(FakeBatch(responses, callback))
+            return batches[-1]
+        con_mock.new_batch_http_request.side_effect = new_batch
+        con_mock.jobs.return_value.get.return_value = 'request'
+        klass = self._get_target_klass()(con_mock, batch_size=2)
+        jobs = [self._make_job(str(i), 'PENDING') for i in range(3)]
+
+        results = klass.wait(jobs)
+        self.assertEqual(next(results), self._make_job('1',
+            errorResult='error'))
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(time_mock.sleep.call_count, 0)
+
+        self.assertEqual(sorted(results, key=lambda r: r['jobReference'][
+            'jobId']), [self._make_job('0'), self._make_job('2')])
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(time_mock.sleep.call_count, 2)
+        # job 2 is polled again after the server error
+        self.assertEqual(con_mock.jobs.return_value.get.call_count, 7)
+
+    def test_wait_raises_client_errors(self):
+        con_mock = mock.Mock()
+        responses = [HttpError(mock.Mock(status=404), 'not found'),
+            self._make_job('1')]
+        con_mock.new_batch_http_request.side_effect = (lambda callback:
+            FakeBatch(responses, callback))
+        klass = self._get_target_klass()(con_mock)
+        jobs = [self._make_job(str(i), 'PENDING') for i in range(2)]
+        with self.assertRaises(HttpError):
+            list(klass.wait(jobs))
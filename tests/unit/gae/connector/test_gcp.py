@@ -64,3 +64,43 @@ class TestGCPFactory(unittest.TestCase):
         con = klass.bigquery
         self.assertEqual(con, 'con')
         self.assertTrue(klass.bigquery is not None)
+        bq_mock.assert_called_once_with(klass._credentials, con=None)
+
+        # clients are shared by services of the thread with same credentials
+        other = self._get_target_klass()(klass._credentials)
+        self.assertTrue(other.bigquery is con)
+        bq_mock.assert_called_once_with(klass._credentials, con=None)
+
+        bq_mock.return_value = 'other_con'
+        other = self._get_target_klass()(self._make_credentials())
+        self.assertEqual(other.bigquery, 'other_con')
+
+    @mock.patch('gae.connector.gcp._auth')
+    @mock.patch('gae.connector.gcp.BigQueryService')
+    def test_warmup(self, bq_mock, auth_mock):
+        klass = self._get_target_klass()(self._make_credentials())
+        auth_mock.is_valid.return_value = True
+        klass.warmup()
+        bq_mock.assert_called_once_with(klass._credentials, con=None)
+        auth_mock.refresh_credentials.assert_not_called()
+
+        auth_mock.is_valid.return_value = False
+        klass.warmup()
+        bq_mock.assert_called_once_with(klass._credentials, con=None)
+        auth_mock.refresh_credentials.assert_called_once_with(
+            klass._credentials)
+
+    @mock.patch('gae.connector.gcp.os')
+    @mock.patch('gae.connector.gcp.app_engine')
+    def test_cto_local_backend(self, app_mock, os_mock):
+        os_mock.environ = {}
+        klass = self._get_target_klass()(backend='backend')
+        self.assertEqual(klass._backend, 'backend')
+        self.assertTrue(klass._credentials is None)
+        app_mock.Credentials.assert_not_called()
+
+        os_mock.environ = {'PHOENIX_BACKEND': 'local'}
+        klass = self._get_target_klass()()
+        self.assertEqual(type(klass._backend).__name__, 'LocalBigQuery')
+        self.assertTrue(klass.bigquery.con is klass._backend)
+        app_mock.Credentials.assert_not_called()
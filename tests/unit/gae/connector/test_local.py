@@ -0,0 +1,247 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import unittest
+import mock
+
+from googleapiclient.errors import HttpError
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestLocalBigQuery(unittest.TestCase):
+    @staticmethod
+    def _get_target_klass():
+        from gae.connector.local import LocalBigQuery
+
+
+        return LocalBigQuery
+
+    def _make_backend(self, **kwargs):
+        self.clock = FakeClock()
+        return self._get_target_klass()(clock=self.clock,
+            sleep=self.clock.sleep, **kwargs)
+
+    @staticmethod
+    def _query_body(job_id='job1', table_id='table$20171010'):
+        return {'jobReference': {'projectId': 'project123', 'jobId': job_id},
+                'configuration': {'query': {'query': 'SELECT 1',
+                    'destinationTable': {'projectId': 'project123',
+                    'datasetId': 'dataset', 'tableId': table_id}}}}
+
+    def test_jobs(self):
+        klass = self._make_backend(job_duration=10, bytes_processed=100,
+            query_rows=[{'f': [{'v': '1'}]}], latency=1)
+        job = klass.jobs().insert(projectId='project123',
+            body=self._query_body()).execute(num_retries=3)
+        self.assertEqual(job['status'], {'state': 'RUNNING'})
+        self.assertEqual(job['statistics']['totalBytesProcessed'], '100')
+        self.assertEqual(self.clock.now, 1001)
+
+        with self.assertRaises(HttpError) as ctx:
+            klass.jobs().insert(projectId='project123',
+                body=self._query_body()).execute()
+        self.assertEqual(ctx.exception.resp.status, 409)
+
+        self.clock.now += 10
+        job = klass.jobs().get(projectId='project123',
+            jobId='job1').execute()
+        self.assertEqual(job['status'], {'state': 'DONE'})
+        self.assertEqual(job['statistics']['startTime'], '1001000')
+        self.assertEqual(job['statistics']['endTime'], '1011000')
+        table = klass.tables().get(projectId='project123', datasetId='dataset',
+            tableId='table').execute()
+        self.assertEqual(table['tableReference']['tableId'], 'table')
+        self.assertEqual(klass.calls['jobs.insert'], 2)
+        self.assertEqual(klass.calls['jobs.get'], 1)
+
+        with self.assertRaises(HttpError) as ctx:
+            klass.jobs().get(projectId='project123', jobId='job2').execute()
+        self.assertEqual(ctx.exception.resp.status, 404)
+
+    def test_jobs_anonymous_destination(self):
+        klass = self._make_backend(query_rows=[{'f': [{'v': '1'}]}])
+        job = klass.jobs().insert(projectId='project123', body={
+            'configuration': {'query': {'query': 'SELECT 1'}}}).execute()
+        self.assertEqual(job['configuration']['query']['destinationTable'],
+            {'projectId': 'project123', 'datasetId': '_anonymous',
+             'tableId': 'anon_job_0'})
+        self.assertEqual(klass.tables_store[('project123', '_anonymous',
+            'anon_job_0')]['rows'], [{'f': [{'v': '1'}]}])
+
+        job = klass.jobs().insert(projectId='project123', body={
+            'configuration': {'query': {'query': '#standardSQL\n'
+            'insert INTO t SELECT 1'}}}).execute()
+        self.assertNotIn('destinationTable', job['configuration']['query'])
+
+    def test_dry_run(self):
+        klass = self._make_backend(bytes_processed=lambda body: 10)
+        body = self._query_body()
+        body['configuration']['dryRun'] = True
+        job = klass.jobs().insert(projectId='project123', body=body).execute()
+        self.assertEqual(job['statistics']['totalBytesProcessed'], '10')
+        self.assertEqual(klass.jobs_store, {})
+
+    def test_tables(self):
+        klass = self._make_backend()
+        for i in range(5):
+            klass.create_table('project123', 'dataset', 'table{}'.format(i),
+                rows=[{'f': [{'v': str(j)}]} for j in range(i)])
+
+        resource = klass.tables()
+        request = resource.list(projectId='project123', datasetId='dataset',
+            maxResults=2)
+        ids = []
+        while request is not None:
+            response = request.execute()
+            ids.extend(t['tableReference']['tableId'] for t in
+                response['tables'])
+            request = resource.list_next(request, response)
+        self.assertEqual(ids, ['table{}'.format(i) for i in range(5)])
+        self.assertEqual(klass.calls['tables.list'], 3)
+
+        resource.delete(projectId='project123', datasetId='dataset',
+            tableId='table0').execute()
+        with self.assertRaises(HttpError) as ctx:
+            resource.get(projectId='project123', datasetId='dataset',
+                tableId='table0').execute()
+        self.assertEqual(ctx.exception.resp.status, 404)
+
+        data = klass.tabledata()
+        request = data.list(projectId='project123', datasetId='dataset',
+            tableId='table4', maxResults=3)
+        response = request.execute()
+        self.assertEqual(len(response['rows']), 3)
+        self.assertEqual(response['totalRows'], '4')
+        response = data.list_next(request, response).execute()
+        self.assertEqual(response['rows'], [{'f': [{'v': '3'}]}])
+        self.assertEqual(data.list_next(request, response), None)
+
+    def test_batch(self):
+        klass = self._make_backend(latency=1)
+        klass.create_table('project123', 'dataset', 'table1')
+        results = []
+        batch = klass.new_batch_http_request(
+            callback=lambda *args: results.append(args))
+        for table_id in ('table1', 'table2'):
+            batch.add(klass.tables().delete(projectId='project123',
+                datasetId='dataset', tableId=table_id), request_id=table_id)
+        batch.execute()
+        self.assertEqual(results[0], ('table1', '', None))
+        self.assertEqual(results[1][2].resp.status, 404)
+        self.assertEqual(klass.calls['batch'], 1)
+        self.assertEqual(self.clock.now, 1001)
+
+    def test_quota_errors(self):
+        klass = self._make_backend(quota_error_rate=1)
+        with self.assertRaises(HttpError) as ctx:
+            klass.tables().list(projectId='project123',
+                datasetId='dataset').execute(num_retries=2)
+        self.assertEqual(ctx.exception.resp.status, 403)
+        self.assertEqual(klass.calls['tables.list'], 3)
+        self.assertEqual(klass.calls['quota_errors'], 3)
+        self.assertTrue(self.clock.now > 1000)
+
+    def test_bigquery_service(self):
+        from gae.connector.bigquery import BigQueryService
+
+
+        klass = self._make_backend(job_duration=5)
+        service = BigQueryService(None, con=klass)
+        jobs = [service.execute_job('project123', self._query_body(
+            'job{}'.format(i), 'table{}'.format(i))) for i in range(3)]
+        with mock.patch('gae.connector.bigquery.time') as time_mock:
+            time_mock.sleep.side_effect = self.clock.sleep
+            results = list(service.poll_jobs(jobs))
+        self.assertEqual(len(results), 3)
+        self.assertTrue(klass.calls['batch'] >= 2)
+
+        service.delete_tables('project123', 'dataset', ['table0', 'table1',
+            'table9'])
+        self.assertEqual(list(service.list_tables('project123', 'dataset')),
+            ['table2'])
+        # existing job is returned instead of raising
+        job = service.execute_job('project123', self._query_body('job0'))
+        self.assertEqual(job['status'], {'state': 'DONE'})
+
+        schema = [{'name': 'f', 'type': 'STRING'}]
+        self.assertTrue(service.create_table('project123', 'dataset',
+            'table9', schema))
+        self.assertFalse(service.create_table('project123', 'dataset',
+            'table9', schema))
+        self.assertEqual(klass.tables_store[('project123', 'dataset',
+            'table9')]['resource']['schema'], {'fields': schema})
+
+
+class TestLocalTaskQueue(unittest.TestCase):
+    @staticmethod
+    def _get_target_klass():
+        from gae.connector.local import LocalTaskQueue
+
+
+        return LocalTaskQueue
+
+    def test_add(self):
+        klass = self._get_target_klass()(clock=lambda: 0)
+        task = klass.add(url='/url', target='worker', params={'a': 1},
+            name='task1', countdown=10)
+        self.assertTrue(task.was_enqueued)
+        self.assertEqual(task.eta.second, 10)
+
+        with self.assertRaises(klass.TaskAlreadyExistsError):
+            klass.add(url='/url', name='task1')
+
+        tasks = [klass.Task(url='/url', name=name) for name in ('task1',
+            'task2')]
+        with self.assertRaises(klass.TaskAlreadyExistsError):
+            klass.Queue('default').add(tasks)
+        self.assertEqual([t.was_enqueued for t in tasks], [False, True])
+        self.assertEqual(klass.calls['taskqueue.add'], 3)
+
+        with self.assertRaises(Exception):
+            klass.Queue().add([klass.Task(url='/url')] * 101)
+
+    def test_run_tasks(self):
+        now = [0]
+        def sleep(seconds):
+            now[0] += seconds
+        klass = self._get_target_klass()(clock=lambda: now[0], sleep=sleep)
+        klass.add(url='/url', name='b', countdown=2)
+        klass.add(url='/url', name='a', countdown=1)
+        handled = []
+        def handler(task):
+            handled.append((task.name, task.enqueued, now[0]))
+            if task.name == 'a':
+                klass.add(url='/url', name='c', countdown=3)
+        self.assertEqual(klass.run_tasks(handler), 3)
+        # tasks wait for their ETA, "c" was enqueued once "a" ran
+        self.assertEqual(handled, [('a', 0, 1), ('b', 0, 2), ('c', 1, 4)])
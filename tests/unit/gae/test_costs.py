@@ -0,0 +1,77 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+
+class TestCosts(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    @staticmethod
+    def _get_target_module():
+        import costs
+
+
+        return costs
+
+    def test_record_cost(self):
+        costs = self._get_target_module()
+        costs.record_cost('job', '20171010', '100')
+        costs.record_cost('job', '20171010', 200)
+        result = costs.QueryCost.query().fetch()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].key.id(), 'job:20171010')
+        self.assertEqual(result[0].job_name, 'job')
+        self.assertEqual(result[0].date, '20171010')
+        self.assertEqual(result[0].total_bytes_processed, 200)
+
+    def test_forecast_cost(self):
+        costs = self._get_target_module()
+        result = costs.forecast_cost('job', ['20171010', '20171011'])
+        self.assertEqual(result, {'dates': 2, 'known': 0, 'history': 0,
+            'average_bytes_processed': 0, 'total_bytes_processed': 0})
+
+        costs.record_cost('job', '20171001', 100)
+        costs.record_cost('job', '20171002', 200)
+        costs.record_cost('job', '20171003', 600)
+        costs.record_cost('other_job', '20171003', 1000)
+
+        result = costs.forecast_cost('job', ['20171002', '20171010',
+            '20171011'])
+        self.assertEqual(result, {'dates': 3, 'known': 1, 'history': 3,
+            'average_bytes_processed': 300, 'total_bytes_processed': 800})
+
+        result = costs.forecast_cost('job', ['20171010'], history_size=2)
+        self.assertEqual(result['average_bytes_processed'], 400)
+        self.assertEqual(result['total_bytes_processed'], 400)
@@ -0,0 +1,67 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+
+class TestDag(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    @staticmethod
+    def _get_target_module():
+        import dag
+
+
+        return dag
+
+    def test_mark_done(self):
+        dag = self._get_target_module()
+        dag.mark_done('dag', 'a', '20171010')
+        dag.mark_done('dag', 'a', '20171010')
+        dag.mark_done('dag', 'a', '20171010', 'x')
+        result = dag.NodeRun.query().fetch()
+        self.assertEqual(sorted(run.key.id() for run in result),
+            ['dag:a:20171010', 'dag:a:20171010:x'])
+
+    def test_done_nodes(self):
+        dag = self._get_target_module()
+        self.assertEqual(dag.done_nodes('dag', ['a', 'b'], '20171010'), set())
+        dag.mark_done('dag', 'a', '20171010')
+        dag.mark_done('dag', 'b', '20171011')
+        dag.mark_done('dag', 'b', '20171010', 'x')
+        dag.mark_done('other', 'b', '20171010')
+        self.assertEqual(dag.done_nodes('dag', ['a', 'b'], '20171010'),
+            set(['a']))
+        self.assertEqual(dag.done_nodes('dag', ['a', 'b'], '20171010', 'x'),
+            set(['b']))
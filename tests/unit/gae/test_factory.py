@@ -45,3 +45,36 @@ class TestJobsFactory(unittest.TestCase):
         self.assertEqual(type(scheduler).__name__, 'SchedulerJob')
         self.assertEqual(scheduler.url, '/update_dashboard_tables')
         self.assertEqual(scheduler.target, 'worker')
+
+        scheduler = klass.factor_job('backfill_dashboard_tables')
+        self.assertEqual(type(scheduler).__name__, 'BackfillSchedulerJob')
+        self.assertEqual(scheduler.url, '/update_dashboard_tables')
+        self.assertEqual(scheduler.target, 'worker')
+
+        scheduler = klass.factor_job('sweep_dashboard_tables')
+        self.assertEqual(type(scheduler).__name__, 'SchedulerJob')
+        self.assertEqual(scheduler.url, '/sweep_dashboard_tables')
+        self.assertEqual(scheduler.target, 'worker')
+
+        scheduler = klass.factor_job('update_search_terms')
+        self.assertEqual(type(scheduler).__name__, 'SchedulerJob')
+        self.assertEqual(scheduler.url, '/update_search_terms')
+        self.assertEqual(scheduler.target, 'worker')
+
+        scheduler = klass.factor_job('backfill_search_terms')
+        self.assertEqual(type(scheduler).__name__, 'BackfillSchedulerJob')
+        self.assertEqual(scheduler.url, '/update_search_terms')
+        self.assertEqual(scheduler.target, 'worker')
+
+        scheduler = klass.factor_job('update_search_rollups')
+        self.assertEqual(type(scheduler).__name__, 'SchedulerJob')
+        self.assertEqual(scheduler.url, '/update_search_rollups')
+        self.assertEqual(scheduler.target, 'worker')
+
+        scheduler = klass.factor_job('daily_pipeline')
+        self.assertEqual(type(scheduler).__name__, 'DagSchedulerJob')
+        self.assertEqual(scheduler.name, 'daily_pipeline')
+        self.assertEqual(scheduler.target, 'worker')
+        self.assertEqual(scheduler.order, ['update_search_terms',
+            'update_dashboard_tables', 'sweep_dashboard_tables',
+            'update_search_rollups'])
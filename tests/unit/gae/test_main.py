@@ -66,3 +66,60 @@ class TestMainService(unittest.TestCase, BaseTests):
         self.assertEqual(response.status_int, 200)
 
         self.assertEqual(response.text, "OK!")
+
+    @mock.patch('gae.main.jobs_factory')
+    def test_run_job_forecast(self, factory_mock):
+        scheduler_mock = mock.Mock()
+        scheduler_mock.forecast.return_value = {'total_bytes_processed': 10}
+        factory_mock.factor_job.return_value = scheduler_mock
+        response = self.test_app.get('/run_job/job_name_test/?forecast=1'
+            '&from=20171010&to=20171011')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(json.loads(response.text),
+            {'total_bytes_processed': 10})
+        scheduler_mock.forecast.assert_called_once_with(ImmutableMultiDict([
+            ('forecast', '1'), ('from', '20171010'), ('to', '20171011')]))
+        scheduler_mock.run.assert_not_called()
+
+    @mock.patch('gae.main.jobs_factory')
+    def test_run_job_error(self, factory_mock):
+        factory_mock.factor_job.side_effect = ValueError('unknown job')
+        response = self.test_app.get('/run_job/job_name_test/',
+            expect_errors=True)
+        self.assertEqual(response.status_int, 500)
+        self.assertEqual(response.text, 'unknown job')
+
+    @mock.patch('gae.main.search_kpis')
+    def test_read_search_kpis(self, kpis_mock):
+        kpis_mock.normalize_query.return_value = ('20171001', '20171010',
+            'tenis')
+        kpis_mock.read_kpis.return_value = ('etag1', '{"kpis": []}')
+        response = self.test_app.get('/search_kpis/', {'from': '20171001',
+            'to': '20171010', 'search': 'Tenis'})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.json, {'kpis': []})
+        self.assertEqual(response.headers['ETag'], '"etag1"')
+        kpis_mock.read_kpis.assert_called_once_with('20171001', '20171010',
+            'tenis')
+        self.assertEqual(kpis_mock.normalize_query.call_args[0][0].to_dict(),
+            {'from': '20171001', 'to': '20171010', 'search': 'Tenis'})
+
+        response = self.test_app.get('/search_kpis/',
+            headers={'If-None-Match': '"etag1"'})
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.body, '')
+
+        kpis_mock.normalize_query.side_effect = ValueError('invalid date')
+        response = self.test_app.get('/search_kpis/', {'from': 'x'},
+            expect_errors=True)
+        self.assertEqual(response.status_int, 400)
+
+    def test_latency(self):
+        self.test_app.get('/_ah/warmup')
+        response = self.test_app.get('/_admin/latency/')
+        self.assertEqual(response.status_int, 200)
+        self.assertIn('/_ah/warmup', json.loads(response.text))
+
+    def test_warmup(self):
+        response = self.test_app.get('/_ah/warmup')
+        self.assertEqual(response.status_int, 200)
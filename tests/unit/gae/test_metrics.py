@@ -0,0 +1,81 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    @staticmethod
+    def _get_target_module():
+        import metrics
+
+
+        return metrics
+
+    def test_record_metric(self):
+        metrics = self._get_target_module()
+        metrics.record_metric('job', '20171010', {'slot_ms': 1})
+        metrics.record_metric('job', '20171010', {'elapsed_ms': 2500,
+            'queued_ms': 600, 'slot_ms': 700, 'shuffle_bytes': 42,
+            'bytes_processed': 20, 'bytes_billed': 10485760,
+            'cache_hit': False, 'creation_time': 400, 'start_time': 1000,
+            'end_time': 3500}, task_wait_ms=30, handling_ms=4000)
+        result = metrics.JobMetric.query().fetch()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].key.id(), 'job:20171010')
+        self.assertEqual(result[0].to_json_dict(), {'job_name': 'job',
+            'date': '20171010', 'elapsed_ms': 2500, 'queued_ms': 600,
+            'slot_ms': 700, 'shuffle_bytes': 42, 'bytes_processed': 20,
+            'bytes_billed': 10485760, 'cache_hit': False,
+            'creation_time': 400, 'start_time': 1000, 'end_time': 3500,
+            'task_wait_ms': 30, 'handling_ms': 4000})
+
+    def test_history(self):
+        metrics = self._get_target_module()
+        for job_name, date in [('job', '20171001'), ('job', '20171003'),
+            ('job', '20171002'), ('other_job', '20171003')]:
+            metrics.record_metric(job_name, date, {'slot_ms': 1})
+
+        result = metrics.job_history('job')
+        self.assertEqual([metric.date for metric in result], ['20171003',
+            '20171002', '20171001'])
+        result = metrics.job_history('job', limit=1)
+        self.assertEqual([metric.date for metric in result], ['20171003'])
+
+        result = metrics.date_history('20171003')
+        self.assertEqual([metric.job_name for metric in result], ['job',
+            'other_job'])
+        self.assertEqual(metrics.date_history('20171010'), [])
@@ -0,0 +1,174 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import json
+import unittest
+import collections
+
+import mock
+import webtest
+from flask import Flask
+from google.appengine.api import memcache
+from google.appengine.ext import testbed
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    @staticmethod
+    def _get_target_klass():
+        from profiling import LatencyHistogram
+
+
+        return LatencyHistogram
+
+    def test_summary(self):
+        klass = self._get_target_klass()(buckets=(10, 100, 1000))
+        self.assertEqual(klass.summary(), {'count': 0, 'mean_ms': None,
+            'max_ms': 0., 'p50_ms': None, 'p95_ms': None, 'p99_ms': None})
+
+        for latency_ms in [5] * 50 + [50] * 45 + [500] * 4 + [3000]:
+            klass.add(latency_ms)
+        self.assertEqual(klass.counts, [50, 45, 4, 1])
+        self.assertEqual(klass.summary(), {'count': 100, 'mean_ms': 75.0,
+            'max_ms': 3000, 'p50_ms': 10, 'p95_ms': 100, 'p99_ms': 1000})
+        self.assertEqual(klass.percentile(1), 3000)
+
+        klass = self._get_target_klass()(buckets=(10, 100, 1000))
+        klass.add(20)
+        self.assertEqual(klass.percentile(0.5), 20)
+
+
+class TestProfilingMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    @staticmethod
+    def _get_target_module():
+        import profiling
+
+
+        return profiling
+
+    def build_app(self, sample_rate=0.):
+        profiling = self._get_target_module()
+        app = Flask(__name__)
+
+        @app.route("/items/<item>/")
+        def item(item):
+            memcache.set(item, 1)
+            memcache.get(item)
+            return item
+
+        @app.route("/fail/")
+        def fail():
+            return "failed", 500
+
+        self.metrics = profiling.RequestMetrics()
+        self.profiles = profiling.ProfileStore(size=2)
+        app.wsgi_app = profiling.ProfilingMiddleware(app.wsgi_app,
+            profiling.flask_route(app), sample_rate, self.metrics,
+            self.profiles)
+        return webtest.TestApp(app)
+
+    def test_metrics(self):
+        test_app = self.build_app()
+        test_app.get('/items/a/')
+        test_app.get('/items/b/')
+        test_app.get('/fail/', expect_errors=True)
+        test_app.get('/missing/', expect_errors=True)
+
+        summary = self.metrics.summary()
+        self.assertEqual(sorted(summary), ['/fail/', '/items/<item>/',
+            'unmatched'])
+        self.assertEqual(summary['/items/<item>/']['count'], 2)
+        self.assertEqual(summary['/items/<item>/']['errors'], 0)
+        self.assertEqual(summary['/items/<item>/']['api_calls'],
+            {'memcache': 4})
+        self.assertEqual(summary['/items/<item>/']['api_calls_per_request'],
+            2.)
+        self.assertEqual(summary['/fail/']['errors'], 1)
+        self.assertEqual(summary['/fail/']['api_calls'], {})
+        self.assertEqual(self.profiles.list(), [])
+
+        # calls outside requests are not counted
+        memcache.get('a')
+        self.assertEqual(self.metrics.summary()['/items/<item>/'][
+            'api_calls'], {'memcache': 4})
+
+    def test_profiles(self):
+        test_app = self.build_app()
+        for item in ('a', 'b', 'c'):
+            test_app.get('/items/{}/'.format(item),
+                headers={'X-Phoenix-Profile': '1'})
+        test_app.get('/items/d/')
+
+        profiles = self.profiles.list()
+        self.assertEqual([p['id'] for p in profiles], [3, 2])
+        self.assertEqual(profiles[0]['path'], '/items/c/')
+        self.assertEqual(profiles[0]['route'], '/items/<item>/')
+        self.assertEqual(profiles[0]['status'], 200)
+        self.assertEqual(profiles[0]['api_calls'], {'memcache': 2})
+        self.assertTrue('stats' not in profiles[0])
+        self.assertIn('function calls', self.profiles.get(3)['stats'])
+        self.assertEqual(self.profiles.get(1), None)
+
+        test_app = self.build_app(sample_rate=1.)
+        test_app.get('/items/a/')
+        self.assertEqual(len(self.profiles.list()), 1)
+
+    def test_peak_memory_kb(self):
+        profiling = self._get_target_module()
+        self.assertTrue(profiling.peak_memory_kb() > 0)
+
+        with mock.patch.object(profiling, 'resource', None), \
+            mock.patch.object(profiling, 'runtime') as runtime_mock:
+            runtime_mock.memory_usage.return_value.current.return_value = 1.5
+            self.assertEqual(profiling.peak_memory_kb(), 1536)
+
+    def test_admin(self):
+        profiling = self._get_target_module()
+        app = Flask(__name__)
+        app.register_blueprint(profiling.admin, url_prefix='/_admin')
+        test_app = webtest.TestApp(app)
+        metrics = profiling.RequestMetrics()
+        metrics.record('/route/', 10., 200, collections.Counter())
+        profiles = profiling.ProfileStore()
+        profiles.add({'route': '/route/', 'stats': 'stats'})
+
+        with mock.patch.object(profiling, 'metrics', metrics), \
+            mock.patch.object(profiling, 'profiles', profiles):
+            response = test_app.get('/_admin/latency/')
+            self.assertEqual(json.loads(response.text)['/route/']['count'],
+                1)
+            response = test_app.get('/_admin/profiles/')
+            self.assertEqual(json.loads(response.text), [{'id': 1,
+                'route': '/route/'}])
+            response = test_app.get('/_admin/profiles/1/')
+            self.assertEqual(response.text, 'stats')
+            response = test_app.get('/_admin/profiles/2/',
+                expect_errors=True)
+            self.assertEqual(response.status_int, 404)
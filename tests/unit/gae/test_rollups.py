@@ -0,0 +1,87 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    @staticmethod
+    def _get_target_module():
+        import rollups
+
+
+        return rollups
+
+    def test_save_state(self):
+        rollups = self._get_target_module()
+        rollups.save_state(7, '20171010')
+        rollups.save_state(7, '20171011')
+        rollups.save_state(30, '20171009')
+        result = rollups.RollupState.build_key(7).get()
+        self.assertEqual(result.window, 7)
+        self.assertEqual(result.end_date, '20171011')
+        self.assertEqual(len(rollups.RollupState.query().fetch()), 2)
+
+    def test_plan_update(self):
+        rollups = self._get_target_module()
+        self.assertEqual(rollups.plan_update(7, '20171010'),
+            ('rebuild', '20171010'))
+
+        rollups.save_state(7, '20171010')
+        self.assertEqual(rollups.plan_update(7, '20171011'),
+            ('merge', '20171011'))
+        self.assertEqual(rollups.plan_update(7, '20171011', rebuild=True),
+            ('rebuild', '20171011'))
+        self.assertEqual(rollups.plan_update(7, '20171013'),
+            ('rebuild', '20171013'))
+        self.assertEqual(rollups.plan_update(30, '20171011'),
+            ('rebuild', '20171011'))
+
+        # dates still inside the window rebuild it keeping its end date
+        self.assertEqual(rollups.plan_update(7, '20171010'),
+            (None, '20171010'))
+        self.assertEqual(rollups.plan_update(7, '20171010', rebuild=True),
+            ('rebuild', '20171010'))
+        self.assertEqual(rollups.plan_update(7, '20171004'),
+            ('rebuild', '20171010'))
+        self.assertEqual(rollups.plan_update(7, '20171004', rebuild=True),
+            ('rebuild', '20171010'))
+        self.assertEqual(rollups.plan_update(7, '20171003'),
+            (None, '20171010'))
+
+        rollups.save_state(7, '20171231')
+        self.assertEqual(rollups.plan_update(7, '20180101'),
+            ('merge', '20180101'))
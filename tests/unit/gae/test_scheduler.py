@@ -25,11 +25,50 @@ import sys
 import os
 import mock
 import unittest
+import datetime
 from collections import namedtuple
 
 from google.appengine.ext import testbed
 
 
+class TestEnqueueCheck(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_taskqueue_stub(root_path='./gae/')
+        self.taskqueue_stub = self.testbed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME)
+
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+
+    @staticmethod
+    def _get_target_module():
+        import scheduler
+
+
+        return scheduler
+
+
+    def test_enqueue_check(self):
+        scheduler = self._get_target_module()
+        task = scheduler.enqueue_check('/check', 'target', {'a': '1'}, 30)
+        result = self.taskqueue_stub.get_filtered_tasks()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].url, '/check')
+        self.assertEqual(result[0].payload, 'a=1')
+        self.assertEqual(result[0].name, task.name)
+        self.assertTrue(result[0].eta_posix - task.eta_posix < 1)
+
+        scheduler.enqueue_check('/check', 'target', {'a': '2'}, 30,
+            queue_name='dag-checks')
+        result = self.taskqueue_stub.get_filtered_tasks(
+            queue_names='dag-checks')
+        self.assertEqual([t.payload for t in result], ['a=2'])
+
+
 class TestSchedulerJob(unittest.TestCase):
     def setUp(self):
         self.testbed = testbed.Testbed()
@@ -76,6 +115,54 @@ class TestSchedulerJob(unittest.TestCase):
         self.assertEqual(task.url, '/url')
         self.assertTrue(task.target is not None)       
         self.assertEqual(task.payload, 'date=xxxx') 
+        self.assertEqual(task.name, 'url-xxxx')
+
+        # same job and date is not enqueued twice
+        klass = self._get_target_klass()('/url', 'target')
+        klass.run(args)
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 2)
+        self.assertEqual(klass.skipped, ['url-xxxx'])
+        self.assertEqual(str(klass), 'Task url-xxxx already enqueued')
+
+        klass.run({'date': 'xxxx', 'rerun': 'a/1'})
+        task = self.taskqueue_stub.get_filtered_tasks(
+            name='url-xxxx-a1')[0]
+        self.assertEqual(task.payload, 'date=xxxx&rerun=a%2F1')
+
+
+    def test_run_no_date(self):
+        klass = self._get_target_klass()('/url', 'target')
+        klass.run({})
+        date = (datetime.datetime.now() - datetime.timedelta(days=1)
+            ).strftime("%Y%m%d")
+        task = self.taskqueue_stub.get_filtered_tasks()[0]
+        self.assertEqual(task.name, 'url-{}'.format(date))
+        self.assertEqual(task.payload, 'date={}'.format(date))
+
+
+    def test_task_name(self):
+        klass = self._get_target_klass()('/url/job/', 'target')
+        self.assertEqual(klass.job_name, 'url_job')
+        self.assertEqual(klass.task_name('20171010'), 'url_job-20171010')
+        self.assertEqual(klass.task_name('20171010', 'x.1'),
+            'url_job-20171010-x1')
+
+
+    def test_dates(self):
+        klass = self._get_target_klass()('/url', 'target')
+        self.assertEqual(klass.dates({'date': '20171010'}), ['20171010'])
+        expected = (datetime.datetime.now() - datetime.timedelta(days=1)
+            ).strftime("%Y%m%d")
+        self.assertEqual(klass.dates({}), [expected])
+
+
+    @mock.patch('scheduler.costs')
+    def test_forecast(self, costs_mock):
+        costs_mock.forecast_cost.return_value = 'forecast'
+        klass = self._get_target_klass()('/url', 'target')
+        self.assertEqual(klass.forecast({'date': '20171010'}), 'forecast')
+        costs_mock.forecast_cost.assert_called_once_with('url', ['20171010'])
+        self.assertEqual(self.taskqueue_stub.get_filtered_tasks(), [])
 
 
     def test___str__(self):
@@ -85,3 +172,228 @@ class TestSchedulerJob(unittest.TestCase):
         task_mock = args("1", "2") 
         klass.task = task_mock
         self.assertEqual(str(klass), "Task 1 enqued, ETA 2")
+
+
+class TestBackfillSchedulerJob(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_taskqueue_stub('./gae/')
+        self.taskqueue_stub = self.testbed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME)
+
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+
+    @staticmethod
+    def _get_target_klass(): 
+        from scheduler import BackfillSchedulerJob
+
+
+        return BackfillSchedulerJob
+
+
+    def test_cto(self):
+        klass = self._get_target_klass()('/url', 'target')
+        self.assertEqual(klass.url, '/url')
+        self.assertEqual(klass.target, 'target')
+        self.assertEqual(klass.countdown, 60)
+        self.assertEqual(klass.queue_name, 'default')
+        self.assertEqual(klass.tasks, [])
+
+
+    def test_run(self):
+        klass = self._get_target_klass()(None, None)
+        with self.assertRaises(ValueError):
+            klass.run({'from': '20171001', 'to': '20171003'})
+
+        klass = self._get_target_klass()('/url', 'target')
+        with self.assertRaises(ValueError):
+            klass.run({})
+
+        with self.assertRaises(ValueError):
+            klass.run({'from': '20171003', 'to': '20171001'})
+
+        klass.run({'from': '20171001', 'to': '20171003', 'key': 'value'})
+        tasks = sorted(self.taskqueue_stub.get_filtered_tasks(),
+            key=lambda t: t.eta)
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual([t.payload for t in tasks], ['date=20171001&key=value',
+            'date=20171002&key=value', 'date=20171003&key=value'])
+        self.assertTrue(all(t.url == '/url' for t in tasks))
+        self.assertEqual([t.name for t in tasks], ['url-20171001',
+            'url-20171002', 'url-20171003'])
+        self.assertEqual((tasks[2].eta - tasks[0].eta).seconds, 120)
+        self.assertEqual(len(klass.tasks), 3)
+
+        # dates already enqueued are skipped
+        klass = self._get_target_klass()('/url', 'target')
+        klass.run({'from': '20171003', 'to': '20171004'})
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 4)
+        self.assertEqual([t.name for t in klass.tasks], ['url-20171004'])
+        self.assertEqual(klass.skipped, ['url-20171003'])
+
+
+    def test_dates(self):
+        klass = self._get_target_klass()('/url', 'target')
+        self.assertEqual(klass.dates({'from': '20171010', 'to': '20171011'}),
+            ['20171010', '20171011'])
+        with self.assertRaises(ValueError):
+            klass.dates({'from': '20171010'})
+
+
+    def test_run_batches(self):
+        from google.appengine.api import taskqueue
+
+
+        klass = self._get_target_klass()('/url', 'target', countdown=1)
+        with mock.patch('scheduler.taskqueue.Queue.add', autospec=True,
+            side_effect=taskqueue.Queue.add) as add_mock:
+            klass.run({'from': '20170101', 'to': '20170531'})
+        self.assertEqual(add_mock.call_count, 2)
+        self.assertEqual(len(add_mock.call_args_list[0][0][1]), 100)
+        self.assertEqual(len(add_mock.call_args_list[1][0][1]), 51)
+        self.assertEqual(len(klass.tasks), 151)
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 151)
+
+
+    def test___str__(self):
+        klass = self._get_target_klass()('/url', 'target')
+        self.assertEqual(str(klass), "No task has been enqueued so far")
+        args = namedtuple("task", ["name", "eta"])
+        klass.tasks = [args("1", "2"), args("3", "4")]
+        klass.task = klass.tasks[-1]
+        klass.skipped = ["5"]
+        self.assertEqual(str(klass),
+            "2 tasks enqued, 1 already enqueued, last ETA 4")
+
+
+class TestDagSchedulerJob(unittest.TestCase):
+    nodes = {'a': {'url': '/a'},
+             'b': {'url': '/b', 'upstream': ['a'], 'queue_name': 'dag'},
+             'c': {'url': '/c', 'upstream': ['a']},
+             'd': {'url': '/d', 'upstream': ['b', 'c']},
+             'e': {'url': '/e'}}
+
+    def setUp(self):
+        from google.appengine.ext import ndb
+
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_taskqueue_stub(root_path='./gae/')
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        self.taskqueue_stub = self.testbed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME)
+
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+
+    @staticmethod
+    def _get_target_klass():
+        from scheduler import DagSchedulerJob
+
+
+        return DagSchedulerJob
+
+
+    def task_names(self, queue_name=None):
+        return sorted(t.name for t in self.taskqueue_stub.get_filtered_tasks(
+            queue_names=queue_name))
+
+
+    def test_cto(self):
+        klass = self._get_target_klass()('dag', 'target', self.nodes)
+        self.assertEqual(klass.order, ['a', 'e', 'b', 'c', 'd'])
+        self.assertEqual(klass.job_name, 'dag')
+        self.assertEqual(klass.downstream('a'), ['b', 'c'])
+        self.assertEqual(klass.downstream('d'), [])
+
+        with self.assertRaises(ValueError):
+            self._get_target_klass()('dag', 'target', {'a': {'url': '/a',
+                'upstream': ['x']}})
+
+        with self.assertRaises(ValueError):
+            self._get_target_klass()('dag', 'target', {
+                'a': {'url': '/a', 'upstream': ['b']},
+                'b': {'url': '/b', 'upstream': ['a']}})
+
+
+    def test_node_task_name(self):
+        klass = self._get_target_klass()('dag', 'target', self.nodes)
+        self.assertEqual(klass.node_task_name('a', '20171010'),
+            'dag-a-20171010')
+        self.assertEqual(klass.node_task_name('a', '20171010', 'x.1'),
+            'dag-a-20171010-x1')
+
+
+    def test_run(self):
+        klass = self._get_target_klass()(None, None, {})
+        with self.assertRaises(ValueError):
+            klass.run({})
+
+        klass = self._get_target_klass()('dag', 'target', self.nodes)
+        klass.run({'from': '20171001', 'to': '20171002', 'key': 'value'})
+        self.assertEqual(self.task_names(), ['dag-a-20171001',
+            'dag-a-20171002', 'dag-e-20171001', 'dag-e-20171002'])
+        task = self.taskqueue_stub.get_filtered_tasks(
+            name='dag-a-20171001')[0]
+        self.assertEqual(task.url, '/a')
+        self.assertEqual(sorted(task.payload.split('&')), ['dag=dag',
+            'date=20171001', 'key=value', 'node=a'])
+        self.assertEqual(str(klass),
+            "4 tasks enqued, 0 already done or enqueued")
+
+        klass = self._get_target_klass()('dag', 'target', self.nodes)
+        klass.run({'date': '20171001'})
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 4)
+        self.assertEqual(sorted(klass.skipped), ['dag-a-20171001',
+            'dag-e-20171001'])
+
+
+    def test_complete(self):
+        klass = self._get_target_klass()('dag', 'target', self.nodes)
+        args = {'date': '20171010', 'dag': 'dag', 'node': 'a'}
+        klass.complete('a', args)
+        self.assertEqual(self.task_names('dag'), ['dag-b-20171010'])
+        self.assertEqual(self.task_names('default'), ['dag-c-20171010'])
+        task = self.taskqueue_stub.get_filtered_tasks(
+            name='dag-b-20171010')[0]
+        self.assertEqual(sorted(task.payload.split('&')), ['dag=dag',
+            'date=20171010', 'node=b'])
+
+        # `d` waits for both of its upstream nodes
+        klass.complete('b', dict(args.items() + [('node', 'b')]))
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 2)
+        klass.complete('c', dict(args.items() + [('node', 'c')]))
+        self.assertEqual(self.task_names('default'), ['dag-c-20171010',
+            'dag-d-20171010'])
+
+        # completed nodes are skipped on rerun of the same date
+        klass = self._get_target_klass()('dag', 'target', self.nodes)
+        klass.run({'date': '20171010'})
+        self.assertEqual(self.task_names('default'), ['dag-c-20171010',
+            'dag-d-20171010', 'dag-e-20171010'])
+        self.assertEqual(klass.skipped, ['dag-a-20171010'])
+
+        klass.run({'date': '20171010', 'rerun': '1'})
+        self.assertIn('dag-a-20171010-1', self.task_names('default'))
+
+
+    @mock.patch('scheduler.costs')
+    def test_forecast(self, costs_mock):
+        costs_mock.forecast_cost.return_value = 'forecast'
+        klass = self._get_target_klass()('dag', 'target', {
+            'a': {'url': '/update_a/'}})
+        self.assertEqual(klass.forecast({'from': '20171010',
+            'to': '20171011'}), {'a': 'forecast'})
+        costs_mock.forecast_cost.assert_called_once_with('update_a',
+            ['20171010', '20171011'])
+        with self.assertRaises(ValueError):
+            klass.forecast({'from': '20171010'})
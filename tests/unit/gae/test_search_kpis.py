@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import json
+import datetime
+import threading
+import unittest
+
+import mock
+from base import BaseTests
+
+
+class TestTTLCache(unittest.TestCase, BaseTests):
+    def setUp(self):
+        self.prepare_environ()
+
+    def tearDown(self):
+        self.clean_environ()
+
+    @staticmethod
+    def _get_target_klass():
+        from gae.search_kpis import TTLCache
+
+
+        return TTLCache
+
+    def test_get_set(self):
+        now = [0]
+        klass = self._get_target_klass()(maxsize=2, ttl=10,
+            timer=lambda: now[0])
+        self.assertEqual(klass.get('a'), None)
+        klass.set('a', 1)
+        klass.set('b', 2)
+        self.assertEqual(klass.get('a'), 1)
+
+        # "b" is the least recently used
+        klass.set('c', 3)
+        self.assertEqual(klass.get('b'), None)
+        self.assertEqual(klass.get('a'), 1)
+        self.assertEqual(klass.get('c'), 3)
+        self.assertEqual(klass.stats, {'hits': 3, 'misses': 2})
+
+        now[0] = 10
+        self.assertEqual(klass.get('a'), None)
+        klass.set('a', 4)
+        self.assertEqual(klass.get('a'), 4)
+        klass.clear()
+        self.assertEqual(klass.get('a'), None)
+
+
+class TestSingleFlight(unittest.TestCase, BaseTests):
+    def setUp(self):
+        self.prepare_environ()
+
+    def tearDown(self):
+        self.clean_environ()
+
+    @staticmethod
+    def _get_target_klass():
+        from gae.search_kpis import SingleFlight
+
+
+        return SingleFlight
+
+    def test_do(self):
+        klass = self._get_target_klass()()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return len(calls)
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(klass.do(
+            'key', func)))
+        leader.start()
+        started.wait()
+
+        # followers signal once they wait for the leader, which is only
+        # released after all of them do
+        waiting = threading.Semaphore(0)
+        event = klass._calls['key'].event
+        class Event(object):
+            def wait(self):
+                waiting.release()
+                event.wait()
+            def set(self):
+                event.set()
+        klass._calls['key'].event = Event()
+        followers = [threading.Thread(target=lambda: results.append(
+            klass.do('key', func))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        for _ in followers:
+            waiting.acquire()
+        self.assertEqual(klass.do('other', lambda: 'other'), 'other')
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [1] * 4)
+        self.assertEqual(klass.do('key', func), 2)
+
+    def test_do_error(self):
+        klass = self._get_target_klass()()
+        def func():
+            raise RuntimeError('failed')
+        with self.assertRaises(RuntimeError):
+            klass.do('key', func)
+        self.assertEqual(klass.do('key', lambda: 1), 1)
+
+
+class TestSearchKPIs(unittest.TestCase, BaseTests):
+    def setUp(self):
+        self.prepare_environ()
+        from gae import search_kpis
+        self.search_kpis = search_kpis
+        search_kpis.cache.clear()
+
+    def tearDown(self):
+        self.clean_environ()
+
+    def test_normalize_query(self):
+        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)
+            ).strftime("%Y%m%d")
+        self.assertEqual(self.search_kpis.normalize_query({}), (yesterday,
+            yesterday, ''))
+        self.assertEqual(self.search_kpis.normalize_query({
+            'from': '20171001', 'to': '20171010',
+            'search': u'  Tênis  Nike '}), ('20171001', '20171010',
+            'tenis-nike'))
+        self.assertEqual(self.search_kpis.normalize_query({
+            'to': '20171010', 'search': ''}), ('20171010', '20171010', ''))
+
+        for args in [{'from': '2017-10-01'}, {'from': '20171011',
+            'to': '20171010'}, {'from': '20170101', 'to': '20171010'}]:
+            with self.assertRaises(ValueError):
+                self.search_kpis.normalize_query(args)
+
+    @mock.patch('gae.search_kpis.gcp_service')
+    def test_query_kpis(self, service_mock):
+        bigquery = service_mock.return_value.bigquery
+        bigquery.poll_jobs.return_value = iter([{'status': {'state': 'DONE'},
+            'configuration': {'query': {'destinationTable': {
+            'projectId': 'project123', 'datasetId': '_anon',
+            'tableId': 'anon1'}}}}])
+        bigquery.list_rows.return_value = [{'f': [{'v': 'tenis'},
+            {'v': '3'}, {'v': '1'}, {'v': '10.5'}, {'v': None}]}]
+
+        result = self.search_kpis.query_kpis('20171001', '20171010',
+            'tenis')
+        self.assertEqual(result, [{'search': 'tenis', 'freq': 3,
+            'clicks': 1, 'net_revenue': 10.5, 'bounce': None}])
+        bigquery.list_rows.assert_called_once_with('project123', '_anon',
+            'anon1')
+        project_id, body = bigquery.execute_job.call_args[0]
+        self.assertEqual(project_id, 'project123')
+        query = body['configuration']['query']['query']
+        self.assertIn("FROM `dest_project.dest_dataset.search_*`", query)
+        self.assertIn("BETWEEN '20171001' AND '20171010'", query)
+        self.assertIn("d.search = 'tenis'", query)
+
+        bigquery.poll_jobs.return_value = iter([{'status': {
+            'state': 'DONE', 'errorResult': {'reason': 'invalid'}}}])
+        with self.assertRaises(RuntimeError):
+            self.search_kpis.query_kpis('20171001', '20171010', '')
+
+        # partitioned results are filtered on the partitioning column
+        source_setup = self.search_kpis.config['jobs'][
+            'update_dashboard_tables']
+        bigquery.poll_jobs.return_value = iter([{'status': {'state': 'DONE'},
+            'configuration': {'query': {'destinationTable': {
+            'projectId': 'project123', 'datasetId': '_anon',
+            'tableId': 'anon2'}}}}])
+        with mock.patch.dict(source_setup, {'output_mode': 'partitioned',
+            'dest_partition_table_id': 'search'}):
+            self.search_kpis.query_kpis('20171001', '20171010', '')
+        query = bigquery.execute_job.call_args[0][1]['configuration'][
+            'query']['query']
+        self.assertIn("FROM `dest_project.dest_dataset.search`", query)
+        self.assertIn("WHERE _PARTITIONDATE BETWEEN '2017-10-01' AND "
+            "'2017-10-10'", query)
+
+    @mock.patch('gae.search_kpis.query_kpis')
+    def test_read_kpis(self, query_mock):
+        query_mock.return_value = [{'search': 'tenis', 'freq': 3}]
+        etag, payload = self.search_kpis.read_kpis('20171001', '20171010',
+            '')
+        self.assertEqual(json.loads(payload), {'from': '20171001',
+            'to': '20171010', 'search': None, 'kpis': [{'search': 'tenis',
+            'freq': 3}]})
+        self.assertEqual(self.search_kpis.read_kpis('20171001', '20171010',
+            ''), (etag, payload))
+        query_mock.assert_called_once_with('20171001', '20171010', '')
+
+        query_mock.return_value = [{'search': 'tenis', 'freq': 4}]
+        other_etag, _ = self.search_kpis.read_kpis('20171001', '20171010',
+            'tenis')
+        self.assertNotEqual(etag, other_etag)
+        self.assertEqual(query_mock.call_count, 2)
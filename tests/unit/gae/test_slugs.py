@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import re
+import json
+import random
+import unittest
+from StringIO import StringIO
+
+
+# regexes of UDFs in `search_kpis.sql` as they run in BigQuery
+SQL_ACCENTS = [(u'[àáâäåã]', u'a'), (u'[èéêëẽ]', u'e'), (u'[ìíîïĩ]', u'i'),
+               (u'[òóôöøõ]', u'o'), (u'[ùúûüũ]', u'u'), (u'ç', u'c'),
+               (u'ÿ', u'y'), (u'ñ', u'n')]
+
+SQL_SLUGIFY = [(r'[\t\n\f\r ]+', u'-'), (r'&', u'-e-'),
+               (r'[^0-9A-Za-z_-]+', u''), (r'--+', u'-'), (r'^-+', u''),
+               (r'-+$', u'')]
+
+
+def sql_remove_accents(phrase):
+    for pattern, replacement in SQL_ACCENTS:
+        phrase = re.sub(pattern, replacement, phrase)
+    return phrase
+
+
+def sql_slugify(phrase):
+    phrase = sql_remove_accents(phrase.lower())
+    for pattern, replacement in SQL_SLUGIFY:
+        phrase = re.sub(pattern, replacement, phrase)
+    return phrase
+
+
+class TestSlugs(unittest.TestCase):
+    @staticmethod
+    def _get_target_module():
+        import slugs
+
+
+        return slugs
+
+    def test_remove_accents(self):
+        slugs = self._get_target_module()
+        self.assertEqual(slugs.remove_accents(u'Sêãrchí ÇÃ çñÿ'),
+            u'Searchi ÇÃ cny')
+        self.assertEqual(slugs.remove_accents('t\xc3\xaanis'), u'tenis')
+        self.assertEqual(slugs.remove_accents(None), None)
+
+    def test_slugify(self):
+        slugs = self._get_target_module()
+        self.assertEqual(slugs.slugify(u'Sêãrchí CrÃzĩ Éstrìng'),
+            'searchi-crazi-estring')
+        self.assertEqual(slugs.slugify(u' Tênis & Chuteira\t\v ß-- '),
+            'tenis-e-chuteira')
+        self.assertEqual(slugs.slugify(u'--a__b  !! c--'), 'a__b-c')
+        self.assertEqual(slugs.slugify(u'&'), 'e')
+        self.assertEqual(slugs.slugify(u' 日本'), '')
+        self.assertEqual(slugs.slugify(None), None)
+
+    def test_slugify_matches_sql(self):
+        slugs = self._get_target_module()
+        alphabet = (u'aAzZ09_-&!?.,/ \t\n\r\f\v ' + u''.join(
+            chars for chars, _ in slugs.ACCENTS) + u'ÀÉÎÕÜÇÑŸĨẼßæ日')
+        rand = random.Random(0)
+        for _ in range(5000):
+            phrase = u''.join(rand.choice(alphabet) for _ in range(
+                rand.randint(0, 12)))
+            self.assertEqual(slugs.slugify(phrase), sql_slugify(phrase))
+            self.assertEqual(slugs.remove_accents(phrase.lower()),
+                sql_remove_accents(phrase.lower()))
+
+    def test_slugifier(self):
+        slugs = self._get_target_module()
+        slugifier = slugs.Slugifier(cache_size=2)
+        self.assertEqual(slugifier.slugify(u'Tênis'), 'tenis')
+        self.assertEqual(slugifier.slugify(u'Tênis'), 'tenis')
+        self.assertEqual(slugifier.stats, {'hits': 1, 'misses': 1})
+
+        slugifier.slugify(u'a')
+        slugifier.slugify(u'Tênis')
+        slugifier.slugify(u'b')
+        self.assertEqual(list(slugifier._cache), [u'Tênis', u'b'])
+
+        slugifier.clear()
+        self.assertEqual(list(slugifier._cache), [])
+
+    def test_bulk(self):
+        slugs = self._get_target_module()
+        slugifier = slugs.Slugifier()
+        result = slugifier.bulk([u'Tênis', None, u'Tênis', u'A B', u'A B'])
+        self.assertEqual(result, ['tenis', None, 'tenis', 'a-b', 'a-b'])
+        self.assertEqual(slugifier.stats, {'hits': 0, 'misses': 3})
+
+    def test_dump_lookup_table(self):
+        slugs = self._get_target_module()
+        f = StringIO()
+        result = slugs.dump_lookup_table([u'Tênis', None, 'T\xc3\xaanis',
+            u'A & B'], f)
+        self.assertEqual(result, 2)
+        self.assertEqual([json.loads(e) for e in f.getvalue().splitlines()],
+            [{'raw_label': u'Tênis', 'slug': 'tenis'},
+             {'raw_label': u'A & B', 'slug': 'a-e-b'}])
@@ -0,0 +1,113 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import json
+import sys
+import unittest
+
+import mock
+
+
+class TestLazyModule(unittest.TestCase):
+    @staticmethod
+    def _get_target_klass():
+        from startup import LazyModule
+
+
+        return LazyModule
+
+    def test_load_on_access(self):
+        sys.modules.pop('wave', None)
+        module = self._get_target_klass()('wave')
+        self.assertTrue('wave' not in sys.modules)
+        self.assertEqual(repr(module), "<lazy module 'wave'>")
+        self.assertEqual(module.WAVE_FORMAT_PCM, 1)
+        self.assertTrue('wave' in sys.modules)
+        self.assertEqual(repr(module), "<lazy module 'wave' (loaded)>")
+
+    def test_setattr(self):
+        import json
+
+
+        module = self._get_target_klass()('json')
+        dumps = json.dumps
+        module.dumps = 'patched'
+        self.assertEqual(json.dumps, 'patched')
+        del module.dumps
+        self.assertFalse(hasattr(json, 'dumps'))
+        json.dumps = dumps
+
+
+class TestImportProfiler(unittest.TestCase):
+    @staticmethod
+    def _get_target_klass():
+        from startup import ImportProfiler
+
+
+        return ImportProfiler
+
+    @mock.patch('startup.logging')
+    def test_log(self, logging_mock):
+        klass = self._get_target_klass()()
+        klass.log('main')
+        self.assertFalse(logging_mock.info.called)
+
+        klass.installed = True
+        klass.records = {'flask': {'module': 'flask', 'self_ms': 1.0,
+            'cumulative_ms': 2.0}}
+        klass.log('main')
+        logging_mock.info.assert_called_once_with(
+            "slowest imports of %s: %s", 'main', json.dumps(
+                [klass.records['flask']]))
+
+    def test_install(self):
+        import __builtin__
+
+
+        original = __builtin__.__import__
+        klass = self._get_target_klass()()
+        klass.install()
+        try:
+            self.assertTrue(klass.installed)
+            self.assertFalse(__builtin__.__import__ is original)
+            for name in ('sndhdr', 'xdrlib'):
+                sys.modules.pop(name, None)
+            import sndhdr
+            import xdrlib
+            import json
+        finally:
+            klass.uninstall()
+        self.assertTrue(__builtin__.__import__ is original)
+        self.assertFalse(klass.installed)
+
+        self.assertTrue('sndhdr' in klass.records)
+        self.assertTrue('xdrlib' in klass.records)
+        self.assertTrue('json' not in klass.records)
+        record = klass.records['sndhdr']
+        self.assertEqual(record['module'], 'sndhdr')
+        self.assertTrue(record['cumulative_ms'] >= record['self_ms'] >= 0)
+
+        report = klass.report(limit=1)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]['cumulative_ms'], max(r['cumulative_ms']
+            for r in klass.records.values()))
@@ -27,6 +27,8 @@ import mock
 import datetime
 import os
 import shutil
+import hashlib
+import tempfile
 from collections import Counter
 
 from base import BaseTests
@@ -50,14 +52,72 @@ class TestUtils(unittest.TestCase, BaseTests):
         result = self.utils.yesterday_date()
         self.assertEqual(expected.date(), result.date())
 
-    @mock.patch('gae.utils.uuid')
-    def test_search_query_job_body(self, uuid_mock):
+    def test_search_query_job_body_partitioned(self):
+        setup = self.load_mock_config()['jobs']['update_dashboard_tables']
+        setup.update({'output_mode': 'partitioned', 'date': '20171010',
+            'dest_partition_table_id': 'search'})
+        result = self.utils.search_query_job_body(**setup)
+        query_config = result['configuration']['query']
+        self.assertEqual(query_config['destinationTable'],
+            {'datasetId': 'dest_dataset', 'tableId': 'search$20171010',
+             'projectId': 'dest_project'})
+        self.assertEqual(query_config['writeDisposition'], 'WRITE_TRUNCATE')
+        self.assertEqual(query_config['timePartitioning'], {'type': 'DAY',
+            'expirationMs': '172800000'})
+        self.assertTrue('clustering' not in query_config)
+
+        self.assertEqual(query_config['maximumBytesBilled'], 100000000000)
+
+        setup.update({'partition_field': 'date_partition',
+            'clustering_fields': ('fv',)})
+        result = self.utils.search_query_job_body(**setup)
+        query_config = result['configuration']['query']
+        self.assertEqual(query_config['timePartitioning']['field'],
+            'date_partition')
+        self.assertEqual(query_config['clustering'], {'fields': ['fv']})
+
+        setup['maximum_bytes_billed'] = 10
+        result = self.utils.search_query_job_body(**setup)
+        self.assertEqual(result['configuration']['query'][
+            'maximumBytesBilled'], 10)
+
+    def test_shift_date(self):
+        self.assertEqual(self.utils.shift_date("20171231", 1), "20180101")
+        self.assertEqual(self.utils.shift_date("20180301", -1), "20180228")
+        self.assertEqual(self.utils.shift_date("20171010", 0), "20171010")
+
+    def test_date_range(self):
+        result = self.utils.date_range("20171230", "20180102")
+        expected = ["20171230", "20171231", "20180101", "20180102"]
+        self.assertEqual(result, expected)
+
+        result = self.utils.date_range("20171010", "20171010")
+        self.assertEqual(result, ["20171010"])
+
+        with self.assertRaises(ValueError):
+            self.utils.date_range("20171011", "20171010")
+
+        with self.assertRaises(ValueError):
+            self.utils.date_range("2017-10-10", "20171011")
+
+    def test_build_job_id(self):
+        configuration = {'query': {'query': 'SELECT 1', 'useLegacySql': False}}
+        result = self.utils.build_job_id('job', '20171010', configuration)
+        self.assertEqual(result, 'job_20171010_' + hashlib.sha1(json.dumps(
+            configuration, sort_keys=True)).hexdigest()[:16])
+        self.assertEqual(result, self.utils.build_job_id('job', '20171010',
+            {'query': {'useLegacySql': False, 'query': 'SELECT 1'}}))
+        self.assertNotEqual(result, self.utils.build_job_id('job',
+            '20171010', {'query': {'query': 'SELECT 2'}}))
+        self.assertEqual(self.utils.build_job_id('job', '20171010',
+            configuration, 'a b!1'), result + '_ab1')
+
+    def test_search_query_job_body(self):
         query_str = ("SELECT 1 FROM `project123.source_dataset.source_table` "
                      "WHERE date={date}")
 
         expected = {'jobReference': {
-                      'projectId': 'project123',
-                      'jobId': 'name'
+                      'projectId': 'project123'
                       },
                   'configuration': {
                       'query': {
@@ -72,16 +132,249 @@ class TestUtils(unittest.TestCase, BaseTests):
                           }
                       }
                    }
-        uuid_mock.uuid4.return_value = 'name'
         result = self.utils.search_query_job_body(**dict(
             self.load_mock_config()['jobs'][
             'update_dashboard_tables'].items() + [('date', '20171010')]))
         expected['configuration']['query']['query'] = query_str.format(date=
             "20171010")
+        expected['jobReference']['jobId'] = self.utils.build_job_id('search',
+            '20171010', expected['configuration'])
         print 'EXPECTED ', expected
         print 'RESULT ', result
         self.assertEqual(expected, result)
 
+    def test_dml_query_job_body(self):
+        setup = self.load_mock_config()['jobs']['update_search_terms']
+        result = self.utils.dml_query_job_body(**dict(setup.items() +
+            [('date', '20171010'), ('job_name', 'update_search_terms')]))
+        configuration = {'query': {'maximumBytesBilled': 100000000000,
+            'query': ("SELECT 1 FROM `project123.source_dataset."
+                      "source_table` WHERE date=20171010"),
+            'useLegacySql': False}}
+        self.assertEqual(result, {'jobReference': {'projectId': 'project123',
+            'jobId': self.utils.build_job_id('update_search_terms',
+            '20171010', configuration)}, 'configuration': configuration})
+
+    def test_extract_job_body(self):
+        setup = dict(self.load_mock_config()['jobs'][
+            'update_dashboard_tables'].items() + [('date', '20171010'),
+            ('export_uri', 'gs://bucket/search_kpis/{}/part-*.avro')])
+        result = self.utils.extract_job_body(**setup)
+        configuration = {'extract': {'sourceTable': {
+            'projectId': 'dest_project', 'datasetId': 'dest_dataset',
+            'tableId': 'search_20171010'},
+            'destinationUris': ['gs://bucket/search_kpis/20171010/'
+                'part-*.avro'],
+            'destinationFormat': 'AVRO', 'compression': 'DEFLATE'}}
+        self.assertEqual(result, {'jobReference': {'projectId': 'project123',
+            'jobId': self.utils.build_job_id('export_search_kpis',
+            '20171010', configuration)}, 'configuration': configuration})
+
+        setup.update({'output_mode': 'partitioned',
+            'dest_partition_table_id': 'search', 'export_format':
+            'NEWLINE_DELIMITED_JSON', 'export_compression': 'GZIP'})
+        result = self.utils.extract_job_body(**setup)['configuration'][
+            'extract']
+        self.assertEqual(result['sourceTable']['tableId'], 'search$20171010')
+        self.assertEqual(result['destinationFormat'],
+            'NEWLINE_DELIMITED_JSON')
+        self.assertEqual(result['compression'], 'GZIP')
+
+    def test_search_terms_queries(self):
+        setup = dict(self.load_mock_config()['jobs'][
+            'update_dashboard_tables'].items() + self.load_mock_config()[
+            'jobs']['update_search_terms'].items() + [('date', '20171010')])
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('query_path', 'gae/queries/update_search_terms.sql')]))
+        self.assertIn("INSERT INTO `terms_project.terms_dataset."
+            "search_terms` (raw_label, slug)", result)
+        self.assertIn("= '20171010'", result)
+
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('query_path', 'gae/queries/search_kpis_terms.sql')]))
+        self.assertIn("FROM `terms_project.terms_dataset.search_terms`\n"
+            "    GROUP BY raw_label", result)
+        self.assertIn("FROM `project123.dataset_id.table_id`", result)
+        self.assertNotIn("slugify(FIRST_VALUE", result)
+
+    def test_search_kpis_optimized_query(self):
+        setup = self.load_mock_config()['jobs']['update_dashboard_tables']
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('date', '20171010'),
+             ('query_path', 'gae/queries/search_kpis_optimized.sql')]))
+        self.assertIn("FROM `project123.dataset_id.table_id`", result)
+        self.assertEqual(result.count("OVER (PARTITION BY flg ORDER BY hn)"),
+            1)
+        self.assertEqual(result.count("isSearch(first_hit.lbl, pp)"), 1)
+
+    def test_search_sessions_query(self):
+        setup = self.load_mock_config()['jobs']['update_dashboard_tables']
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('date', '20171010'),
+             ('query_path', 'gae/queries/search_sessions.sql')]))
+        self.assertIn("FROM `project123.dataset_id.table_id`", result)
+        self.assertIn("REGEXP_EXTRACT(_TABLE_SUFFIX, r'.*_(\\d+)') = "
+            "'20171010'", result)
+
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('date', '20171010'), ('staging_project_id', 'project'),
+             ('staging_dataset_id', 'staging'),
+             ('staging_table', 'search_sessions_20171010'),
+             ('query_path', 'gae/queries/search_kpis_staged.sql')]))
+        self.assertIn("FROM `project.staging.search_sessions_20171010`",
+            result)
+        self.assertNotIn("_TABLE_SUFFIX", result)
+        self.assertNotIn("project123", result)
+
+        # KPIs are computed as in search_kpis.sql, only the source changes
+        kpis = self.utils.load_file_content(**dict(setup.items() +
+            [('date', '20171010'),
+             ('query_path', 'gae/queries/search_kpis.sql')]))
+        self.assertIn(kpis[kpis.index("SELECT\n  date,"):kpis.index(
+            "        #FROM `data`")], result)
+
+    def test_search_query_job_body_write_disposition(self):
+        setup = self.load_mock_config()['jobs']['update_dashboard_tables']
+        setup['date'] = '20171010'
+        result = self.utils.search_query_job_body(**setup)
+        self.assertTrue('writeDisposition' not in
+            result['configuration']['query'])
+
+        setup['write_disposition'] = 'WRITE_TRUNCATE'
+        result = self.utils.search_query_job_body(**setup)
+        self.assertEqual(result['configuration']['query'][
+            'writeDisposition'], 'WRITE_TRUNCATE')
+
+    def test_search_sketches_query(self):
+        setup = self.load_mock_config()['jobs']['update_dashboard_tables']
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('date', '20171010'),
+             ('query_path', 'gae/queries/search_sketches.sql')]))
+        self.assertIn("FROM `project123.dataset_id.table_id`", result)
+        self.assertIn("HLL_COUNT.INIT(fullvisitorid) visitors", result)
+        self.assertIn("= '20171010'", result)
+
+        result = self.utils.load_file_content(**dict(setup.items() +
+            [('date', '20171010'),
+             ('staging_project_id', 'staging_project'),
+             ('staging_dataset_id', 'staging_dataset'),
+             ('staging_table', 'search_sessions_20171010'),
+             ('query_path', 'gae/queries/search_sketches_staged.sql')]))
+        self.assertIn("FROM `staging_project.staging_dataset."
+            "search_sessions_20171010`", result)
+        self.assertNotIn("`project123.dataset_id.table_id`", result)
+
+        result = self.utils.load_file_content(
+            query_path='gae/queries/search_reach.sql',
+            sketches_project_id='project', sketches_dataset_id='dataset',
+            sketches_source='search_sketches_*', start_date='20171001',
+            end_date='20171010')
+        self.assertIn("FROM `project.dataset.search_sketches_*`", result)
+        self.assertIn("BETWEEN '20171001' AND '20171010'", result)
+        self.assertIn("HLL_COUNT.MERGE(visitors)", result)
+
+    def test_source_table(self):
+        self.assertEqual(self.utils.source_table({'dest_table_id':
+            'search_{}'}), ('search_*', '_TABLE_SUFFIX', '%Y%m%d'))
+        self.assertEqual(self.utils.source_table({'dest_table_id':
+            'search_{}', 'output_mode': 'partitioned',
+            'dest_partition_table_id': 'search'}), ('search',
+            '_PARTITIONDATE', '%Y-%m-%d'))
+        self.assertEqual(self.utils.source_table({'dest_table_id':
+            'search_{}', 'output_mode': 'partitioned',
+            'dest_partition_table_id': 'search',
+            'partition_field': 'day'}), ('search', 'day', '%Y-%m-%d'))
+
+    def test_read_query_job_body(self):
+        setup = dict(self.load_mock_config()['jobs'][
+            'update_dashboard_tables'].items() + self.load_mock_config()[
+            'jobs']['search_kpis'].items() + [('source_table', 'search_*'),
+            ('date_column', '_TABLE_SUFFIX'), ('start_date', '20171001'),
+            ('end_date', '20171010'), ('search', '')])
+        result = self.utils.read_query_job_body(**setup)
+        self.assertEqual(result['jobReference'], {'projectId': 'project123'})
+        query_config = result['configuration']['query']
+        self.assertTrue('destinationTable' not in query_config)
+        self.assertIn("FROM `dest_project.dest_dataset.search_*`",
+            query_config['query'])
+        self.assertIn("WHERE _TABLE_SUFFIX BETWEEN '20171001' AND "
+            "'20171010'", query_config['query'])
+        self.assertIn("AND ('' = '' OR d.search = '')",
+            query_config['query'])
+
+    def test_load_file_content(self):
+        result = self.utils.load_file_content(query_path=
+            'tests/unit/data/gae/test_search.sql', date='20171010',
+            other=[1])
+        expected = ("SELECT 1 FROM `project123.source_dataset.source_table` "
+                    "WHERE date=20171010")
+        self.assertEqual(result, expected)
+
+    def test_query_templates_load(self):
+        klass = self.utils.QueryTemplates()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp_dir, 'q1.sql'), 'w') as f:
+                f.write("SELECT {a}, {b.c}, {a} FROM {d[0]} WHERE x = '{{}}'")
+            with open(os.path.join(tmp_dir, 'q2.txt'), 'w') as f:
+                f.write("SELECT 1")
+            klass.load_dir(tmp_dir)
+            self.assertEqual(klass.stats['loads'], 1)
+            template, fields = klass.get(os.path.join(tmp_dir, 'q1.sql'))
+            self.assertEqual(fields, ('a', 'b', 'd'))
+            self.assertEqual(klass.stats['loads'], 1)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_query_templates_render(self):
+        klass = self.utils.QueryTemplates(check_interval=0, cache_size=2)
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'query.sql')
+        try:
+            with open(path, 'w') as f:
+                f.write(" SELECT {a} FROM t \n")
+            self.assertEqual(klass.render(path, {'a': 1, 'b': 2}),
+                "SELECT 1 FROM t")
+            self.assertEqual(klass.render(path, {'a': 1, 'b': 3}),
+                "SELECT 1 FROM t")
+            self.assertEqual(klass.stats['hits'], 1)
+            self.assertEqual(klass.stats['renders'], 2)
+            self.assertEqual(klass.stats['loads'], 1)
+            self.assertTrue(klass.stats['render_time'] >= 0)
+
+            klass.render(path, {'a': 2})
+            klass.render(path, {'a': 3})
+            self.assertEqual(len(klass._rendered), 2)
+            klass.render(path, {'a': 1})
+            self.assertEqual(klass.stats['hits'], 1)
+
+            # unhashable values are rendered without being cached
+            self.assertEqual(klass.render(path, {'a': [1]}),
+                "SELECT [1] FROM t")
+
+            with open(path, 'w') as f:
+                f.write("SELECT {a} FROM t2")
+            mtime = os.path.getmtime(path) + 10
+            os.utime(path, (mtime, mtime))
+            self.assertEqual(klass.render(path, {'a': 1}), "SELECT 1 FROM t2")
+            self.assertEqual(klass.stats['loads'], 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_query_templates_check_interval(self):
+        klass = self.utils.QueryTemplates(check_interval=3600)
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'query.sql')
+        try:
+            with open(path, 'w') as f:
+                f.write("SELECT {a}")
+            klass.render(path, {'a': 1})
+            with mock.patch('gae.utils.os.path.getmtime') as mtime_mock:
+                klass.render(path, {'a': 1})
+                mtime_mock.assert_not_called()
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_format_date(self):
         result = self.utils.format_date("20171010")
         expected = "2017-10-10"
@@ -98,3 +391,17 @@ class TestUtils(unittest.TestCase, BaseTests):
 
         with self.assertRaises(ValueError):
             self.utils.process_url_date("2017-10-10")
+
+    def test_extract_table_date(self):
+        result = self.utils.extract_table_date("search_20171010", "search_{}")
+        self.assertEqual(result, "20171010")
+
+        result = self.utils.extract_table_date("a.b_20171010_v1", "a.b_{}_v1")
+        self.assertEqual(result, "20171010")
+
+        self.assertEqual(self.utils.extract_table_date("search_2017",
+            "search_{}"), None)
+        self.assertEqual(self.utils.extract_table_date("other_20171010",
+            "search_{}"), None)
+        self.assertEqual(self.utils.extract_table_date("searchx20171010",
+            "search_{}"), None)
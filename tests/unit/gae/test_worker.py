@@ -64,15 +64,19 @@ class TestWorkerService(unittest.TestCase, TestWorkerBase):
     def teardown_class(cls):                                                    
         cls.clean_config()                                                      
                                                                                 
+    def setUp(self):
+        patcher = mock.patch('gae.worker.metrics')
+        self.metrics_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
     @classmethod                                                                
     def load_mock_config(cls):                                                  
         return json.loads(open(cls._source_config).read().replace(              
             "config = ", ""))  
 
-    @mock.patch('gae.utils.uuid')                                      
+    @mock.patch('gae.worker.costs')
     @mock.patch('gae.worker.gcp_service')
-    def test_update_search_tables(self, service_mock, uuid_mock):
-        uuid_mock.uuid4.return_value = 'name'
+    def test_update_search_tables(self, service_mock, costs_mock):
         # this means that the config file is a pre-defined one
         # so we need to replace it in this test
         if not self._remove_config_flag:
@@ -81,7 +85,8 @@ class TestWorkerService(unittest.TestCase, TestWorkerBase):
         query_job_body = self.utils.search_query_job_body(
             **dict(self.worker.config['jobs'][
                 'update_dashboard_tables'].items() +
-                [('date', '20171010')]))
+                [('date', '20171010'),
+                 ('job_name', 'update_dashboard_tables')]))
                                                                                 
         service_mock.bigquery.execute_job.return_value = 'job' 
         response = self._test_app.post("/update_dashboard_tables", {'date':
@@ -91,6 +96,11 @@ class TestWorkerService(unittest.TestCase, TestWorkerBase):
             query_job_body]) 
         service_mock.bigquery.poll_job.assert_called_once_with('job')
         self.assertEqual(response.status_int, 200)                              
+        service_mock.bigquery.dry_run.assert_called_once_with('project123',
+            query_job_body)
+        costs_mock.record_cost.assert_called_once_with(
+            'update_dashboard_tables', '20171010',
+            service_mock.bigquery.dry_run.return_value)
 
         dt = (datetime.datetime.now() - datetime.timedelta(days=2)).strftime(
             "%Y%m%d")
@@ -99,10 +109,10 @@ class TestWorkerService(unittest.TestCase, TestWorkerBase):
             project_id='dest_project', dataset_id='dest_dataset',
             table_id='search_{}'.format(dt))
 
-    @mock.patch('gae.utils.uuid')                                      
+    @mock.patch('gae.worker.costs')
     @mock.patch('gae.worker.gcp_service')
-    def test_update_search_tables_no_date(self, service_mock, uuid_mock):
-        uuid_mock.uuid4.return_value = 'name'
+    def test_update_search_tables_no_date(self, service_mock,
+        costs_mock):
         # this means that the config file is a pre-defined one
         # so we need to replace it in this test
         if not self._remove_config_flag:
@@ -114,7 +124,7 @@ class TestWorkerService(unittest.TestCase, TestWorkerBase):
         query_job_body = self.utils.search_query_job_body(
             **dict(self.worker.config['jobs'][
                 'update_dashboard_tables'].items() +
-                [('date', dt)]))
+                [('date', dt), ('job_name', 'update_dashboard_tables')]))
                                                                                 
         service_mock.bigquery.execute_job.return_value = 'job' 
         response = self._test_app.post("/update_dashboard_tables")
@@ -130,3 +140,528 @@ class TestWorkerService(unittest.TestCase, TestWorkerBase):
         service_mock.bigquery.delete_table.assert_any_call(
             project_id='dest_project', dataset_id='dest_dataset',
             table_id='search_{}'.format(dt))
+
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_partitioned(self, service_mock,
+        costs_mock):
+        config = self.load_mock_config()
+        config['jobs']['update_dashboard_tables'].update({
+            'output_mode': 'partitioned', 'dest_partition_table_id': 'search'})
+
+        with mock.patch.object(self.worker, 'config', config):
+            query_job_body = self.utils.search_query_job_body(
+                **dict(config['jobs']['update_dashboard_tables'].items() +
+                    [('date', '20171010'),
+                 ('job_name', 'update_dashboard_tables')]))
+            service_mock.bigquery.execute_job.return_value = 'job'
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+
+        service_mock.bigquery.execute_job.assert_called_once_with(
+            'project123', query_job_body)
+        service_mock.bigquery.poll_job.assert_called_once_with('job')
+        service_mock.bigquery.delete_table.assert_not_called()
+        self.assertEqual(response.status_int, 200)
+
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_staged(self, service_mock, costs_mock):
+        config = self.load_mock_config()
+        setup = config['jobs']['update_dashboard_tables']
+        setup.update({'staging_query_path': 'gae/queries/search_sessions.sql',
+            'staging_project_id': 'staging_project',
+            'staging_dataset_id': 'staging_dataset',
+            'staging_table_id': 'search_sessions_{}',
+            'query_path': 'gae/queries/search_kpis_staged.sql'})
+
+        with mock.patch.object(self.worker, 'config', config):
+            staging_job_body = self.utils.search_query_job_body(
+                **dict(setup.items() + [('date', '20171010'),
+                    ('job_name', 'stage_search_sessions'),
+                    ('query_path', 'gae/queries/search_sessions.sql'),
+                    ('dest_project_id', 'staging_project'),
+                    ('dest_dataset_id', 'staging_dataset'),
+                    ('dest_table_id', 'search_sessions_{}'),
+                    ('write_disposition', 'WRITE_TRUNCATE')]))
+            query_job_body = self.utils.search_query_job_body(
+                **dict(setup.items() + [('date', '20171010'),
+                    ('job_name', 'update_dashboard_tables'),
+                    ('staging_table', 'search_sessions_20171010')]))
+            service_mock.bigquery.execute_job.return_value = 'job'
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(service_mock.bigquery.execute_job.call_args_list,
+            [mock.call('project123', staging_job_body),
+             mock.call('project123', query_job_body)])
+        staging_config = staging_job_body['configuration']['query']
+        self.assertEqual(staging_config['destinationTable'], {
+            'projectId': 'staging_project', 'datasetId': 'staging_dataset',
+            'tableId': 'search_sessions_20171010'})
+        self.assertIn("FROM `staging_project.staging_dataset."
+            "search_sessions_20171010`",
+            query_job_body['configuration']['query']['query'])
+        service_mock.bigquery.dry_run.assert_called_once_with('project123',
+            query_job_body)
+
+        dt = (datetime.datetime.now() - datetime.timedelta(days=2)).strftime(
+            "%Y%m%d")
+        service_mock.bigquery.delete_table.assert_any_call(
+            project_id='staging_project', dataset_id='staging_dataset',
+            table_id='search_sessions_{}'.format(dt))
+        service_mock.bigquery.delete_table.assert_any_call(
+            project_id='dest_project', dataset_id='dest_dataset',
+            table_id='search_{}'.format(dt))
+
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_sketches(self, service_mock, costs_mock):
+        config = self.load_mock_config()
+        setup = config['jobs']['update_dashboard_tables']
+        setup.update({
+            'sketches_query_path': 'gae/queries/search_sketches.sql',
+            'sketches_project_id': 'sketches_project',
+            'sketches_dataset_id': 'sketches_dataset',
+            'sketches_table_id': 'search_sketches_{}'})
+
+        with mock.patch.object(self.worker, 'config', config):
+            query_job_body = self.utils.search_query_job_body(
+                **dict(setup.items() + [('date', '20171010'),
+                    ('job_name', 'update_dashboard_tables')]))
+            sketches_job_body = self.utils.search_query_job_body(
+                **dict(setup.items() + [('date', '20171010'),
+                    ('job_name', 'update_search_sketches'),
+                    ('query_path', 'gae/queries/search_sketches.sql'),
+                    ('dest_project_id', 'sketches_project'),
+                    ('dest_dataset_id', 'sketches_dataset'),
+                    ('dest_table_id', 'search_sketches_{}'),
+                    ('write_disposition', 'WRITE_TRUNCATE')]))
+            service_mock.bigquery.execute_job.return_value = 'job'
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(service_mock.bigquery.execute_job.call_args_list,
+            [mock.call('project123', query_job_body),
+             mock.call('project123', sketches_job_body)])
+        self.assertEqual(sketches_job_body['configuration']['query'][
+            'destinationTable'], {'projectId': 'sketches_project',
+            'datasetId': 'sketches_dataset',
+            'tableId': 'search_sketches_20171010'})
+        self.assertEqual(service_mock.bigquery.poll_job.call_count, 2)
+
+        # sketches read the staging table once it's set
+        setup.update({'staging_query_path': 'gae/queries/search_sessions.sql',
+            'staging_project_id': 'staging_project',
+            'staging_dataset_id': 'staging_dataset',
+            'staging_table_id': 'search_sessions_{}',
+            'sketches_query_path': 'gae/queries/search_sketches_staged.sql'})
+        with mock.patch.object(self.worker, 'config', config):
+            self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+        query = service_mock.bigquery.execute_job.call_args[0][1][
+            'configuration']['query']['query']
+        self.assertIn("FROM `staging_project.staging_dataset."
+            "search_sessions_20171010`", query)
+        self.assertIn("HLL_COUNT.INIT(fullvisitorid) visitors", query)
+
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_export(self, service_mock, costs_mock):
+        config = self.load_mock_config()
+        setup = config['jobs']['update_dashboard_tables']
+        setup['export_uri'] = 'gs://bucket/search_kpis/{}/part-*.avro'
+
+        with mock.patch.object(self.worker, 'config', config):
+            query_job_body = self.utils.search_query_job_body(
+                **dict(setup.items() + [('date', '20171010'),
+                    ('job_name', 'update_dashboard_tables')]))
+            extract_job_body = self.utils.extract_job_body(
+                **dict(setup.items() + [('date', '20171010'),
+                    ('job_name', 'export_search_kpis')]))
+            service_mock.bigquery.execute_job.return_value = 'job'
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(service_mock.bigquery.execute_job.call_args_list,
+            [mock.call('project123', query_job_body),
+             mock.call('project123', extract_job_body)])
+        service_mock.bigquery.dry_run.assert_called_once_with('project123',
+            query_job_body)
+        self.assertEqual([call[0][0] for call in
+            self.metrics_mock.record_metric.call_args_list],
+            ['update_dashboard_tables', 'export_search_kpis'])
+
+    @mock.patch('gae.worker.jobs_factory')
+    @mock.patch('gae.worker.scheduler')
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_continuation(self, service_mock,
+        costs_mock, scheduler_mock, factory_mock):
+        config = self.load_mock_config()
+        setup = config['jobs']['update_dashboard_tables']
+        setup.update({'continuation': True,
+            'sketches_query_path': 'gae/queries/search_sketches.sql',
+            'sketches_project_id': 'sketches_project',
+            'sketches_dataset_id': 'sketches_dataset',
+            'sketches_table_id': 'search_sketches_{}'})
+        service_mock.bigquery.execute_job.side_effect = lambda project_id, \
+            body: {'jobReference': dict(body['jobReference'].items() +
+            [('location', 'EU')])}
+        args = {'date': '20171010', 'dag': 'dag', 'node': 'node'}
+
+        def checked_args(stage, attempt):
+            call = scheduler_mock.enqueue_check.call_args
+            self.assertEqual(call[0][:2], ('/check_dashboard_tables',
+                'worker'))
+            params = call[0][2]
+            self.assertEqual(params['stage'], stage)
+            self.assertEqual(params['attempt'], attempt)
+            self.assertEqual(params['job_location'], 'EU')
+            self.assertTrue(params['job_id'].startswith(stage))
+            return params
+
+        with mock.patch.object(self.worker, 'config', config):
+            response = self._test_app.post("/update_dashboard_tables", args)
+            self.assertEqual(response.status_int, 202)
+            service_mock.bigquery.poll_job.assert_not_called()
+            service_mock.bigquery.delete_table.assert_not_called()
+            params = checked_args('update_dashboard_tables', '0')
+            self.assertEqual(params['dag'], 'dag')
+            self.assertEqual(scheduler_mock.enqueue_check.call_args[1],
+                {'countdown': 15, 'queue_name': 'dag-checks'})
+
+            # job still running is checked again later
+            service_mock.bigquery.get_job.return_value = {'jobReference': {
+                'projectId': 'project123', 'jobId': params['job_id'],
+                'location': 'EU'}, 'status': {'state': 'RUNNING'}}
+            response = self._test_app.post("/check_dashboard_tables", params)
+            self.assertEqual(response.status_int, 202)
+            service_mock.bigquery.get_job.assert_called_once_with({
+                'projectId': 'project123', 'jobId': params['job_id'],
+                'location': 'EU'})
+            params = checked_args('update_dashboard_tables', '1')
+            self.assertEqual(scheduler_mock.enqueue_check.call_args[1],
+                {'countdown': 30, 'queue_name': 'dag-checks'})
+
+            # next stage is submitted once previous one is done
+            service_mock.bigquery.get_job.return_value['status'] = {
+                'state': 'DONE'}
+            response = self._test_app.post("/check_dashboard_tables", params)
+            self.assertEqual(response.status_int, 202)
+            params = checked_args('update_search_sketches', '0')
+            self.assertEqual(service_mock.bigquery.execute_job.call_count, 2)
+
+            # DAG node completes only when last job is done
+            factory_mock.factor_job.assert_not_called()
+            response = self._test_app.post("/check_dashboard_tables", params)
+            self.assertEqual(response.status_int, 200)
+            self.assertEqual(response.text, "finished")
+            self.assertEqual(scheduler_mock.enqueue_check.call_count, 3)
+            service_mock.bigquery.delete_table.assert_called_once()
+            factory_mock.factor_job.assert_called_once_with('dag')
+
+            # failed job is submitted again instead of checked forever
+            service_mock.bigquery.get_job.return_value['status'] = {
+                'state': 'DONE', 'errorResult': {'reason': 'invalid'}}
+            response = self._test_app.post("/check_dashboard_tables", params)
+            self.assertEqual(response.status_int, 202)
+            self.assertEqual(service_mock.bigquery.execute_job.call_count, 3)
+            checked_args('update_search_sketches', '0')
+            self.assertEqual(factory_mock.factor_job.call_count, 1)
+        service_mock.bigquery.poll_job.assert_not_called()
+
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_rerun(self, service_mock, costs_mock):
+        if not self._remove_config_flag:
+            self.worker.config = self.load_mock_config()
+
+        self._test_app.post("/update_dashboard_tables", {'date': "20171010"})
+        self._test_app.post("/update_dashboard_tables", {'date': "20171010"})
+        self._test_app.post("/update_dashboard_tables", {'date': "20171010",
+            'rerun': "1"})
+        job_ids = [call[0][1]['jobReference']['jobId'] for call in
+            service_mock.bigquery.execute_job.call_args_list]
+        self.assertEqual(job_ids[0], job_ids[1])
+        self.assertEqual(job_ids[2], job_ids[0] + '_1')
+        self.assertTrue(job_ids[0].startswith(
+            'update_dashboard_tables_20171010_'))
+
+    @mock.patch('gae.worker.costs')
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_tables_budget(self, service_mock,
+        costs_mock):
+        config = self.load_mock_config()
+        config['jobs']['update_dashboard_tables']['bytes_budget'] = 100
+        service_mock.bigquery.dry_run.return_value = 101
+
+        with mock.patch.object(self.worker, 'config', config):
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.text, "refused job for date 20171010 "
+            "processes 101 bytes, budget is 100")
+        costs_mock.record_cost.assert_called_once_with(
+            'update_dashboard_tables', '20171010', 101)
+        service_mock.bigquery.execute_job.assert_not_called()
+
+        config['jobs']['update_dashboard_tables']['budget_action'] = (
+            'downgrade')
+        with mock.patch.object(self.worker, 'config', config):
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+        self.assertEqual(response.status_int, 200)
+        body = service_mock.bigquery.execute_job.call_args[0][1]
+        self.assertEqual(body['configuration']['query']['priority'], 'BATCH')
+
+        service_mock.bigquery.dry_run.return_value = 100
+        with mock.patch.object(self.worker, 'config', config):
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010"})
+        body = service_mock.bigquery.execute_job.call_args[0][1]
+        self.assertTrue('priority' not in body['configuration']['query'])
+
+    @mock.patch('gae.worker.gcp_service')
+    def test_sweep_search_tables(self, service_mock):
+        if not self._remove_config_flag:
+            self.worker.config = self.load_mock_config()
+
+        now = datetime.datetime.now()
+        dates = [(now - datetime.timedelta(days=i)).strftime("%Y%m%d")
+                 for i in range(5)]
+        service_mock.bigquery.list_tables.return_value = iter(
+            ['search_{}'.format(date) for date in dates] + ['other_table',
+             'other_{}'.format(dates[-1])])
+
+        response = self._test_app.post("/sweep_dashboard_tables")
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.text, "deleted 3 tables")
+        service_mock.bigquery.list_tables.assert_called_once_with(
+            project_id='dest_project', dataset_id='dest_dataset')
+        service_mock.bigquery.delete_tables.assert_called_once_with(
+            project_id='dest_project', dataset_id='dest_dataset',
+            table_ids=['search_{}'.format(date) for date in dates[2:]])
+
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_terms(self, service_mock):
+        if not self._remove_config_flag:
+            self.worker.config = self.load_mock_config()
+
+        query_job_body = self.utils.dml_query_job_body(
+            **dict(self.worker.config['jobs']['update_search_terms'].items()
+                + [('date', '20171010'), ('job_name', 'update_search_terms')]))
+        service_mock.bigquery.execute_job.return_value = 'job'
+
+        response = self._test_app.post("/update_search_terms", {'date':
+            "20171010"})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.text, "finished")
+        service_mock.bigquery.create_table.assert_called_once_with(
+            project_id='terms_project', dataset_id='terms_dataset',
+            table_id='search_terms', schema=[
+                {'name': 'raw_label', 'type': 'STRING', 'mode': 'REQUIRED'},
+                {'name': 'slug', 'type': 'STRING', 'mode': 'NULLABLE'}])
+        service_mock.bigquery.execute_job.assert_called_once_with(
+            'project123', query_job_body)
+        service_mock.bigquery.poll_job.assert_called_once_with('job')
+
+    @mock.patch('gae.worker.gcp_service')
+    def test_update_search_rollups(self, service_mock):
+        config = self.load_mock_config()
+        setup = config['jobs']['update_search_rollups']
+        config['jobs']['update_dashboard_tables']['total_days'] = 2
+        params = dict(config['jobs']['update_dashboard_tables'].items() +
+            setup.items() + [('date', '20171010'),
+            ('job_name', 'update_search_rollups_1d'),
+            ('source_table', 'search_*'), ('date_column', '_TABLE_SUFFIX'),
+            ('rollup_table', 'rollup_search_1d')])
+        merge_job_body = self.utils.dml_query_job_body(**dict(
+            params.items() + [
+            ('query_path', 'gae/queries/search_rollup_merge.sql'),
+            ('expired_date', '20171009')]))
+        rebuild_job_body = self.utils.search_query_job_body(**dict(
+            params.items() + [('start_date', '20171010'),
+            ('dest_project_id', 'rollup_project'),
+            ('dest_dataset_id', 'rollup_dataset'),
+            ('dest_table_id', 'rollup_search_1d'),
+            ('write_disposition', 'WRITE_TRUNCATE')]))
+        late_job_body = self.utils.search_query_job_body(**dict(
+            params.items() + [('date', '20171011'),
+            ('start_date', '20171011'), ('rerun', 'late20171010'),
+            ('dest_project_id', 'rollup_project'),
+            ('dest_dataset_id', 'rollup_dataset'),
+            ('dest_table_id', 'rollup_search_1d'),
+            ('write_disposition', 'WRITE_TRUNCATE')]))
+        service_mock.bigquery.execute_job.return_value = 'job'
+
+        with mock.patch.object(self.worker, 'config', config), \
+            mock.patch.object(self.worker.rollups, 'plan_update') as plan, \
+            mock.patch.object(self.worker.rollups, 'save_state') as save:
+            plan.side_effect = [('merge', '20171010'),
+                ('rebuild', '20171010'), (None, '20171011'),
+                ('rebuild', '20171011')]
+            responses = [self._test_app.post("/update_search_rollups",
+                {'date': "20171010"}) for _ in range(4)]
+
+        self.assertEqual([r.text for r in responses], ["updated merge 1d",
+            "updated rebuild 1d", "updated nothing", "updated rebuild 1d"])
+        plan.assert_called_with(1, '20171010', False)
+        self.assertEqual(plan.call_count, 4)
+        self.assertEqual(service_mock.bigquery.execute_job.call_args_list,
+            [mock.call('project123', merge_job_body),
+             mock.call('project123', rebuild_job_body),
+             mock.call('project123', late_job_body)])
+        self.assertEqual(save.call_args_list, [mock.call(1, '20171010')] * 2 +
+            [mock.call(1, '20171011')])
+        self.assertTrue(late_job_body['jobReference']['jobId'].endswith(
+            '_late20171010'))
+
+        # partitioned results are filtered on the partitioning column
+        service_mock.bigquery.execute_job.reset_mock()
+        config['jobs']['update_dashboard_tables'].update({
+            'output_mode': 'partitioned', 'dest_partition_table_id': 'search',
+            'partition_field': 'day'})
+        with mock.patch.object(self.worker, 'config', config), \
+            mock.patch.object(self.worker.rollups, 'plan_update') as plan, \
+            mock.patch.object(self.worker.rollups, 'save_state'):
+            plan.return_value = ('merge', '20171010')
+            self._test_app.post("/update_search_rollups", {'date': "20171010"})
+        query = service_mock.bigquery.execute_job.call_args[0][1][
+            'configuration']['query']['query']
+        self.assertIn("FROM `dest_project.dest_dataset.search`", query)
+        self.assertIn("WHERE day IN ('2017-10-10', '2017-10-09')", query)
+        config['jobs']['update_dashboard_tables'] = self.load_mock_config()[
+            'jobs']['update_dashboard_tables']
+        config['jobs']['update_dashboard_tables']['total_days'] = 2
+
+        # requested rebuilds don't attach to the job of an earlier one
+        service_mock.bigquery.execute_job.reset_mock()
+        with mock.patch.object(self.worker, 'config', config), \
+            mock.patch.object(self.worker.rollups, 'plan_update') as plan, \
+            mock.patch.object(self.worker.rollups, 'save_state'), \
+            mock.patch('gae.worker.time') as time_mock:
+            plan.return_value = ('rebuild', '20171010')
+            time_mock.time.return_value = 100.0
+            self._test_app.post("/update_search_rollups", {'date': "20171010",
+                'rebuild': '1', 'rerun': 'x'})
+        plan.assert_called_once_with(1, '20171010', True)
+        job_id = service_mock.bigquery.execute_job.call_args[0][1][
+            'jobReference']['jobId']
+        self.assertTrue(job_id.endswith('_xrebuild100'))
+
+        # day subtracted from rollup of 2 days is deleted when 2 days are kept
+        config['jobs']['update_search_rollups']['windows'] = [2]
+        with mock.patch.object(self.worker, 'config', config), \
+            mock.patch.object(self.worker.rollups, 'plan_update') as plan:
+            response = self._test_app.post("/update_search_rollups",
+                {'date': "20171010"})
+        self.assertEqual(response.text, "updated nothing")
+        plan.assert_not_called()
+
+        query = merge_job_body['configuration']['query']['query']
+        self.assertIn("MERGE `rollup_project.rollup_dataset.rollup_search_1d`",
+            query)
+        self.assertIn("FROM `dest_project.dest_dataset.search_*`", query)
+        self.assertIn("WHERE _TABLE_SUFFIX IN ('20171010', '20171009')",
+            query)
+        query_config = rebuild_job_body['configuration']['query']
+        self.assertIn("WHERE _TABLE_SUFFIX BETWEEN '20171010' AND '20171010'",
+            query_config['query'])
+        self.assertEqual(query_config['destinationTable'], {
+            'projectId': 'rollup_project', 'datasetId': 'rollup_dataset',
+            'tableId': 'rollup_search_1d'})
+
+    @mock.patch('gae.worker.jobs_factory')
+    @mock.patch('gae.worker.gcp_service')
+    def test_complete_dag_node(self, service_mock, factory_mock):
+        if not self._remove_config_flag:
+            self.worker.config = self.load_mock_config()
+
+        self._test_app.post("/update_search_terms", {'date': "20171010"})
+        factory_mock.factor_job.assert_not_called()
+
+        self._test_app.post("/update_search_terms", {'date': "20171010",
+            'dag': 'daily_pipeline', 'node': 'update_search_terms'})
+        factory_mock.factor_job.assert_called_once_with('daily_pipeline')
+        factory_mock.factor_job.return_value.complete.assert_called_once_with(
+            'update_search_terms', {'date': '20171010',
+            'dag': 'daily_pipeline', 'node': 'update_search_terms'})
+
+        # arguments of tasks that check on jobs are not sent downstream
+        factory_mock.reset_mock()
+        self._test_app.post("/update_search_terms", {'date': "20171010",
+            'dag': 'daily_pipeline', 'node': 'update_search_terms',
+            'rerun': '1', 'stage': 'update_dashboard_tables', 'attempt': '2',
+            'job_project_id': 'project123', 'job_id': 'job',
+            'job_location': 'US'})
+        factory_mock.factor_job.return_value.complete.assert_called_once_with(
+            'update_search_terms', {'date': '20171010', 'rerun': '1',
+            'dag': 'daily_pipeline', 'node': 'update_search_terms'})
+
+        factory_mock.reset_mock()
+        service_mock.bigquery.poll_job.side_effect = RuntimeError
+        response = self._test_app.post("/update_search_terms", {'date':
+            "20171010", 'dag': 'daily_pipeline',
+            'node': 'update_search_terms'}, expect_errors=True)
+        self.assertEqual(response.status_int, 500)
+        factory_mock.factor_job.assert_not_called()
+
+        # jobs refused for going over budget don't complete the node
+        config = self.load_mock_config()
+        config['jobs']['update_dashboard_tables']['bytes_budget'] = 100
+        service_mock.bigquery.dry_run.return_value = 101
+        with mock.patch.object(self.worker, 'config', config), \
+            mock.patch('gae.worker.costs'):
+            response = self._test_app.post("/update_dashboard_tables",
+                {'date': "20171010", 'dag': 'daily_pipeline',
+                'node': 'update_dashboard_tables'})
+        self.assertEqual(response.status_int, 200)
+        factory_mock.factor_job.assert_not_called()
+
+    @mock.patch('gae.worker.gcp_service')
+    def test_warmup(self, service_mock):
+        response = self._test_app.get('/_ah/warmup')
+        self.assertEqual(response.status_int, 200)
+        service_mock.warmup.assert_called_once_with()
+
+    @mock.patch('gae.worker.gcp_service')
+    def test_record_job_metrics(self, service_mock):
+        if not self._remove_config_flag:
+            self.worker.config = self.load_mock_config()
+        service_mock.bigquery.poll_job.return_value = {'slot_ms': 10}
+
+        with mock.patch('gae.worker.time') as time_mock:
+            time_mock.time.side_effect = [100.0, 100.5, 101.0]
+            self._test_app.post("/update_search_terms", {'date': "20171010"},
+                headers={'X-AppEngine-TaskETA': '98.0'})
+        self.metrics_mock.record_metric.assert_called_once_with(
+            'update_search_terms', '20171010', {'slot_ms': 10},
+            task_wait_ms=2000, handling_ms=500)
+
+        self._test_app.post("/update_search_terms", {'date': "20171010"})
+        self.assertEqual(self.metrics_mock.record_metric.call_args[1][
+            'task_wait_ms'], None)
+
+    def test_job_metrics(self):
+        metric = mock.Mock()
+        metric.to_json_dict.return_value = {'job_name': 'job',
+            'date': '20171010', 'slot_ms': 10}
+        self.metrics_mock.job_history.return_value = [metric]
+        self.metrics_mock.date_history.return_value = [metric, metric]
+
+        response = self._test_app.get("/metrics", {'job_name': 'job',
+            'limit': '5'})
+        self.assertEqual(json.loads(response.text), [{'job_name': 'job',
+            'date': '20171010', 'slot_ms': 10}])
+        self.metrics_mock.job_history.assert_called_once_with('job', 5)
+
+        response = self._test_app.get("/metrics", {'date': '20171010'})
+        self.assertEqual(len(json.loads(response.text)), 2)
+        self.metrics_mock.date_history.assert_called_once_with('20171010')
+
+        response = self._test_app.get("/metrics", expect_errors=True)
+        self.assertEqual(response.status_int, 400)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import json
+import unittest
+
+
+class TestKPIs(unittest.TestCase):
+    _sessions = 'tests/unit/data/offline/search_sessions.ndjson'
+
+    @staticmethod
+    def _get_target_module():
+        from offline import kpis
+
+
+        return kpis
+
+    @classmethod
+    def load_sessions(cls):
+        with open(cls._sessions) as f:
+            return [json.loads(line) for line in f]
+
+    @staticmethod
+    def build_results(search_data, search_flg=None, net_search_flg=None,
+            search_rvn=None, net_search_rvn=None, u_conversion=None,
+            u_search_conversion=None, net_clicks=None):
+        return {'search_data': [dict(zip(['search', 'freq', 'clicks',
+            'net_revenue', 'bounce'], e)) for e in search_data],
+            'search_flg': search_flg, 'net_search_flg': net_search_flg,
+            'search_rvn': search_rvn, 'net_search_rvn': net_search_rvn,
+            'u_conversion': u_conversion,
+            'u_search_conversion': u_search_conversion,
+            'net_clicks': net_clicks}
+
+    def test_is_search(self):
+        kpis = self._get_target_module()
+        self.assertTrue(kpis.is_search(u'Seãrchí Crazĩ estrìng',
+            '/?q=Searchi%20Crazi%20estring&sort=discount'))
+        self.assertFalse(kpis.is_search(u'Sêãrchí Outra',
+            '/?q=Searchi%20Crazi%20Estring&sort=discount'))
+        self.assertFalse(kpis.is_search('search', None))
+        self.assertFalse(kpis.is_search(None, '/'))
+
+    def test_extract_config_sku(self):
+        kpis = self._get_target_module()
+        self.assertEqual(kpis.extract_config_sku('sku0-000'), 'sku0')
+        self.assertEqual(kpis.extract_config_sku('a-b-c-D1'), 'a-b-c')
+        self.assertEqual(kpis.extract_config_sku('a-b-D1'), 'a-b-D1')
+        self.assertEqual(kpis.extract_config_sku('sku0-abc'), None)
+        self.assertEqual(kpis.extract_config_sku('sku0'), 'sku0')
+
+    def test_search_kpis(self):
+        kpis = self._get_target_module()
+        result = kpis.search_kpis(self.load_sessions())
+        expected = [
+            {'fv': '1', 'date': '20171220', 'user_revenue': 100.0,
+             'results': self.build_results([], u_conversion=1)},
+            {'fv': '2', 'date': '20171220', 'user_revenue': None,
+             'results': self.build_results([
+                 ('search-another-string', 1, 1, None, 1),
+                 ('search-string', 2, 1, None, 1)], search_flg=1)},
+            {'fv': '3', 'date': '20171220', 'user_revenue': 200.0,
+             'results': self.build_results([
+                 ('search-string', 1, 1, 200.0, None)], search_flg=1,
+                 net_search_flg=1, search_rvn=200.0, net_search_rvn=200.0,
+                 u_conversion=1, u_search_conversion=1, net_clicks=1)},
+            {'fv': '4', 'date': '20171220', 'user_revenue': 200.0,
+             'results': self.build_results([
+                 ('search-other-string', 1, 1, 100.0, None),
+                 ('searchi-crazi-estring', 2, 2, 250.0, None)],
+                 search_flg=1, net_search_flg=1, search_rvn=200.0,
+                 net_search_rvn=350.0, u_conversion=1, u_search_conversion=1,
+                 net_clicks=3)},
+            {'fv': '4', 'date': '20171221', 'user_revenue': 100.0,
+             'results': self.build_results([
+                 ('searchi-crazi-estring', 1, 1, None, 1)], search_flg=1,
+                 search_rvn=100.0, u_conversion=1, u_search_conversion=1)}]
+        self.assertEqual(result, expected)
+
+    def test_search_kpis_from_reader(self):
+        kpis = self._get_target_module()
+        from offline import reader
+
+
+        self.assertEqual(kpis.search_kpis(reader.iter_sessions(
+            self._sessions)), kpis.search_kpis(self.load_sessions()))
+
+    def test_search_kpis_filters(self):
+        kpis = self._get_target_module()
+        sessions = self.load_sessions()[:3]
+        sessions[0]['hits'][0]['page']['hostname'] = 'www.store.com'
+        sessions[0]['geoNetwork'] = {'networkLocation': 'Customer Network'}
+        sessions[1]['hits'][1]['page']['hostname'] = 'www.store.com'
+        sessions[1]['geoNetwork'] = {'networkLocation': 'Google LLC'}
+        sessions[2]['geoNetwork'] = {'networkLocation': 'Customer Network'}
+
+        result = kpis.search_kpis(sessions, hostname='store',
+            geonetworklocation='google')
+        self.assertEqual([(e['fv'], e['user_revenue']) for e in result],
+            [('1', 100.0)])
+
+    def test_search_kpis_empty(self):
+        kpis = self._get_target_module()
+        self.assertEqual(kpis.search_kpis([]), [])
+        result = kpis.search_kpis([{'fullVisitorId': '1',
+            'date': '20171220', 'totals': {}, 'hits': []}])
+        self.assertEqual(result, [{'fv': '1', 'date': '20171220',
+            'user_revenue': None, 'results': self.build_results([])}])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+
+class TestReader(unittest.TestCase):
+    _sessions = 'tests/unit/data/offline/search_sessions.ndjson'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def _get_target_module():
+        from offline import reader
+
+
+        return reader
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with (gzip.open if name.endswith('.gz') else open)(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_get_field(self):
+        reader = self._get_target_module()
+        record = {'ecommerceAction': {'action_type': '6'}}
+        self.assertEqual(reader.get_field(record, 'eCommerceAction',
+            'action_type'), '6')
+        self.assertEqual(reader.get_field(record, 'page', 'pagePath'), None)
+
+    def test_iter_lines(self):
+        reader = self._get_target_module()
+        content = b'{"a": 1}\n\n{"a": 2}\r\n  \n{"a": 3}'
+        for name in ['sessions.json', 'sessions.json.gz']:
+            path = self.write_file(name, content)
+            self.assertEqual([e.rstrip(b'\r') for e in reader.iter_lines(
+                path)], [b'{"a": 1}', b'{"a": 2}', b'{"a": 3}'])
+        self.assertEqual(list(reader.iter_lines(self.write_file('empty',
+            b''))), [])
+
+    def test_iter_records_avro(self):
+        reader = self._get_target_module()
+        with mock.patch.object(reader, 'fastavro', None):
+            with self.assertRaises(ImportError):
+                list(reader.iter_records('sessions.avro'))
+
+        path = self.write_file('sessions.avro', b'')
+        fastavro_mock = mock.Mock()
+        fastavro_mock.reader.return_value = iter([{'fullVisitorId': '1'}])
+        with mock.patch.object(reader, 'fastavro', fastavro_mock):
+            self.assertEqual(list(reader.iter_records(path)),
+                [{'fullVisitorId': '1'}])
+
+    def test_iter_sessions(self):
+        reader = self._get_target_module()
+        sessions = list(reader.iter_sessions(self._sessions))
+        self.assertEqual(len(sessions), 7)
+
+        session = sessions[4]
+        self.assertFalse(hasattr(session, '__dict__'))
+        self.assertEqual((session.fv, session.visit_id, session.date,
+            session.revenue, session.network_location), ('4', 1, '20171220',
+            100000000.0, None))
+        self.assertEqual(len(session.hits), 7)
+
+        hit = session.hits[1]
+        self.assertEqual((hit.hn, hit.pp, hit.hostname, hit.category,
+            hit.label, hit.action_type, hit.products), (2, '/', None,
+            'search', u'Sêãrchí CrÃzĩ Éstrìng', '0', []))
+
+        product = session.hits[6].products[0]
+        self.assertEqual((product.sku, product.is_click, product.quantity,
+            product.price), ('sku0-000', False, 1, 100000000.0))
+
+    def test_project_session_casts_strings(self):
+        reader = self._get_target_module()
+        session = reader.project_session({'fullVisitorId': '1',
+            'visitId': '15', 'totals': {'totalTransactionRevenue': '10'},
+            'hits': [{'hitNumber': '2', 'product': [{'productSku': 'sku0',
+            'productQuantity': '3', 'productPrice': '1.5'}]}]})
+        self.assertEqual(session.visit_id, 15)
+        self.assertEqual(session.revenue, 10.0)
+        self.assertEqual(session.hits[0].hn, 2)
+        self.assertEqual(session.hits[0].products[0].quantity, 3)
+        self.assertEqual(session.hits[0].products[0].price, 1.5)
+        self.assertEqual(session.hits[0].products[0].is_click, False)
+
+    def test_iter_chunks(self):
+        reader = self._get_target_module()
+        chunks = list(reader.iter_chunks([self._sessions, self._sessions],
+            chunk_size=5))
+        self.assertEqual([len(e) for e in chunks], [5, 5, 4])
+        self.assertEqual([e.fv for e in chunks[1]], ['4', '4', '1', '2',
+            '2'])
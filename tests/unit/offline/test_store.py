@@ -0,0 +1,120 @@
+#MIT License
+#
+#Copyright (c) 2017 Willian Fuks
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class TestStore(unittest.TestCase):
+    _sessions = 'tests/unit/data/offline/search_sessions.ndjson'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def _get_target_module():
+        from offline import store
+
+
+        return store
+
+    @staticmethod
+    def build_row(date, search_data):
+        return {'date': date, 'user_revenue': None, 'results': {
+            'search_data': [dict(zip(['search', 'freq', 'clicks',
+            'net_revenue', 'bounce'], e)) for e in search_data]}}
+
+    def test_flatten_search_data(self):
+        store = self._get_target_module()
+        rows = [self.build_row('20171010', [('b', 1, 1, 10., None),
+            ('a', 2, 0, None, 1)]),
+            self.build_row('20171010', [('b', '3', '1', '2.5', '1'),
+            (None, 1, 1, 1., 1)]),
+            self.build_row('20171009', [('b', 1, 0, None, None)]),
+            {'date': '20171010', 'user_revenue': 1., 'results': {}}]
+        result = store.flatten_search_data(rows)
+        self.assertEqual(result.to_dict('records'), [
+            {'date': '20171009', 'search': 'b', 'freq': 1, 'clicks': 0,
+             'net_revenue': 0., 'bounce': 0},
+            {'date': '20171010', 'search': 'a', 'freq': 2, 'clicks': 0,
+             'net_revenue': 0., 'bounce': 1},
+            {'date': '20171010', 'search': 'b', 'freq': 4, 'clicks': 2,
+             'net_revenue': 12.5, 'bounce': 1}])
+        self.assertTrue(store.flatten_search_data([]).empty)
+
+    def test_write_lookup(self):
+        store = self._get_target_module()
+        klass = store.ColumnStore(os.path.join(self.tmp_dir, 'store'))
+        self.assertEqual(klass.dates(), [])
+
+        frame = store.flatten_search_data([self.build_row('20171010', [
+            (u'tenis', 3, 1, 5., 1), (u'bolsa', 1, 0, None, None),
+            (u'camisa-polo', 2, 2, 7.5, None)])])
+        klass.write('20171010', frame)
+        self.assertEqual(klass.dates(), ['20171010'])
+
+        day = klass.load('20171010')
+        self.assertEqual(len(day), 3)
+        self.assertTrue(isinstance(day.columns['freq'], np.memmap))
+        self.assertEqual(list(day.columns['search']), [b'bolsa',
+            b'camisa-polo', b'tenis'])
+        self.assertEqual(day.lookup(u'tenis'), {'freq': 3, 'clicks': 1,
+            'net_revenue': 5., 'bounce': 1})
+        self.assertEqual(klass.lookup('20171010', 'camisa-polo')['clicks'],
+            2)
+        for search in ['aaa', 'camisa', 'zzz']:
+            self.assertEqual(day.lookup(search), None)
+
+        klass.write('20171010', frame[frame['search'] == 'bolsa'])
+        self.assertEqual(klass.lookup('20171010', 'tenis'), None)
+        # columns mapped before the rewrite are still readable
+        self.assertEqual(day.lookup(u'tenis')['freq'], 3)
+        self.assertEqual(klass.lookup('20171010', 'bolsa')['freq'], 1)
+        self.assertEqual(os.listdir(klass.root), ['20171010'])
+        with self.assertRaises(IOError):
+            klass.load('20171011')
+
+    def test_load_export(self):
+        from offline import kpis
+        store = self._get_target_module()
+        with open(self._sessions) as f:
+            rows = kpis.search_kpis(json.loads(line) for line in f)
+        path = os.path.join(self.tmp_dir, 'export.json')
+        with open(path, 'w') as f:
+            f.write('\n'.join(json.dumps(row) for row in rows))
+
+        klass = store.ColumnStore(os.path.join(self.tmp_dir, 'store'))
+        expected = store.flatten_search_data(rows)
+        dates = klass.load_export([path])
+        self.assertEqual(dates, sorted(set(expected['date'])))
+        for row in expected.to_dict('records'):
+            self.assertEqual(klass.lookup(row['date'], row['search']),
+                dict((name, row[name]) for name, _ in store.KPI_COLUMNS))